@@ -1,8 +1,20 @@
-
 """
-Module to configure QFQ qdisc.  Also configures flows to classes using
-hash tables for fast classification.  Only supports one field (ip
-dport) as hashkey but you can modify it for ip dst as well.
+Module to configure rate limiters: QFQ and HTB qdiscs, and NIC hardware
+rate limits.  Flows are mapped to classes using u32 hash tables for fast
+classification, so that the filter lookup cost per packet does not grow
+with the number of classes.
+
+A flow filter is a dport, or a tuple (dst ip, sport, dport) where fields
+that are not matched are None.  The hash tables can have several levels,
+each hashing on one byte of the packet (see HASH_KEYS): Eg. ['dst',
+'dport'] hashes on the last byte of the destination IP and then on the
+low byte of the destination port, for up to 256 * 256 buckets.  Tables
+are only created for buckets that have flows.
+
+The commands are collected in cmds without the leading tc, and can be
+written as a batch file for tc -batch.  change_cmds turns a configuration
+into another that only differs in the rates of its classes with tc class
+change, without adding the qdisc again.
 
 Arbitrary classification: not now.
 
@@ -13,84 +25,256 @@ extensive documentation on u32 filters and hash filters.
 import pprint
 from collections import defaultdict
 
+# Byte of the packet hashed by each level of the hash tables, as (offset from
+# the IP header, mask of the 32 bit word at the offset). Offsets past 20
+# assume IP headers without options.
+HASH_KEYS = {
+    'dst' : (16, 0x000000ff),
+    'dport' : (20, 0x000000ff),
+    'dport_hi' : (20, 0x0000ff00),
+    'sport' : (20, 0x00ff0000),
+}
+
+# Largest divisor of a u32 hash table, the largest table handle, and the
+# handle of the root table, which tc creates
+MAX_BUCKETS = 256
+MAX_TABLE = 0xfff
+ROOT_TABLE = 0x800
+
+# Returns the filter as a tuple (dst ip, sport, dport)
+def flow(filter):
+    if isinstance(filter, tuple):
+        return filter
+    return (None, None, int(filter))
+
+def ip2int(ip):
+    ret = 0
+    for part in ip.split('.'):
+        ret = (ret << 8) | int(part)
+    return ret
+
+# Returns the value of the hash key of a flow (the bucket before it is masked
+# by the divisor of the table), or None if the flow does not match that field
+def hash_value(key, filter):
+    (dst, sport, dport) = flow(filter)
+    if key == 'dst':
+        if dst is None:
+            return None
+        return ip2int(dst) & 0xff
+    if key == 'sport':
+        if sport is None:
+            return None
+        return sport & 0xff
+    if dport is None:
+        return None
+    if key == 'dport_hi':
+        return (dport >> 8) & 0xff
+    return dport & 0xff
+
+# Returns the commands that change a qdisc configured with old_cmds into one
+# configured with cmds, by changing the parameters of classes. Returns None if
+# they differ in anything else, as then the qdisc has to be added again.
+# Classes are matched by their position and classid.
+def change_cmds(old_cmds, cmds):
+    if len(old_cmds) != len(cmds):
+        return None
+    ret = []
+    for (old, new) in zip(old_cmds, cmds):
+        if old == new:
+            continue
+        # "class add dev <iface> parent 1: classid 1:<id>" and the parameters
+        if (not new.startswith("class add ") or
+            old.split()[:8] != new.split()[:8]):
+            return None
+        ret.append("class change " + new[len("class add "):])
+    return ret
+
 class QFQ:
     DEFAULT_RATE = 100
-    DEFAULT_CLASSID = 1000
+    DEFAULT_CLASSID = 1
 
-    def __init__(self, iface):
+    # leaf_qdisc is the qdisc added to each class (Eg. "pfifo limit 200"), or
+    # None for the default
+    def __init__(self, iface, mtu=2048, leaf_qdisc=None):
         self.iface = iface
-        self.classid = 1
+        self.mtu = mtu
+        self.leaf_qdisc = leaf_qdisc
+        self.classid = self.default_classid() + 1
         self.filter = {}
         self.cmds = []
+        self.table = 1
 
-    def add_qdisc(self):
-        cmd = "tc qdisc add dev %s root handle 1: qfq" % self.iface
+    def add_qdisc(self, rate=DEFAULT_RATE):
+        cmd = "qdisc add dev %s root handle 1: qfq" % self.iface
         self.cmds.append(cmd)
-        self.add_one_class(self.default_classid(), None, QFQ.DEFAULT_RATE)
+        self.add_one_class(self.default_classid(), None, rate)
 
     def default_classid(self):
         return QFQ.DEFAULT_CLASSID
 
+    # Returns the tc class parameters for a rate in Mbps. The weight of QFQ
+    # classes is the rate.
+    def class_params(self, rate):
+        return "qfq weight %s maxpkt %s" % (int(rate), self.mtu)
+
     def add_one_class(self, classid, filter, rate):
-        cmd = "tc class add dev %s parent 1: classid 1:%d qfq weight %s maxpkt 2048"
-        cmd = cmd % (self.iface, classid, rate)
+        cmd = "class add dev %s parent 1: classid 1:%x %s"
+        cmd = cmd % (self.iface, classid, self.class_params(rate))
+        self.cmds.append(cmd)
+        if self.leaf_qdisc is not None:
+            cmd = "qdisc add dev %s parent 1:%x %s"
+            self.cmds.append(cmd % (self.iface, classid, self.leaf_qdisc))
         if filter is not None:
             self.filter[filter] = classid
-        self.cmds.append(cmd)
         return
 
     def add_class(self, filter, rate):
         self.add_one_class(self.classid, filter, rate)
         self.classid += 1
 
-    def add_linear_filters(self, parent="1:", filter_dict={}, hashentry=""):
-        for filter, classid in filter_dict.iteritems():
-            cmd = "tc filter add dev %s protocol all parent %s prio 1 u32 %s match " % (self.iface, parent, hashentry)
-            cmd += "ip dport %s 0xffff flowid 1:%d" % (filter, classid)
+    # Returns the u32 match of a filter
+    def match(self, filter):
+        (dst, sport, dport) = flow(filter)
+        ret = ""
+        if dst is not None:
+            ret += "match ip dst %s " % dst
+        if sport is not None:
+            ret += "match ip sport %s 0xffff " % sport
+        if dport is not None:
+            ret += "match ip dport %s 0xffff " % dport
+        return ret.strip()
+
+    def add_linear_filters(self, parent="1:", filter_dict=None, hashentry=""):
+        if filter_dict is None:
+            filter_dict = self.filter
+        for filter, classid in sorted(filter_dict.iteritems()):
+            cmd = "filter add dev %s protocol all parent %s prio 1 u32 %s " % (self.iface, parent, hashentry)
+            cmd += "%s flowid 1:%x" % (self.match(filter), classid)
             self.cmds.append(cmd)
         return
 
     def add_default_filter(self, parent="1:", hashentry=""):
-        cmd = "tc filter add dev %s parent %s protocol all prio 2 u32 %s match u32 0 0 at 0 flowid 1:%s"
+        cmd = "filter add dev %s parent %s protocol all prio 2 u32 %s match u32 0 0 at 0 flowid 1:%x"
         cmd = cmd % (self.iface, parent, hashentry, self.default_classid())
         self.cmds.append(cmd)
 
-    def add_hash_filters(self, buckets=256, hashfn=None):
-        assert buckets <= 256 and ((buckets & (buckets - 1)) == 0)
+    # Returns the handle of a new u32 hash table with the divisor
+    def add_table(self, buckets):
+        self.table += 1
+        if self.table == ROOT_TABLE:
+            self.table += 1
+        if self.table > MAX_TABLE:
+            raise ValueError("too many u32 hash tables")
+        cmd = "filter add dev %s parent 1: prio 1 handle %x: protocol all u32 divisor %s"
+        self.cmds.append(cmd % (self.iface, self.table, buckets))
+        return self.table
+
+    # Adds a filter in a bucket (or in the root table 800: if bucket is None)
+    # that hashes the packet on key into the table
+    def add_link(self, parent, bucket, key, table):
+        (offset, mask) = HASH_KEYS[key]
+        hashentry = "ht 800::"
+        if parent is not None:
+            hashentry = "ht %x:%x:" % (parent, bucket)
+        cmd = "filter add dev %s protocol all parent 1: prio 1 u32 %s " % (self.iface, hashentry)
+        cmd += "match u32 0 0 hashkey mask 0x%08x at %s link %x:" % (mask, offset, table)
+        self.cmds.append(cmd)
+
+    # Adds hash tables that hash the flows on each of keys in turn, with the
+    # filters of the flows in the buckets of the last level. buckets is the
+    # divisor of every table; the buckets of a key are the masked byte modulo
+    # buckets.
+    def add_hash_filters(self, buckets=256, hashfn=None, keys=['dport']):
+        assert buckets <= MAX_BUCKETS and ((buckets & (buckets - 1)) == 0)
         if hashfn is None:
             hashfn = lambda x: x % buckets
-        CHAINID = "2:"
+        for key in keys:
+            if key not in HASH_KEYS:
+                raise ValueError("unknown hash key %s" % key)
+            for filter in self.filter:
+                if hash_value(key, filter) is None:
+                    raise ValueError("filter %s does not match %s" %
+                                     (filter, key))
         # First create the filter root
-        cmd = "tc filter add dev %s parent 1: prio 1 protocol all u32" % self.iface
-        self.cmds.append(cmd)
-
-        cmd = "tc filter add dev %s parent 1: prio 1 handle %s protocol all u32 divisor %s" % (self.iface, CHAINID, buckets)
+        cmd = "filter add dev %s parent 1: prio 1 protocol all u32" % self.iface
         self.cmds.append(cmd)
 
-        # Add rules to the created table using a hash of the filter
-        filter_chains = defaultdict(list)
-        for filter, classid in self.filter.iteritems():
-            filter = int(filter)
-            hsh = hashfn(filter)
-            filter_chains[hsh].append(filter)
-
-        for hsh in filter_chains.keys():
-            lineardict = {}
-            for filter in filter_chains[hsh]:
-                lineardict[filter] = self.filter[filter]
-            hentry = hex(hsh).replace("0x", '')
-            hashentry = "ht 2:%s:" % hentry
-            self.add_linear_filters(parent="1:", filter_dict=lineardict, hashentry=hashentry)
+        top = self.add_table(buckets)
+        self.add_hash_level(top, keys, self.filter, buckets, hashfn)
 
         # Add the root filter
-        cmd = "tc filter add dev %s protocol all parent 1: prio 1 u32 ht 800:: " % self.iface
-        cmd += " match ip protocol 6 0xff "
-        cmd += " hashkey mask 000000ff at %s " % (20) # IP header 20 bytes, dest port +2 bytes from TCP header
-        cmd += " link %s " % (CHAINID)
-
-        self.cmds.append(cmd)
+        self.add_link(None, None, keys[0], top)
         return
 
+    # Adds the buckets of a table that hashes filter_dict on keys[0]
+    def add_hash_level(self, table, keys, filter_dict, buckets, hashfn):
+        filter_chains = defaultdict(dict)
+        for filter, classid in filter_dict.iteritems():
+            hsh = hashfn(hash_value(keys[0], filter))
+            filter_chains[hsh][filter] = classid
+
+        for hsh in sorted(filter_chains.keys()):
+            if len(keys) > 1:
+                child = self.add_table(buckets)
+                self.add_hash_level(child, keys[1:], filter_chains[hsh],
+                                    buckets, hashfn)
+                self.add_link(table, hsh, keys[1], child)
+            else:
+                hashentry = "ht %x:%x:" % (table, hsh)
+                self.add_linear_filters(parent="1:",
+                                        filter_dict=filter_chains[hsh],
+                                        hashentry=hashentry)
+
+    def get_cmds(self, tc="tc"):
+        return [ "%s %s" % (tc, cmd) for cmd in self.cmds ]
+
+    # Returns the commands as a batch file for tc -batch
+    def get_batch(self):
+        return ''.join(cmd + '\n' for cmd in self.cmds)
+
+    def write_batch(self, filename):
+        f = open(filename, 'w')
+        try:
+            f.write(self.get_batch())
+        finally:
+            f.close()
+
+class HTB(QFQ):
+    # The rate of the default class and classes without a ceil are in Mbps
+    def __init__(self, iface, mtu=1500, leaf_qdisc=None, burst="15k"):
+        QFQ.__init__(self, iface, mtu, leaf_qdisc)
+        self.burst = burst
+
+    def add_qdisc(self, rate=QFQ.DEFAULT_RATE):
+        cmd = "qdisc add dev %s root handle 1: htb default %x"
+        self.cmds.append(cmd % (self.iface, self.default_classid()))
+        self.add_one_class(self.default_classid(), None, rate)
+
+    def class_params(self, rate):
+        return ("htb rate %.3fMbit ceil %.3fMbit mtu %s burst %s" %
+                (rate, rate, self.mtu, self.burst))
+
+class HWRL:
+    # Rate limits of the transmit queues of the NIC (Intel), in Mbps. These
+    # are not tc commands, so cmds are shell commands.
+    def __init__(self, iface):
+        self.iface = iface
+        self.cmds = []
+
+    def add_queue_rate(self, queue, rate):
+        cmd = "echo %d | sudo tee /sys/class/net/%s/queues/tx-%d/tx_rate_limit > /dev/null"
+        self.cmds.append(cmd % (rate, self.iface, queue))
+
+    # Splits the rate over the first num_queues queues. The first queues
+    # account for the remainder.
+    def add_rates(self, rate, num_queues):
+        for q in xrange(num_queues):
+            delta = 1 if (q < rate % num_queues) else 0
+            self.add_queue_rate(q, rate / num_queues + delta)
+
+    def get_cmds(self):
+        return self.cmds
+
 if __name__ == "__main__":
     q = QFQ("eth2")
     q.add_qdisc()
@@ -100,4 +284,4 @@ if __name__ == "__main__":
     q.add_hash_filters()
     q.add_default_filter()
 
-    print '\n'.join(q.cmds)
+    print '\n'.join(q.get_cmds())
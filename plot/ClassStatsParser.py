@@ -0,0 +1,138 @@
+import numpy
+import struct
+from TcClassParser import classidKey
+
+
+# Columns of a class-stats.txt line after the class id
+COLUMNS = ['rate', 'drops', 'backlog']
+
+# Binary logs of class-rate.py -b (class-stats.bin) start with MAGIC, followed
+# by a record per interval: a header (timestamp, number of classes n), n
+# classid handles, and n values of each of COLUMNS. This must match the record
+# format in utils/class-rate.py.
+MAGIC = 'CLSRATE1'
+RECORD_HEADER = struct.Struct('<dI')
+CLASSID_DTYPE = numpy.dtype('<u4')
+COLUMN_DTYPE = numpy.dtype('<f8')
+
+# Number of intervals ignored at the start and end of the log
+SKIP_SAMPLES = 15
+
+
+# Class for parsing the per-class time series printed by utils/class-rate.py
+# (class-stats.txt, or class-stats.bin with binary records)
+#
+# Every interval, class-rate.py prints a line per class with the class id, the
+# rate in Mbps and, in newer logs, the packets dropped during the interval and
+# the backlog in bytes at the end of the interval, Eg.
+#   1:1000: 4998.712 0 3028
+# A new interval starts when a class id repeats. The time series of each column
+# are returned as arrays of shape (classes, intervals), with the classes in the
+# order of get_classids(). Columns missing from the log are not returned.
+# Binary logs also record the timestamp of every interval.
+class ClassStatsParser:
+
+    def __init__(self, filename):
+        self.f = filename
+        self.classids = []
+        self.series = {}
+        self.timestamps = None
+        fd = open(filename, 'rb')
+        try:
+            if fd.read(len(MAGIC)) == MAGIC:
+                self.parse_binary(fd.read())
+            else:
+                fd.seek(0)
+                self.parse(fd)
+        finally:
+            fd.close()
+
+    def parse(self, lines):
+        intervals = []
+        current = {}
+        num_columns = len(COLUMNS)
+        for line in lines:
+            if ':' not in line:
+                continue
+            (classid, values) = line.rsplit(':', 1)
+            classid = classid.strip()
+            values = values.split()
+            if not values:
+                continue
+            if classid in current:
+                intervals.append(current)
+                current = {}
+            current[classid] = values
+            num_columns = min(num_columns, len(values))
+        if current:
+            intervals.append(current)
+
+        self.classids = sorted(set(classid for interval in intervals
+                                   for classid in interval),
+                               key=classidKey)
+        index = dict((classid, i) for (i, classid) in
+                     enumerate(self.classids))
+        for (col, column) in enumerate(COLUMNS[:num_columns]):
+            data = numpy.zeros((len(self.classids), len(intervals)))
+            for (t, interval) in enumerate(intervals):
+                for (classid, values) in interval.iteritems():
+                    data[index[classid], t] = float(values[col])
+            self.series[column] = data
+
+    # Parses the records of a binary log. A truncated last record (Eg. when
+    # class-rate.py is killed) is ignored.
+    def parse_binary(self, data):
+        timestamps = []
+        intervals = []
+        off = 0
+        while off + RECORD_HEADER.size <= len(data):
+            (timestamp, n) = RECORD_HEADER.unpack_from(data, off)
+            off += RECORD_HEADER.size
+            size = n * (CLASSID_DTYPE.itemsize +
+                        len(COLUMNS) * COLUMN_DTYPE.itemsize)
+            if off + size > len(data):
+                break
+            handles = numpy.frombuffer(data, dtype=CLASSID_DTYPE, count=n,
+                                       offset=off)
+            values = numpy.frombuffer(data, dtype=COLUMN_DTYPE,
+                                      count=n * len(COLUMNS),
+                                      offset=off + n * CLASSID_DTYPE.itemsize)
+            intervals.append((handles, values.reshape(len(COLUMNS), n)))
+            timestamps.append(timestamp)
+            off += size
+
+        all_handles = numpy.unique(numpy.concatenate(
+            [ handles for (handles, _) in intervals ] or
+            [ numpy.zeros(0, dtype=CLASSID_DTYPE) ]))
+        self.classids = [ '%x:%x' % (handle >> 16, handle & 0xffff)
+                          for handle in all_handles ]
+        self.timestamps = numpy.array(timestamps)
+        for (col, column) in enumerate(COLUMNS):
+            data = numpy.zeros((len(all_handles), len(intervals)))
+            for (t, (handles, values)) in enumerate(intervals):
+                index = numpy.searchsorted(all_handles, handles)
+                data[index, t] = values[col]
+            self.series[column] = data
+
+    def get_classids(self):
+        return self.classids
+
+    # Returns the timestamp of every interval, or None for text logs
+    def get_timestamps(self):
+        return self.timestamps
+
+    def has_column(self, column):
+        return column in self.series
+
+    def get_series(self, column='rate'):
+        return self.series[column]
+
+    # Returns the mean rate (Mbps) of every class, ignoring the first and last
+    # few intervals if the log is long enough
+    def get_avg_rates(self):
+        rates = self.series.get('rate', numpy.zeros((0, 0)))
+        if rates.shape[1] > 2 * SKIP_SAMPLES:
+            rates = rates[:, SKIP_SAMPLES:-SKIP_SAMPLES]
+        if rates.shape[1] == 0:
+            return numpy.zeros(len(self.classids))
+        return rates.mean(axis=1)
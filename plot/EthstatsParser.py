@@ -1,42 +1,92 @@
-import re
+import array
+import numpy
 from helper import *
-from collections import defaultdict
+from StreamingParser import re_spaces
 
 
 IFACE = "eth1"
-ZERO = "0.00"
+
+# Metrics recorded for each interface and their fields in an ethstats line:
+#   eth1:  50.37 Mb/s In  1755.77 Mb/s Out -  3039.6 p/s In  81836.4 p/s Out
+METRICS = ['in', 'out', 'pkts_in', 'pkts_out']
+METRIC_FIELDS = [0, 3, 7, 10]
+
+# Number of non-zero samples ignored at the start of each time series
+SKIP_HEAD = 15
 
 
 # Class for parsing ethstats output
 #
-# Gives the mean and stdev of network utilization
+# The log is read once and a time series of every metric (Mb/s in and out,
+# packets/s in and out) is recorded for every interface in the log.
+#
+# The summary of a metric is the mean and stdev of its samples, ignoring zero
+# samples (idle interface) and the first few seconds of output. summary() gives
+# the summary of the network utilization (Mb/s out) of the interface iface.
 class EthstatsParser:
 
     def __init__(self, filename, iface=IFACE):
         self.f = filename
         self.iface = iface
-        self.lines = open(filename).readlines()
-        self.parse()
+        # Time series of each metric keyed by interface
+        self.series = {}
+        fd = open(filename)
+        try:
+            self.parse(fd)
+        finally:
+            fd.close()
 
+    # Returns the interface and the metrics of the line, or None if the line
+    # is not an interface line with all the metric fields (Eg. a truncated
+    # last line)
     def parse_line(self, line):
-        re_spaces = re.compile(r'\s+')
-        iface, rest = line.split(":")
+        if ":" not in line:
+            return None
+        iface, rest = line.split(":", 1)
         iface = iface.strip()
         data = re_spaces.split(rest.strip())
-        return {"iface": iface, "in":data[0], "out":data[3]}
+        if len(data) < max(METRIC_FIELDS) + 1:
+            return None
+        try:
+            return iface, [ float(data[i]) for i in METRIC_FIELDS ]
+        except ValueError:
+            return None
+
+    def parse(self, lines):
+        for line in lines:
+            parsed = self.parse_line(line)
+            if parsed is None:
+                continue
+            (iface, values) = parsed
+            if iface not in self.series:
+                self.series[iface] = [ array.array('d') for m in METRICS ]
+            for (series, value) in zip(self.series[iface], values):
+                series.append(value)
 
-    def parse(self):
-        ret = dict()
+    def get_ifaces(self):
+        return sorted(self.series.keys())
+
+    # Returns the time series of a metric of an interface as an array
+    def get_series(self, iface, metric='out'):
+        if iface not in self.series:
+            return numpy.zeros(0)
+        return numpy.array(self.series[iface][METRICS.index(metric)])
+
+    def iface_summary(self, iface, metric='out'):
         util = []
-        for line in self.lines:
-            d = self.parse_line(line)
-            if d["iface"] == self.iface and d["out"] != ZERO:
-                util.append(float(d["out"]))
-        L = len(util)
-        # NOTE: Ignore first few seconds of output
-        util = util[15:]
-        self.util = util
-        return util
+        if iface in self.series:
+            series = self.series[iface][METRICS.index(metric)]
+            util = [ value for value in series if value != 0 ][SKIP_HEAD:]
+        return dict(mean=mean(util), stdev=stdev(util))
+
+    # Returns the summaries of all metrics of all interfaces, keyed by
+    # interface and metric
+    def summaries(self):
+        ret = {}
+        for iface in self.series:
+            ret[iface] = dict((metric, self.iface_summary(iface, metric))
+                              for metric in METRICS)
+        return ret
 
     def summary(self):
-        return dict(mean=mean(self.util), stdev=stdev(self.util))
+        return self.iface_summary(self.iface, 'out')
@@ -0,0 +1,255 @@
+import cPickle
+import json
+import numpy
+import os
+import zipfile
+from collections import defaultdict
+from cStringIO import StringIO
+
+
+STORE_FILE = 'expt_store.npz'
+SUMMARY_MEMBER = 'summary.json'
+
+
+# Store with all the pickled data of an experiment
+#
+# The store is a single .npz file (pickled/expt_store.npz) with a named NumPy
+# array for every large dataset (Eg. the sorted inter-packet times of each
+# class), plus a small JSON member (summary.json) with the scalar summaries
+# of every category. Opening a store only reads the JSON member, so the
+# summaries of many experiments can be compared without loading any arrays.
+# Arrays are loaded individually on demand.
+#
+# Arrays are named '<category>/<name>' and can also be read with numpy.load().
+#
+# If summaries is given (Eg. from the summary index), the store file is not
+# opened until an array is read.
+class ExptStore:
+
+    def __init__(self, directory, summaries=None):
+        self.filename = os.path.join(directory, 'pickled', STORE_FILE)
+        self.summaries = {}
+        self.mtime = None
+        self.indexed = summaries is not None
+        if self.indexed:
+            self.summaries = summaries
+        elif os.path.exists(self.filename):
+            self.mtime = os.path.getmtime(self.filename)
+            zf = zipfile.ZipFile(self.filename, 'r')
+            summaries = json.loads(zf.read(SUMMARY_MEMBER))
+            self.summaries = decodeStrings(summaries)
+            zf.close()
+
+    def has_category(self, category):
+        return category in self.summaries
+
+    def get_summary(self, category):
+        return self.summaries[category]
+
+    def get_array(self, name):
+        zf = zipfile.ZipFile(self.filename, 'r')
+        data = zf.read(name + '.npy')
+        zf.close()
+        return numpy.lib.format.read_array(StringIO(data))
+
+    # Returns a dict with all arrays named '<prefix>/<key>', keyed by key
+    def get_arrays(self, prefix):
+        ret = {}
+        if not os.path.exists(self.filename):
+            return ret
+        zf = zipfile.ZipFile(self.filename, 'r')
+        for name in zf.namelist():
+            if name.startswith(prefix + '/') and name.endswith('.npy'):
+                data = zf.read(name)
+                ret[name[len(prefix) + 1:-len('.npy')]] = (
+                        numpy.lib.format.read_array(StringIO(data)))
+        zf.close()
+        return ret
+
+
+# Collects the data of the pickled categories of an experiment and writes them
+# to the store with commit(). The data of categories that are not put() is
+# carried over from the existing store, so the store file is rewritten only
+# once per run even if several categories are updated.
+class ExptStoreWriter:
+
+    def __init__(self, pickle_dir):
+        self.filename = os.path.join(pickle_dir, STORE_FILE)
+        self.categories = {}
+
+    # summary must be JSON serializable (NumPy scalars are converted). arrays
+    # is a dict of NumPy arrays which are stored as '<category>/<name>'.
+    def put(self, category, summary, arrays={}):
+        self.categories[category] = (summary, arrays)
+
+    def commit(self):
+        if not self.categories:
+            return
+
+        # Write to a temp file first, so that readers never see a partially
+        # written store
+        tmp_filename = self.filename + '.tmp'
+        out = zipfile.ZipFile(tmp_filename, 'w', zipfile.ZIP_STORED,
+                              allowZip64=True)
+        summaries = {}
+
+        # Copy the members of the categories that were not updated
+        if os.path.exists(self.filename):
+            zf = zipfile.ZipFile(self.filename, 'r')
+            summaries = json.loads(zf.read(SUMMARY_MEMBER))
+            for name in zf.namelist():
+                category = name.split('/')[0]
+                if name != SUMMARY_MEMBER and category not in self.categories:
+                    out.writestr(zf.getinfo(name), zf.read(name))
+            zf.close()
+
+        for (category, (summary, arrays)) in self.categories.iteritems():
+            summaries[category] = summary
+            for (name, arr) in arrays.iteritems():
+                buf = StringIO()
+                numpy.lib.format.write_array(buf, numpy.asarray(arr))
+                out.writestr('%s/%s.npy' % (category, name), buf.getvalue())
+
+        out.writestr(SUMMARY_MEMBER, json.dumps(summaries, sort_keys=True,
+                                                default=jsonDefault))
+        out.close()
+        os.rename(tmp_filename, self.filename)
+        self.categories = {}
+
+
+def jsonDefault(obj):
+    if isinstance(obj, numpy.generic):
+        return obj.item()
+    raise TypeError('%r is not JSON serializable' % obj)
+
+
+# The json module decodes all strings as unicode
+def decodeStrings(obj):
+    if isinstance(obj, unicode):
+        return obj.encode('utf-8')
+    elif isinstance(obj, list):
+        return map(decodeStrings, obj)
+    elif isinstance(obj, dict):
+        return dict((decodeStrings(k), decodeStrings(v))
+                    for (k, v) in obj.iteritems())
+    return obj
+
+
+# Converts a dict of lists keyed by port number to arrays for the store
+def portArrays(data):
+    return dict((str(port), numpy.asarray(values, dtype=numpy.int64))
+                for (port, values) in data.iteritems())
+
+
+# Converts a dict of tuples keyed by port number to a JSON object
+def portSummary(summary):
+    return dict((str(port), list(values))
+                for (port, values) in summary.iteritems())
+
+
+# Functions that rebuild the objects of each of the legacy pickled files from
+# the store. They are keyed by the name of the pickled file.
+def readPortArrays(store, prefix):
+    ret = defaultdict(list)
+    for (port, arr) in store.get_arrays(prefix).iteritems():
+        ret[int(port)] = arr.tolist()
+    return ret
+
+
+def readPortSummary(store, category, name):
+    summary = store.get_summary(category)[name]
+    return dict((int(port), tuple(values))
+                for (port, values) in summary.iteritems())
+
+
+def readPktLenFreq(store):
+    summary = store.get_summary('sniffer')
+    pkt_len = store.get_array('sniffer/pkt_len').tolist()
+    freq = store.get_array('sniffer/pkt_len_freq').tolist()
+    return (summary['most_freq_pkt_len'], dict(zip(pkt_len, freq)))
+
+
+def readMcperfHist(store):
+    lat = store.get_array('mcperf/hist_lat').tolist()
+    count = store.get_array('mcperf/hist_count').tolist()
+    return dict(zip(lat, count))
+
+
+def readEthstatsSummary(store):
+    summary = store.get_summary('ethstats')
+    return dict(mean=summary['mean'], stdev=summary['stdev'])
+
+
+store_readers = {
+    'burstlen_pkt.txt' :
+        ('sniffer', lambda s: readPortArrays(s, 'sniffer/burstlen_pkt')),
+    'burstlen_pkt_summary.txt' :
+        ('sniffer', lambda s: readPortSummary(s, 'sniffer',
+                                              'burstlen_pkt_summary')),
+    'burstlen_nsec.txt' :
+        ('sniffer', lambda s: readPortArrays(s, 'sniffer/burstlen_nsec')),
+    'burstlen_nsec_summary.txt' :
+        ('sniffer', lambda s: readPortSummary(s, 'sniffer',
+                                              'burstlen_nsec_summary')),
+    'ipt.txt' :
+        ('sniffer', lambda s: readPortArrays(s, 'sniffer/ipt')),
+    'ipt_summary.txt' :
+        ('sniffer', lambda s: readPortSummary(s, 'sniffer', 'ipt_summary')),
+    'pkt_len_freq.txt' :
+        ('sniffer', readPktLenFreq),
+    'mpstat_p.txt' :
+        ('mpstat', lambda s: tuple(s.get_summary('mpstat'))),
+    'mpstat_cpu_p.txt' :
+        ('mpstat_cpu', lambda s: (s.get_array('mpstat_cpu/usage'),
+                                  s.get_summary('mpstat_cpu'))),
+    'net_p.txt' :
+        ('ethstats', readEthstatsSummary),
+    'net_ifaces_p.txt' :
+        ('ethstats', lambda s: s.get_summary('ethstats')['ifaces']),
+    'mpstat_mc_p.txt' :
+        ('mpstat_mc', lambda s: tuple(s.get_summary('mpstat_mc'))),
+    'trafgen_p.txt' :
+        ('trafgen', lambda s: tuple(s.get_summary('trafgen'))),
+    'mcperf_p.txt' :
+        ('mcperf', readMcperfHist),
+    'mcperf_summary_p.txt' :
+        ('mcperf', lambda s: s.get_summary('mcperf')['summary']),
+    'perf_p.txt' :
+        ('perf', lambda s: s.get_summary('perf')),
+    'tc_class_p.txt' :
+        ('tc_class', lambda s: s.get_summary('tc_class')),
+    'hosts_p.txt' :
+        ('mcperf', lambda s: tuple(s.get_summary('mcperf')['hosts'])),
+}
+
+
+# Cache of opened stores, keyed by the experiment directory. Only the summaries
+# are kept in memory. Stores preloaded from the summary index are used as is.
+open_stores = {}
+
+
+def openExptStore(directory):
+    store = open_stores.get(directory)
+    if store is not None and store.indexed:
+        return store
+    if (store is not None and store.mtime is not None and
+        os.path.exists(store.filename) and
+        os.path.getmtime(store.filename) == store.mtime):
+        return store
+    store = ExptStore(directory)
+    open_stores[directory] = store
+    return store
+
+
+# Reads the data of a legacy pickled file (Eg. 'ipt_summary.txt') of an
+# experiment. The data is read from the experiment store, or from the pickled
+# file itself for experiments that were pickled before the store existed.
+def readExptData(directory, name):
+    (category, reader) = store_readers[name]
+    store = openExptStore(directory)
+    if store.has_category(category):
+        return reader(store)
+    fd = open(os.path.join(directory, 'pickled', name), 'rb')
+    data = cPickle.load(fd)
+    fd.close()
+    return data
@@ -0,0 +1,94 @@
+import numpy
+
+
+# Histogram of latency samples
+#
+# values = Sorted array of the distinct sample values
+# counts = Number of samples for each value
+#
+# Histograms are merged with array operations, and any number of percentiles
+# is looked up with a single search over the cumulative counts. The histogram
+# is serialized as its two arrays (see to_arrays()), which is how it is saved
+# in the experiment store.
+class LatencyHistogram:
+
+    # values and counts must be of the same length and values must be sorted
+    # and unique. Use histFromDict() or mergeHistograms() otherwise.
+    def __init__(self, values=[], counts=[]):
+        self.values = numpy.asarray(values)
+        self.counts = numpy.asarray(counts, dtype=numpy.int64)
+        self.cum_counts = numpy.cumsum(self.counts)
+
+    def __len__(self):
+        return len(self.values)
+
+    def to_dict(self):
+        return dict(zip(self.values.tolist(), self.counts.tolist()))
+
+    def to_arrays(self):
+        return (self.values, self.counts)
+
+    def num_samples(self):
+        return int(self.cum_counts[-1])
+
+    def merge(self, other):
+        return mergeHistograms([self, other])
+
+    def mean(self):
+        # Sum the products in order with Python floats, so that the result is
+        # exactly the same as summing the samples one bucket at a time
+        products = (self.values.astype(numpy.float64) *
+                    self.counts.astype(numpy.float64))
+        return sum(products.tolist()) / self.num_samples()
+
+    # Returns the values at the given percentiles. The value at percentile pct
+    # is the smallest value with more than (num_samples * pct / 100) samples at
+    # or below it. For integer percentiles the threshold is computed with
+    # integer division.
+    def percentiles(self, pcts):
+        num_samples = self.num_samples()
+        thresholds = []
+        for pct in pcts:
+            if isinstance(pct, (int, long)):
+                thresholds.append(num_samples * pct // 100)
+            else:
+                thresholds.append(int(num_samples * pct / 100))
+        idx = numpy.searchsorted(self.cum_counts, thresholds, side='right')
+        return self.values[idx].tolist()
+
+    def percentile(self, pct):
+        return self.percentiles([pct])[0]
+
+    # Returns the CDF as a tuple of arrays (values, fraction of samples at or
+    # below each value)
+    def cdf(self):
+        return (self.values,
+                self.cum_counts.astype(numpy.float64) / self.num_samples())
+
+
+# Returns a histogram from a dict that maps each sample value to its frequency
+def histFromDict(hist):
+    values = sorted(hist.keys())
+    counts = [ hist[v] for v in values ]
+    return LatencyHistogram(values, counts)
+
+
+# Returns a histogram with the samples of all the given histograms
+def mergeHistograms(hists):
+    hists = [ h for h in hists if len(h) > 0 ]
+    if not hists:
+        return LatencyHistogram()
+    if len(hists) == 1:
+        return LatencyHistogram(hists[0].values, hists[0].counts)
+
+    # Stable sort of the concatenated sorted runs, then add up the counts of
+    # equal values
+    values = numpy.concatenate([ h.values for h in hists ])
+    counts = numpy.concatenate([ h.counts for h in hists ])
+    order = numpy.argsort(values, kind='mergesort')
+    values = values[order]
+    counts = counts[order]
+    starts = numpy.concatenate(([0], numpy.flatnonzero(values[1:] !=
+                                                       values[:-1]) + 1))
+    return LatencyHistogram(values[starts],
+                            numpy.add.reduceat(counts, starts))
@@ -0,0 +1,130 @@
+import numpy
+
+
+# Metrics recorded for each CPU, and the column names that mpstat uses for them
+# (older versions of mpstat use %user and %system)
+METRICS = ['usr', 'sys', 'soft', 'irq', 'idle']
+METRIC_COLUMNS = [('%usr', '%user'), ('%sys', '%system'), ('%soft',),
+                  ('%irq',), ('%idle',)]
+
+# Number of samples ignored at the start and end of the log
+SKIP_SAMPLES = 15
+
+
+# Class for parsing the per-CPU output of mpstat -A (mpstat-all.txt)
+#
+# mpstat -A prints several sections for every interval: CPU utilization,
+# interrupts, interrupts per IRQ and soft IRQs (and per NUMA node on newer
+# versions). Each section starts with a header line naming its columns, which
+# has no numeric fields. Only the rows of the CPU utilization sections are
+# used, and the columns are located from the headers, so both 12 and 24 hour
+# timestamps are handled. 'all' and 'Average:' rows are skipped.
+#
+# The utilization of every CPU is returned as an array of shape
+# (CPUs, samples, len(METRICS)). The summary of a CPU is the mean of each
+# metric, ignoring the first and last few seconds of data like MPStatParser.
+class MPStatCPUParser:
+
+    def __init__(self, filename):
+        self.f = filename
+        cpus = []
+        rows = []
+        fd = open(filename)
+        try:
+            self.parse(fd, cpus, rows)
+        finally:
+            fd.close()
+        self.usage = self.build_usage(cpus, rows)
+
+    # Appends the CPU number and the metric columns of every CPU utilization
+    # row to cpus and rows
+    def parse(self, lines, cpus, rows):
+        cpu_col = None
+        metric_cols = None
+        num_cols = None
+        for line in lines:
+            data = line.split()
+            if len(data) < 2 or data[0] == 'Average:':
+                continue
+            if self.is_header(data):
+                # Section header. The rows of sections other than CPU
+                # utilization (Eg. NODE) are skipped until the next header.
+                metric_cols = None
+                if 'CPU' in data:
+                    cpu_col = data.index('CPU')
+                    num_cols = len(data)
+                    metric_cols = self.find_metric_columns(data)
+                continue
+            # Skip rows of other sections, 'all' rows and truncated rows (Eg.
+            # the last line when mpstat is killed)
+            if (metric_cols is None or len(data) != num_cols or
+                not data[cpu_col].isdigit()):
+                continue
+            cpus.append(int(data[cpu_col]))
+            rows.append([ data[col] for col in metric_cols ])
+
+    # Returns whether the fields are a header line: unlike rows, headers have
+    # no numeric fields
+    def is_header(self, data):
+        for field in data:
+            try:
+                float(field)
+                return False
+            except ValueError:
+                pass
+        return True
+
+    # Returns the column of each metric in a header, or None if the header is
+    # not for a CPU utilization section
+    def find_metric_columns(self, header):
+        cols = []
+        for names in METRIC_COLUMNS:
+            found = [ header.index(name) for name in names if name in header ]
+            if not found:
+                return None
+            cols.append(found[0])
+        return cols
+
+    # Converts the parsed rows to an array of shape (CPUs, samples, metrics).
+    # If the log ends in the middle of an interval, the incomplete interval is
+    # dropped. CPUs that do not appear in the log (Eg. offline) are all zeros.
+    def build_usage(self, cpus, rows):
+        if not rows:
+            return numpy.zeros((0, 0, len(METRICS)))
+        cpus = numpy.array(cpus)
+        values = numpy.array(rows, dtype=numpy.float64)
+        num_cpus = cpus.max() + 1
+        counts = numpy.bincount(cpus)
+        num_samples = counts[counts > 0].min()
+        usage = numpy.zeros((num_cpus, num_samples, len(METRICS)))
+        for cpu in numpy.flatnonzero(counts):
+            usage[cpu] = values[cpus == cpu][:num_samples]
+        return usage
+
+    def get_usage(self):
+        return self.usage
+
+    def num_cpus(self):
+        return self.usage.shape[0]
+
+    # Returns the mean of each metric for every CPU as an array of shape
+    # (CPUs, metrics)
+    def get_avg_usage(self):
+        trimmed = self.usage[:, SKIP_SAMPLES:-SKIP_SAMPLES]
+        if trimmed.shape[1] == 0:
+            return numpy.zeros((self.num_cpus(), len(METRICS)))
+        return trimmed.mean(axis=1)
+
+    # Returns the per-CPU summary: the mean of each metric for every CPU, and
+    # the CPU with the highest average kernel usage (sys + soft + irq)
+    def summary(self):
+        avg_usage = self.get_avg_usage()
+        ret = dict((metric, avg_usage[:, i].tolist())
+                   for (i, metric) in enumerate(METRICS))
+        kernel = (avg_usage[:, METRICS.index('sys')] +
+                  avg_usage[:, METRICS.index('soft')] +
+                  avg_usage[:, METRICS.index('irq')])
+        ret['hot_cpu'] = None
+        if len(kernel) > 0:
+            ret['hot_cpu'] = int(kernel.argmax())
+        return ret
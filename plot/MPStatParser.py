@@ -1,6 +1,5 @@
-import re
-from helper import *
-from collections import defaultdict
+from StreamingParser import StreamingParser
+from StreamingParser import re_spaces
 
 
 # Class for parsing mpstat output
@@ -11,15 +10,13 @@ from collections import defaultdict
 # sirq = Soft IRQs
 #
 # Kernel usage is the sum of sys and sirq usage
-class MPStatParser:
+class MPStatParser(StreamingParser):
 
     def __init__(self, filename):
-        self.f = filename
-        self.lines = open(filename).readlines()
-        self.parse()
+        # Ignore first and last few seconds of data
+        StreamingParser.__init__(self, filename, 3, skip_head=15, skip_tail=15)
 
     def parse_line(self, line):
-        re_spaces = re.compile(r'\s+')
         if "all" not in line:
             return None
         data = re_spaces.split(line)
@@ -30,32 +27,17 @@ class MPStatParser:
         user, sys, sirq = map(float, [user, sys, sirq])
         return user, sys, sirq
 
-    def parse(self):
-        ret = dict(user=[], sys=[], sirq=[])
-        keys = "user sys sirq".split(' ')
-        for line in self.lines:
-            data = self.parse_line(line)
-            if data is None:
-                continue
-            for i,k in enumerate(keys):
-                ret[k].append(data[i])
-        # Ignore first and last few seconds of data
-        for k in keys:
-            ret[k] = ret[k][15:-15]
-        self.usage = ret
-        return ret
-
     def summary(self):
         (muser, msys, msirq) = self.get_avg_usage()
         return "user: %.2f, sys: %.2f, sirq: %.2f" % (muser, msys, msirq)
 
     def get_avg_usage(self):
-        muser = mean(self.usage["user"])
-        msys = mean(self.usage["sys"])
-        msirq = mean(self.usage["sirq"])
+        muser = self.mean(0)
+        msys = self.mean(1)
+        msirq = self.mean(2)
         return (muser, msys, msirq)
 
     def kernel_usage(self):
-        msys = mean(self.usage["sys"])
-        msirq = mean(self.usage["sirq"])
+        msys = self.mean(1)
+        msirq = self.mean(2)
         return msys + msirq
@@ -1,5 +1,7 @@
+import multiprocessing
 import re
 from helper import *
+from LatencyHistogram import histFromDict
 
 
 def parseHostsFile(filename):
@@ -24,86 +26,97 @@ def parseHostsFile(filename):
     return (servers, clients)
 
 
-# Class for parsing ethstats output
+# Patterns for the summary lines, keyed by the text before the first ':' in the
+# line
+summary_patterns = {
+    'Request rate' : re.compile(r'Request rate: ([0-9\.]+) req/s'),
+    'Response rate' : re.compile(r'Response rate: ([0-9\.]+) rsp/s'),
+    'Request size [B]' : re.compile(r'Request size \[B\]: avg ([0-9\.]+) min'),
+    'Response size [B]' : re.compile(r'Response size \[B\]: avg ([0-9\.]+) '
+                                     r'min'),
+    'Total' : re.compile(r'Total: connections ([0-9\.]+) requests ([0-9\.]+) '
+                         r'responses ([0-9\.]+) test-duration')}
+pat_hist = re.compile(r'([\d\.]+) (\d+)')
+HIST_HEADER = 'Response time histogram [ms]'
+HIST_FOOTER = 'Response time [ms]: p25'
+
+
+# Class for parsing mcperf output
+#
+# Gives the request and response rates, sizes and counts, and the histogram of
+# response times.
 #
-# Gives the mean and stdev of network utilization
+# The log is parsed in a single pass. Each line outside the histogram is
+# matched against at most one summary pattern, picked by the text before its
+# first ':'. Parsing stops at the histogram footer once all summary lines have
+# been seen.
 class McperfParser:
 
     def __init__(self, filename):
         self.f = filename
-        self.lines = open(filename).readlines()
-        self.parse_ops_mcperf()
-        self.parse_latency_mcperf()
-
-
-    def parse_ops_mcperf(self):
-        pat_reqr = re.compile(r'Request rate: ([0-9\.]+) req/s')
-        pat_rspr = re.compile(r'Response rate: ([0-9\.]+) rsp/s')
-        pat_reqsize = re.compile(r'Request size \[B\]: avg ([0-9\.]+) min')
-        pat_rspsize = re.compile(r'Response size \[B\]: avg ([0-9\.]+) min')
-        pat_reqrsp = re.compile(r'Total: connections ([0-9\.]+) requests ([0-9\.]+) responses ([0-9\.]+) test-duration')
         self.reqr = 0       # request rate
         self.rspr = 0       # response rate
         self.reqsize = 0    # average request size
         self.rspsize = 0    # average response size
         self.reqs = 0       # number of requests
         self.rsps = 0       # number of responses
-        for l in self.lines:
-            # reqr
-            m = pat_reqr.search(l)
-            if m:
+        self.hist = dict()  # response time (usec) -> number of responses
+        fd = open(filename)
+        self.parse(fd)
+        fd.close()
+
+
+    def parse(self, lines):
+        # 0 = before the histogram, 1 = in the histogram, 2 = after it
+        state = 0
+        seen = set()
+        for l in lines:
+            if state == 1:
+                l = l.strip()
+                if l == ":":
+                    continue
+                if HIST_FOOTER in l:
+                    state = 2
+                    if len(seen) == len(summary_patterns):
+                        break
+                    continue
+                m = pat_hist.search(l)
+                if m:
+                    lo, num = m.group(1), m.group(2)
+                    lo = float(lo)
+                    self.hist[int(lo * 1e3)] = int(num)
+                continue
+
+            if state == 0 and HIST_HEADER in l:
+                state = 1
+                continue
+            if state == 0 and HIST_FOOTER in l:
+                state = 2
+
+            key = l.lstrip().split(':', 1)[0]
+            pat = summary_patterns.get(key)
+            if pat is None:
+                continue
+            m = pat.search(l)
+            if not m:
+                continue
+            seen.add(key)
+            if key == 'Request rate':
                 self.reqr = float(m.group(1))
-            # rspr
-            m = pat_rspr.search(l)
-            if m:
+            elif key == 'Response rate':
                 self.rspr = float(m.group(1))
-            # reqsize
-            m = pat_reqsize.search(l)
-            if m:
+            elif key == 'Request size [B]':
                 self.reqsize = float(m.group(1))
-            # rspsize
-            m = pat_rspsize.search(l)
-            if m:
+            elif key == 'Response size [B]':
                 self.rspsize = float(m.group(1))
-            # reqs, rsps
-            m = pat_reqrsp.search(l)
-            if m:
+            elif key == 'Total':
                 self.reqs = int(m.group(2))
                 self.rsps = int(m.group(3))
 
-        return (self.reqr, self.rspr,
-                self.reqsize, self.rspsize,
-                self.reqs, self.rsps)
-
-
-    def parse_latency_mcperf(self):
-        pat_mcperf = re.compile(r'([\d\.]+) (\d+)')
-        hist = dict()
-        skip = 0
-
-        for l in self.lines:
-            if skip == 0 and "Response time histogram [ms]" in l:
-                skip = 1
-                continue
-
-            # Parse
-            l = l.strip()
-            if l == ":":
-                continue
-            if "Response time [ms]: p25" in l:
-                break
-
-            m = pat_mcperf.search(l)
-            if m:
-                lo, num = m.group(1), m.group(2)
-                lo = float(lo)
-                hist[int(lo * 1e3)] = int(num)
-        self.hist = hist
-        return hist
-
 
+    # Returns the latency histogram as a LatencyHistogram
     def get_hist(self):
-        return self.hist
+        return histFromDict(self.hist)
 
 
     def get_reqr(self):
@@ -128,3 +141,35 @@ class McperfParser:
 
     def get_rsps(self):
         return self.rsps
+
+
+# Parses an mcperf log file and returns the tuple
+# (hist, reqr, rspr, reqsize, rspsize, reqs, rsps)
+def parseMcperfFile(filename):
+    mcstats = McperfParser(filename)
+    return (mcstats.get_hist(),
+            mcstats.get_reqr(), mcstats.get_rspr(),
+            mcstats.get_reqsize(), mcstats.get_rspsize(),
+            mcstats.get_reqs(), mcstats.get_rsps())
+
+
+# Parses a list of mcperf log files with a pool of worker processes (all CPUs
+# if processes is None). Returns a tuple of lists
+# (hists, reqrs, rsprs, reqsizes, rspsizes, reqss, rspss)
+# with the results for each file, in the order of filenames.
+# The files are parsed serially if processes is 1, or if this is a daemon
+# process (Eg. a worker of another pool), which can not start its own workers.
+def parseMcperfFiles(filenames, processes=None):
+    if (processes == 1 or len(filenames) <= 1 or
+        multiprocessing.current_process().daemon):
+        results = map(parseMcperfFile, filenames)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(parseMcperfFile, filenames)
+        finally:
+            pool.close()
+            pool.join()
+    if not results:
+        return ([], [], [], [], [], [], [])
+    return tuple(map(list, zip(*results)))
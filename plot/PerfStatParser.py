@@ -0,0 +1,61 @@
+import numpy
+import re
+
+
+# Per-CPU counter line of perf stat -A, Eg.
+#   CPU0          1,234,567 cycles          #    2.659 GHz         [44.44%]
+# Counters that were not counted or are not supported are skipped.
+pat_counter = re.compile(r'^\s*CPU(\d+)\s+([\d,\.]+)\s+(\S+)')
+pat_elapsed = re.compile(r'^\s*([\d\.]+) seconds time elapsed')
+
+
+# Class for parsing the output of perf stat -a -A (perf.txt)
+#
+# The count of every event is recorded for every CPU. Counts of multiplexed
+# events are already scaled by perf.
+class PerfStatParser:
+
+    def __init__(self, filename):
+        self.f = filename
+        # Counts of each event keyed by CPU
+        self.counts = {}
+        self.elapsed = None
+        self.num_cpus = 0
+        fd = open(filename)
+        try:
+            self.parse(fd)
+        finally:
+            fd.close()
+
+    def parse(self, lines):
+        for line in lines:
+            m = pat_counter.match(line)
+            if m:
+                cpu = int(m.group(1))
+                count = float(m.group(2).replace(',', ''))
+                self.counts.setdefault(m.group(3), {})[cpu] = count
+                self.num_cpus = max(self.num_cpus, cpu + 1)
+                continue
+            m = pat_elapsed.match(line)
+            if m:
+                self.elapsed = float(m.group(1))
+
+    def get_events(self):
+        return sorted(self.counts.keys())
+
+    # Returns the per-CPU counts of an event as an array
+    def get_counts(self, event):
+        ret = numpy.zeros(self.num_cpus)
+        for (cpu, count) in self.counts.get(event, {}).iteritems():
+            ret[cpu] = count
+        return ret
+
+    def get_total(self, event):
+        return sum(self.counts.get(event, {}).values())
+
+    # Returns the number of seconds the counters were collected for
+    def get_elapsed(self):
+        return self.elapsed
+
+    def totals(self):
+        return dict((event, self.get_total(event)) for event in self.counts)
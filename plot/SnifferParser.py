@@ -1,7 +1,41 @@
+import numpy
+import os
+import re
 from helper import *
 from collections import defaultdict
 
 
+# Number of bytes read from the sniffer file at a time by the columnar parser
+COLUMNAR_CHUNK_BYTES = 1 << 24
+# Number of whitespace separated fields in each line of sniffer output
+SNF_FIELDS = 5
+
+re_fraction = re.compile(r'\.\d*')
+
+# Binary sniffer capture format
+#
+# A 16 byte header (magic string followed by the number of records as a
+# little-endian uint64) and then one fixed-width packed record per packet, in
+# capture order. The timestamp is signed so that differences between
+# timestamps never wrap around. The records can be memory-mapped directly with
+# numpy.memmap.
+#
+# The records may be followed by the head of the text log it was converted
+# from: SNF_HEAD_MAGIC, the length of the text as a little-endian uint64, and
+# the text of its first lines as is, so that the head sample of a binary
+# capture is the same as that of the text log.
+SNF_BINARY_MAGIC = 'SNFBIN01'
+SNF_BINARY_HEADER_BYTES = 16
+SNF_HEAD_MAGIC = 'SNFHEAD1'
+# Number of lines of the text log kept by convertSnfToBinary
+SNF_BINARY_HEAD_LINES = 20000
+SNF_RECORD_DTYPE = numpy.dtype([('nsec', '<i8'),
+                                ('src_mac', 'u1'),
+                                ('dst_mac', 'u1'),
+                                ('pkt_len', '<u2'),
+                                ('port', '<u2')])
+
+
 # Class for parsing output from the myri10g sniffer
 #
 # Sniffer output format:
@@ -17,23 +51,69 @@ from collections import defaultdict
 # ipt = Interpacket times in nanoseconds for each TC
 # burstlen_pkt = Contiguous burst length in packets for each TC
 # burstlen_ns  = Contiguous burst length in ns for each TC
+#
+# With columnar=True, the timestamp, packet length and port columns are loaded
+# into NumPy arrays in bulk and all properties are computed with array
+# operations. The results are identical to the line by line parser, but whole
+# captures can be parsed quickly, so max_lines=None (no limit) is practical.
+#
+# filename can also be an open file object, Eg. a member of the pkt_snf.tar.gz
+# tarball opened in streaming mode, so the capture never has to be extracted
+# to disk. The first head_lines lines of the input are kept while parsing and
+# returned by get_head().
+#
+# With binary=True, filename is a capture in the binary format written by
+# writeSnfBinary(). It is memory-mapped and parsed with the columnar engine
+# without copying the records. The head is the text kept in the capture, or if
+# there is none, formatted from the records (without the header line and
+# fractional timestamps of the text log).
 class SnifferParser:
 
-    def __init__(self, filename, max_lines=100000, ignore_frac=0.1):
+    def __init__(self, filename, max_lines=100000, ignore_frac=0.1,
+                 columnar=False, head_lines=0, binary=False):
         self.filename = filename
         self.max_lines = max_lines
         self.ignore_frac = ignore_frac
+        self.columnar = columnar
         self.pkt_len_freq = {}
         self.ipt = defaultdict(list)
         self.burstlen_pkt = defaultdict(list)
         self.burstlen_nsec = defaultdict(list)
 
+        if binary:
+            # NOTE: Will throw exception if the file is not present.
+            records = readSnfBinary(filename)[:max_lines]
+            head = readSnfBinaryHead(filename)
+            if head is not None:
+                self.head_text = headLines(head, head_lines)
+            else:
+                self.head_text = formatSnfRecords(records[:head_lines])
+            self.parse_columns(records['nsec'], records['pkt_len'],
+                               records['port'])
+            return
+
         # NOTE: Will throw exception if the file is not present.
-        self.lines = open(filename).xreadlines()
-        # Ignore first line
-        self.lines.next()
-        # Parse the file and populate dataset
-        self.parse()
+        if isinstance(filename, basestring):
+            fd = open(filename)
+        else:
+            fd = filename
+        self.head = HeadSampler(fd, head_lines)
+        fd = self.head
+        if columnar:
+            # Load the columns and compute the dataset with array operations
+            (nsec, pkt_len, port) = readSnfColumns(fd, max_lines)
+            self.parse_columns(nsec, pkt_len, port)
+        else:
+            self.lines = fd.xreadlines()
+            # Ignore first line
+            self.lines.next()
+            # Parse the file and populate dataset
+            self.parse()
+        fd.close()
+        self.head_text = self.head.get_lines()
+
+    def get_head(self):
+        return self.head_text
 
     def get_ipt(self):
         return self.ipt
@@ -70,7 +150,7 @@ class SnifferParser:
         burst_starttime = 0
         for line in self.lines:
             line_num += 1
-            if line_num > self.max_lines:
+            if self.max_lines is not None and line_num > self.max_lines:
                 break
             d = self.parse_line(line)
             pkt_len = d[1]
@@ -114,6 +194,56 @@ class SnifferParser:
             self.burstlen_pkt[port].sort()
             self.burstlen_nsec[port].sort()
 
+    # Computes the same dataset as parse() from NumPy arrays of timestamps,
+    # packet lengths and ports (one element per packet, in capture order).
+    def parse_columns(self, nsec, pkt_len, port):
+        # Packet length frequencies
+        lens, freqs = numpy.unique(pkt_len, return_counts=True)
+        self.pkt_len_freq = dict(zip(lens.tolist(), freqs.tolist()))
+
+        # Inter-packet times for each class. Ports with a single packet have
+        # no inter-packet times and are left out, just like parse() does.
+        ipt = {}
+        for (p, p_nsec) in groupByKey(port, nsec).iteritems():
+            if len(p_nsec) > 1:
+                ipt[p] = numpy.diff(p_nsec)
+
+        # Burst lengths of each class. A burst is a run of consecutive packets
+        # with the same port. The burst in progress at the end of the trace is
+        # never recorded, and bursts of port 0 are discarded.
+        burstlen_pkt = {}
+        burstlen_nsec = {}
+        if len(port) > 1:
+            starts = numpy.flatnonzero(port[1:] != port[:-1]) + 1
+            starts = numpy.concatenate(([0], starts))
+            run_port = port[starts[:-1]]
+            run_len = numpy.diff(starts)
+            run_nsec = nsec[starts[1:]] - nsec[starts[:-1]]
+            valid = run_port != 0
+            burstlen_pkt = groupByKey(run_port[valid], run_len[valid])
+            burstlen_nsec = groupByKey(run_port[valid], run_nsec[valid])
+
+        self.ipt = defaultdict(list)
+        self.burstlen_pkt = defaultdict(list)
+        self.burstlen_nsec = defaultdict(list)
+        for (p, bursts) in burstlen_pkt.iteritems():
+            self.burstlen_pkt[p] = bursts.tolist()
+        for (p, bursts) in burstlen_nsec.iteritems():
+            self.burstlen_nsec[p] = bursts.tolist()
+
+        # Trim and sort the data for each class with inter-packet times
+        empty = numpy.zeros(0, dtype=numpy.int64)
+        for p in ipt.keys():
+            p_ipt = ipt[p]
+            p_burstlen_pkt = burstlen_pkt.get(p, empty)
+            if self.ignore_frac > 0:
+                p_ipt = trimFrac(p_ipt, self.ignore_frac)
+                p_burstlen_pkt = trimFrac(p_burstlen_pkt, self.ignore_frac)
+            self.ipt[p] = numpy.sort(p_ipt).tolist()
+            self.burstlen_pkt[p] = numpy.sort(p_burstlen_pkt).tolist()
+            self.burstlen_nsec[p] = numpy.sort(
+                    burstlen_nsec.get(p, empty)).tolist()
+
     def summary_ipt(self):
         ret = dict()
         for port in self.ipt.keys():
@@ -170,3 +300,269 @@ class SnifferParser:
         FRAMING_OVERHEAD = 24
         class_rate_gbps = total_rate_gbps / len(self.ipt.keys())
         return (self.seen_packet_len[0] + FRAMING_OVERHEAD) * 8.0 / (class_rate_gbps)
+
+
+# Wraps a file object and keeps a copy of the first nlines lines read through
+# it, so that a sample of the input is available without a second pass.
+class HeadSampler:
+
+    def __init__(self, fd, nlines):
+        self.fd = fd
+        self.name = getattr(fd, 'name', '<stream>')
+        self.lines = None
+        self.nlines = nlines
+        self.chunks = []
+        self.seen_lines = 0
+
+    def record(self, data):
+        if self.seen_lines < self.nlines:
+            self.chunks.append(data)
+            self.seen_lines += data.count('\n')
+        return data
+
+    def read(self, size=-1):
+        return self.record(self.fd.read(size))
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.lines is None:
+            self.lines = iter(self.fd)
+        return self.record(self.lines.next())
+
+    def xreadlines(self):
+        return self
+
+    def close(self):
+        self.fd.close()
+
+    def get_lines(self):
+        return headLines(''.join(self.chunks), self.nlines)
+
+
+# Returns the first nlines lines of the text
+def headLines(text, nlines):
+    lines = text.split('\n', nlines)
+    if len(lines) > nlines:
+        return '\n'.join(lines[:nlines]) + '\n'
+    return text
+
+
+# Reads sniffer output from an open file into NumPy arrays. The first line of
+# the file is ignored, and at most max_lines lines are read after it
+# (max_lines=None reads the whole file).
+#
+# Returns a tuple of int64 arrays (nsec, pkt_len, port), one element per
+# packet in the order they were captured. With with_macs=True, the returned
+# tuple is (nsec, src_mac, dst_mac, pkt_len, port).
+def readSnfColumns(fd, max_lines=None, chunk_bytes=COLUMNAR_CHUNK_BYTES,
+                   with_macs=False):
+    nsec_chunks = []
+    src_mac_chunks = []
+    dst_mac_chunks = []
+    pkt_len_chunks = []
+    port_chunks = []
+    for block in iterSnfLineBlocks(fd, max_lines, chunk_bytes):
+        tokens = block.split()
+        if len(tokens) % SNF_FIELDS != 0:
+            raise ValueError('Malformed sniffer output in %s' %
+                             getattr(fd, 'name', '<stream>'))
+        # Timestamps may have a fractional part which is dropped
+        nsec = ' '.join(tokens[0::SNF_FIELDS])
+        if '.' in nsec:
+            nsec = re_fraction.sub('', nsec)
+        nsec_chunks.append(parseIntColumn(nsec))
+        pkt_len_chunks.append(parseIntColumn(' '.join(tokens[3::SNF_FIELDS])))
+        port_chunks.append(parseIntColumn(' '.join(tokens[4::SNF_FIELDS])))
+        if with_macs:
+            src_mac_chunks.append(parseHexColumn(tokens[1::SNF_FIELDS]))
+            dst_mac_chunks.append(parseHexColumn(tokens[2::SNF_FIELDS]))
+
+    if with_macs:
+        all_chunks = [nsec_chunks, src_mac_chunks, dst_mac_chunks,
+                      pkt_len_chunks, port_chunks]
+    else:
+        all_chunks = [nsec_chunks, pkt_len_chunks, port_chunks]
+    return tuple(numpy.concatenate(chunks) if chunks else
+                 numpy.zeros(0, dtype=numpy.int64)
+                 for chunks in all_chunks)
+
+
+# Converts a string of space separated integers to an int64 array
+def parseIntColumn(s):
+    col = numpy.fromstring(s, dtype=numpy.int64, sep=' ')
+    if len(col) != s.count(' ') + 1:
+        raise ValueError('Malformed sniffer output: %s...' % s[:80])
+    return col
+
+
+# Converts a list of hex strings (Eg. the last byte of MAC addresses) to an
+# int64 array. Each distinct string is converted only once.
+def parseHexColumn(tokens):
+    (uniq, inverse) = numpy.unique(numpy.array(tokens), return_inverse=True)
+    values = numpy.array([ int(x, 16) for x in uniq ], dtype=numpy.int64)
+    return values[inverse]
+
+
+# Generator that reads the sniffer file in large chunks and yields strings
+# containing only complete lines. The first line of the file is skipped and no
+# more than max_lines lines are yielded in total (max_lines=None for no limit).
+def iterSnfLineBlocks(fd, max_lines=None, chunk_bytes=COLUMNAR_CHUNK_BYTES):
+    remaining = max_lines
+    partial = ''
+    skip_header = True
+    while remaining is None or remaining > 0:
+        buf = fd.read(chunk_bytes)
+        if not buf:
+            # The last line may not be terminated by a newline
+            block = partial
+            partial = ''
+        else:
+            buf = partial + buf
+            end = buf.rfind('\n')
+            if end < 0:
+                partial = buf
+                continue
+            block = buf[:end]
+            partial = buf[end + 1:]
+
+        if skip_header:
+            # Ignore first line
+            nl = block.find('\n')
+            if nl < 0:
+                if not buf:
+                    return
+                skip_header = False
+                continue
+            block = block[nl + 1:]
+            skip_header = False
+
+        if block:
+            nlines = block.count('\n') + 1
+            if remaining is not None:
+                if nlines > remaining:
+                    block = '\n'.join(block.split('\n', remaining)[:remaining])
+                    nlines = remaining
+                remaining -= nlines
+            yield block
+
+        if not buf:
+            return
+
+
+# Groups values by key. Returns a dictionary mapping each unique key to a NumPy
+# array of its values, preserving their original order.
+def groupByKey(keys, values):
+    order = numpy.argsort(keys, kind='mergesort')
+    keys = keys[order]
+    values = values[order]
+    (uniq_keys, starts) = numpy.unique(keys, return_index=True)
+    ends = numpy.append(starts[1:], len(keys))
+    return dict((k, values[s:e])
+                for (k, s, e) in zip(uniq_keys.tolist(), starts, ends))
+
+
+# Ignores ignore_frac of the samples at either end of the array.
+# NOTE: Like list[L:-L], this returns an empty array when L is 0.
+def trimFrac(arr, ignore_frac):
+    L = int(len(arr) * ignore_frac)
+    return arr[L:-L]
+
+
+# Opens the sniffer log inside the pkt_snf.tar.gz tarball for reading. The
+# tarball must be opened in streaming mode, Eg. tarfile.open(path, 'r|gz'), so
+# that the log is decompressed on the fly and nothing is written to disk.
+def openSnfTarMember(tar):
+    for member in tar:
+        if member.isfile() and os.path.basename(member.name) == 'pkt_snf.txt':
+            return tar.extractfile(member)
+    raise IOError('pkt_snf.txt not found in sniffer tarball %s' % tar.name)
+
+
+# Writes sniffer records in the binary capture format. The columns are
+# sequences or arrays with one element per packet. head is the text of the
+# first lines of the text log, if any.
+def writeSnfBinary(filename, nsec, src_mac, dst_mac, pkt_len, port,
+                   head=None):
+    records = numpy.zeros(len(nsec), dtype=SNF_RECORD_DTYPE)
+    records['nsec'] = nsec
+    records['src_mac'] = src_mac
+    records['dst_mac'] = dst_mac
+    records['pkt_len'] = pkt_len
+    records['port'] = port
+    # Write to a temp file first, so that an interrupted conversion never
+    # leaves a truncated capture behind
+    fd = open(filename + '.tmp', 'wb')
+    fd.write(SNF_BINARY_MAGIC)
+    fd.write(numpy.array([len(records)], dtype='<u8').tostring())
+    records.tofile(fd)
+    if head is not None:
+        fd.write(SNF_HEAD_MAGIC)
+        fd.write(numpy.array([len(head)], dtype='<u8').tostring())
+        fd.write(head)
+    fd.close()
+    os.rename(filename + '.tmp', filename)
+
+
+# Memory-maps a capture in the binary format and returns a read-only
+# structured array of records (see SNF_RECORD_DTYPE).
+def readSnfBinary(filename):
+    fd = open(filename, 'rb')
+    header = fd.read(SNF_BINARY_HEADER_BYTES)
+    fd.close()
+    if (len(header) != SNF_BINARY_HEADER_BYTES or
+        not header.startswith(SNF_BINARY_MAGIC)):
+        raise ValueError('Not a binary sniffer capture: %s' % filename)
+    num_records = int(numpy.fromstring(header[len(SNF_BINARY_MAGIC):],
+                                       dtype='<u8')[0])
+    if num_records == 0:
+        return numpy.zeros(0, dtype=SNF_RECORD_DTYPE)
+    return numpy.memmap(filename, dtype=SNF_RECORD_DTYPE, mode='r',
+                        offset=SNF_BINARY_HEADER_BYTES,
+                        shape=(num_records,))
+
+
+# Returns the text of the first lines of the text log kept in a capture in the
+# binary format, or None if it has none.
+def readSnfBinaryHead(filename):
+    fd = open(filename, 'rb')
+    try:
+        header = fd.read(SNF_BINARY_HEADER_BYTES)
+        if (len(header) != SNF_BINARY_HEADER_BYTES or
+            not header.startswith(SNF_BINARY_MAGIC)):
+            raise ValueError('Not a binary sniffer capture: %s' % filename)
+        num_records = int(numpy.fromstring(header[len(SNF_BINARY_MAGIC):],
+                                           dtype='<u8')[0])
+        fd.seek(SNF_BINARY_HEADER_BYTES +
+                num_records * SNF_RECORD_DTYPE.itemsize)
+        trailer = fd.read(len(SNF_HEAD_MAGIC) + 8)
+        if (len(trailer) != len(SNF_HEAD_MAGIC) + 8 or
+            not trailer.startswith(SNF_HEAD_MAGIC)):
+            return None
+        length = int(numpy.fromstring(trailer[len(SNF_HEAD_MAGIC):],
+                                      dtype='<u8')[0])
+        return fd.read(length)
+    finally:
+        fd.close()
+
+
+# Converts a text sniffer log (filename or open file object) to the binary
+# capture format, keeping its first head_lines lines. Returns the number of
+# records written.
+def convertSnfToBinary(snf_file, out_filename, max_lines=None,
+                       head_lines=SNF_BINARY_HEAD_LINES):
+    if isinstance(snf_file, basestring):
+        fd = open(snf_file)
+    else:
+        fd = snf_file
+    fd = HeadSampler(fd, head_lines)
+    columns = readSnfColumns(fd, max_lines, with_macs=True)
+    fd.close()
+    writeSnfBinary(out_filename, *columns, head=fd.get_lines())
+    return len(columns[0])
+
+
+# Formats binary sniffer records as lines of text sniffer output
+def formatSnfRecords(records):
+    return ''.join('%d %02x %02x %d %d\n' % tuple(r) for r in records)
@@ -0,0 +1,75 @@
+import math
+import re
+from collections import deque
+
+
+re_spaces = re.compile(r'\s+')
+
+
+# Base class for parsers of monitor logs with one sample per line
+#
+# The log file is read once, line by line. parse_line() of the subclass returns
+# the tuple of values of a sample line (or None for other lines). The first
+# skip_head and the last skip_tail samples are ignored (Eg. the first and last
+# few seconds of an experiment), and only the running sums and sums of squares
+# of the remaining samples are kept. The last skip_tail samples are held in a
+# ring buffer until it is known that they are not at the end of the log, so the
+# memory used does not depend on the length of the log.
+#
+# The sums are accumulated in the order of the samples, so mean() and stdev()
+# return exactly the same values as helper.mean() and helper.stdev() on the
+# list of trimmed samples.
+class StreamingParser:
+
+    def __init__(self, filename, num_fields, skip_head=0, skip_tail=0):
+        self.f = filename
+        self.skip_head = skip_head
+        self.skip_tail = skip_tail
+        self.num_samples = 0
+        self.sums = [0] * num_fields
+        self.sq_sums = [0] * num_fields
+        self.num_seen = 0
+        self.tail = deque()
+        fd = open(filename)
+        try:
+            self.parse(fd)
+        finally:
+            fd.close()
+
+    def parse_line(self, line):
+        raise NotImplementedError
+
+    def parse(self, lines):
+        for line in lines:
+            data = self.parse_line(line)
+            if data is not None:
+                self.add_sample(data)
+
+    def add_sample(self, data):
+        self.num_seen += 1
+        if self.num_seen <= self.skip_head:
+            return
+        if self.skip_tail > 0:
+            self.tail.append(data)
+            if len(self.tail) <= self.skip_tail:
+                return
+            data = self.tail.popleft()
+        self.num_samples += 1
+        for (i, value) in enumerate(data):
+            self.sums[i] += value
+            self.sq_sums[i] += value * value
+
+    def mean(self, field=0):
+        if self.num_samples == 0:
+            return 0
+        return self.sums[field] * 1.0 / self.num_samples
+
+    # Standard deviation with respect to mean m (the mean of the samples if m
+    # is None), like helper.stdev()
+    def stdev(self, field=0, m=None):
+        if m is None:
+            m = self.mean(field)
+        sq = 0
+        if self.num_samples > 0:
+            sq = self.sq_sums[field] * 1.0 / self.num_samples
+        return math.sqrt(abs(sq - m * m))
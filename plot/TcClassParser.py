@@ -0,0 +1,109 @@
+import re
+
+
+# Header line of a class, Eg.
+#   class qfq 1:1000 root weight 5000 maxpkt 2048
+#   class htb 1:10 parent 1:1 prio 0 rate 1000Mbit ceil 1000Mbit burst 15Kb ...
+pat_class = re.compile(r'^class (\S+) (\S+) (.*)$')
+pat_sent = re.compile(r'Sent (\d+) bytes (\d+) pkt \(dropped (\d+), '
+                      r'overlimits (\d+) requeues (\d+)\)')
+pat_backlog = re.compile(r'backlog (\d+)([KMG]?)b (\d+)p')
+pat_rate = re.compile(r'^(\d+(?:\.\d+)?)([KMG]?)bit$')
+
+SIZE_UNITS = {'' : 1, 'K' : 1024, 'M' : 1024 * 1024, 'G' : 1024 * 1024 * 1024}
+RATE_UNITS = {'' : 1e-6, 'K' : 1e-3, 'M' : 1, 'G' : 1e3}
+
+
+# Returns the rate in Mbps of a tc rate string (Eg. '1500Mbit')
+def parseTcRate(rate):
+    m = pat_rate.match(rate)
+    if not m:
+        return None
+    return float(m.group(1)) * RATE_UNITS[m.group(2)]
+
+
+# Sort key for tc class ids (Eg. '1:3e8'), which are in hex
+def classidKey(classid):
+    try:
+        return tuple(int(part or '0', 16) for part in classid.split(':'))
+    except ValueError:
+        return (classid,)
+
+
+# Class for parsing a dump of tc -s class show (qfq-stats.txt, htb-class.txt)
+#
+# For every class the following are recorded:
+# kind = Qdisc of the class (qfq, htb)
+# configured_mbps = Configured rate of the class (the weight of QFQ classes,
+#                   which is the rate in Mbps for the rate limiting QFQ, or the
+#                   rate of HTB classes)
+# sent_bytes, sent_pkts, dropped, overlimits, requeues = Counters
+# backlog_bytes, backlog_pkts = Queue backlog when the dump was taken
+class TcClassParser:
+
+    def __init__(self, filename):
+        self.f = filename
+        # Stats of each class keyed by class id
+        self.classes = {}
+        fd = open(filename)
+        try:
+            self.parse(fd)
+        finally:
+            fd.close()
+
+    def parse(self, lines):
+        stats = None
+        for line in lines:
+            line = line.strip()
+            m = pat_class.match(line)
+            if m:
+                (kind, classid, params) = m.groups()
+                params = params.split()
+                stats = {'kind' : kind,
+                         'parent' : self.param(params, 'parent'),
+                         'configured_mbps' : self.configured_rate(kind,
+                                                                  params)}
+                self.classes[classid] = stats
+                continue
+            if stats is None:
+                continue
+            m = pat_sent.search(line)
+            if m:
+                (stats['sent_bytes'], stats['sent_pkts'], stats['dropped'],
+                 stats['overlimits'], stats['requeues']) = map(int, m.groups())
+            m = pat_backlog.search(line)
+            if m:
+                stats['backlog_bytes'] = (int(m.group(1)) *
+                                          SIZE_UNITS[m.group(2)])
+                stats['backlog_pkts'] = int(m.group(3))
+
+    # Returns the value following the name of a parameter, or None
+    def param(self, params, name):
+        if name in params[:-1]:
+            return params[params.index(name) + 1]
+        return None
+
+    def configured_rate(self, kind, params):
+        if kind == 'qfq' and self.param(params, 'weight') is not None:
+            return float(self.param(params, 'weight'))
+        if kind == 'htb' and self.param(params, 'rate') is not None:
+            return parseTcRate(self.param(params, 'rate'))
+        return None
+
+    def get_classids(self):
+        return sorted(self.classes.keys(), key=classidKey)
+
+    # Returns the classes that are not the parent of any other class. The
+    # counters of HTB inner classes include the traffic of their children.
+    def get_leaf_classids(self):
+        parents = set(stats['parent'] for stats in self.classes.values())
+        return [ classid for classid in self.get_classids()
+                 if classid not in parents ]
+
+    def get_class(self, classid):
+        return self.classes[classid]
+
+    # Returns the total of a counter over all leaf classes
+    def get_total(self, counter):
+        return sum(self.classes[classid].get(counter, 0)
+                   for classid in self.get_leaf_classids())
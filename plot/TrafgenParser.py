@@ -1,34 +1,21 @@
-import re
-from helper import *
+from StreamingParser import StreamingParser
+from StreamingParser import re_spaces
 
 
 # Class for parsing trafgen output
 #
 # Goodput is recorded (Tx or Rx)
-class TrafgenParser:
+class TrafgenParser(StreamingParser):
 
     def __init__(self, filename):
-        self.f = filename
-        self.lines = open(filename).readlines()
-        self.parse()
+        # Ignore first and last few seconds of data
+        StreamingParser.__init__(self, filename, 1, skip_head=30, skip_tail=30)
 
     def parse_line(self, line):
-        re_spaces = re.compile(r'\s+')
         if ("Tx" not in line and "Rx" not in line):
             return None
         data = re_spaces.split(line)
-        return float(data[2])
-
-    def parse(self):
-        rate_mbps = []
-        for line in self.lines:
-            data = self.parse_line(line)
-            if data is not None:
-                rate_mbps.append(data)
-        # Ignore first and last few seconds of data
-        rate_mbps = rate_mbps[30:-30]
-        self.rate_mbps = rate_mbps
-        return rate_mbps
+        return (float(data[2]),)
 
     def get_avg_rate(self):
-        return mean(self.rate_mbps)
+        return self.mean()
@@ -18,6 +18,7 @@ from expsiftUtils import getCommonAndUniqueProperties
 from plotCPUCompare import plotCPUComparisonDirs
 from plotBurstCompare import plotAvgBurstLenPktComparisonDirs
 from plotBurstCompare import plotBurstLenUsecComparisonDirs
+from summaryIndex import loadSummaryIndex
 
 
 def getTimeDeltaSeconds(delta = timedelta(0)):
@@ -37,6 +38,9 @@ def summaryPlot(dir2props_dict = {}):
 
     start_time = datetime.now()
 
+    # Load the summaries of all directories from the summary index in one shot
+    loadSummaryIndex(dir2props_dict.keys())
+
     # Generate the CPU comparison plot
     (subplot_titles,
      majorgroup_labels,
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+#
+# Converts a text sniffer log (pkt_snf.txt or the pkt_snf.tar.gz tarball) to
+# the binary capture format that SnifferParser can memory-map.
+
+import argparse
+import sys
+import tarfile
+
+from SnifferParser import convertSnfToBinary
+from SnifferParser import openSnfTarMember
+
+
+parser = argparse.ArgumentParser(description='Convert sniffer log to binary '
+                                 'capture format')
+parser.add_argument('snf_file',
+                    help='Sniffer log (pkt_snf.txt or pkt_snf.tar.gz)')
+parser.add_argument('out_file', help='Output binary capture file')
+parser.add_argument('--max_lines', '-n', dest='max_lines', type=int,
+                    help='Only convert the first max_lines packets',
+                    default=None)
+
+
+def main(argv):
+    # Parse flags
+    args = parser.parse_args()
+
+    # Stream the log out of the tarball if required
+    if args.snf_file.endswith('.tar.gz'):
+        tar = tarfile.open(args.snf_file, 'r|gz')
+        num_records = convertSnfToBinary(openSnfTarMember(tar), args.out_file,
+                                         args.max_lines)
+        tar.close()
+    else:
+        num_records = convertSnfToBinary(args.snf_file, args.out_file,
+                                         args.max_lines)
+
+    print 'Wrote %d records to %s' % (num_records, args.out_file)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -1,60 +1,105 @@
 #!/usr/bin/env python
 
 import argparse
-import bisect
 import cPickle
 import glob
+import hashlib
+import json
+import multiprocessing
 import numpy
 import os
 import random
 import sys
 import tarfile
-from plumbum.cmd import head
 
 from SnifferParser import SnifferParser
+from SnifferParser import convertSnfToBinary
+from SnifferParser import readSnfBinaryHead
+from SnifferParser import openSnfTarMember
 from MPStatParser import MPStatParser
+from MPStatCPUParser import MPStatCPUParser
+from MPStatCPUParser import METRICS as CPU_METRICS
 from EthstatsParser import EthstatsParser
-from McperfParser import McperfParser
+from EthstatsParser import METRICS
+from McperfParser import parseMcperfFiles
+from PerfStatParser import PerfStatParser
 from TrafgenParser import TrafgenParser
-
+from TcClassParser import TcClassParser
+from TcClassParser import classidKey
+from ClassStatsParser import ClassStatsParser
+
+from ExptStore import ExptStore
+from ExptStore import ExptStoreWriter
+from ExptStore import portArrays
+from ExptStore import portSummary
+from LatencyHistogram import mergeHistograms
 from McperfParser import parseHostsFile
+from expsiftUtils import readDirTagFile
 from expsiftUtils import readDirTagFileProperty
+from summaryIndex import findSummaryIndex
+from summaryIndex import updateSummaryIndex
 
 
 parser = argparse.ArgumentParser(description='Pickle experiment logs')
 parser.add_argument('expt_dir', help='Experiment directory')
-parser.add_argument('tmp_dir', help='Temp directory')
+parser.add_argument('tmp_dir', nargs='?', default=None,
+                    help='Temp directory (unused, sniffer data is parsed '
+                         'straight from the tarball)')
 parser.add_argument('-f', dest='force_rewrite',
                     help='Repickle even if pickle file already exists',
                     action="store_true")
+parser.add_argument('-b', dest='snf_binary',
+                    help='Convert the sniffer log to the binary capture format '
+                         '(logs/pkt_snf.snfbin) so that it can be memory-mapped '
+                         'when it is reanalyzed',
+                    action="store_true")
+parser.add_argument('-i', dest='index_file', default=None,
+                    help='Summary index to add the experiment to (default: '
+                         'the index in the nearest parent directory, if any)')
 
 
-pickled_files = {'sniffer' : ['burstlen_pkt.txt',
-                              'burstlen_pkt_summary.txt',
-                              'burstlen_nsec.txt',
-                              'burstlen_nsec_summary.txt',
-                              'ipt.txt',
-                              'ipt_summary.txt',
-                              'pkt_len_freq.txt'],
-                 'mpstat' : ['mpstat_p.txt'],
-                 'ethstats' : ['net_p.txt'],
-                 'mpstat_mc' : ['mpstat_mc_p.txt'],
-                 'trafgen' : ['trafgen_p.txt'],
-                 'mcperf' : ['mcperf_p.txt',
-                             'hosts_p.txt']}
 stats_files = {'sniffer' : ['snf_stats.txt',
                             'pkt_snf_head20000.txt'],
                'mpstat' : ['cpu_util.txt'],
+               'mpstat_cpu' : ['cpu_util_per_cpu.txt'],
                'ethstats' : ['net_util.txt'],
                'mpstat_mc' : ['cpu_util.txt'],
+               'mpstat_cpu_mc' : ['cpu_util_per_cpu.txt'],
                'trafgen' : ['trafgen.txt'],
-               'mcperf' : ['mcperf.txt']}
+               'mcperf' : ['mcperf.txt'],
+               'perf' : ['perf_counters.txt'],
+               'tc_class' : ['tc_class.txt']}
+
+# Version of the parsing code for each category. Bump the version of a
+# category whenever its parser or pickled output changes, so that existing
+# experiments are repickled.
+PARSER_VERSIONS = {'sniffer' : 1,
+                   'mpstat' : 1,
+                   'mpstat_cpu' : 2,
+                   'ethstats' : 2,
+                   'mpstat_mc' : 1,
+                   'mpstat_cpu_mc' : 1,
+                   'trafgen' : 1,
+                   'mcperf' : 1,
+                   'perf' : 2,
+                   'tc_class' : 1}
+MANIFEST_FILE = 'manifest.json'
 
 memcached_workloads = ['memcached_set', 'memcached_get',
                        'memcached_set+trafgen_udp',
                        'memcached_get+trafgen_udp']
 trafgen_workloads = ['trafgen_tcp', 'trafgen_udp']
 
+# Events for which the count per packet is computed
+PER_PACKET_EVENTS = ['cycles', 'instructions', 'cache-misses']
+# Per class counters recorded from the tc class dumps
+TC_COUNTERS = ['sent_bytes', 'sent_pkts', 'dropped', 'overlimits', 'requeues',
+               'backlog_bytes', 'backlog_pkts']
+
+# Number of lines at the start of the sniffer log saved for reference
+SNF_HEAD_LINES = 20000
+
+
 # Used to load data from a picked file to variables
 def readPickledFile(infile):
     fd = open(infile, 'rb')
@@ -63,59 +108,41 @@ def readPickledFile(infile):
     return data
 
 
-def pickleSnfFile(snf_file, pickle_dir, stats_dir, max_lines=100000):
+# snf_file can be a filename or an open file object with the sniffer log.
+# The log is read only once to parse the data and save the head sample.
+# With binary=True, snf_file is a capture in the binary format.
+def pickleSnfFile(snf_file, store, stats_dir, max_lines=100000,
+                  columnar=True, binary=False):
 
     # Parse the sniffer log file
-    sniff = SnifferParser(snf_file, max_lines=max_lines)
-
-    # Pickle burstlen_pkt data
-    # Pickle the actual data and summary separately
-    burstlen_pkt_pfile = os.path.join(pickle_dir, 'burstlen_pkt.txt')
-    burstlen_pkt_summary_pfile = os.path.join(pickle_dir,
-                                              'burstlen_pkt_summary.txt')
-    burstlen_pkt = sniff.get_burstlen_pkt()
-    summary_burstlen_pkt = sniff.summary_burstlen_pkt()
-    fd = open(burstlen_pkt_pfile, 'wb')
-    cPickle.dump(burstlen_pkt, fd)
-    fd.close()
-    fd = open(burstlen_pkt_summary_pfile, 'wb')
-    cPickle.dump(summary_burstlen_pkt, fd)
-    fd.close()
+    sniff = SnifferParser(snf_file, max_lines=max_lines, columnar=columnar,
+                          head_lines=SNF_HEAD_LINES, binary=binary)
 
-    # Pickle burstlen_nsec data
-    # Pickle the actual data and summary separately
-    burstlen_nsec_pfile = os.path.join(pickle_dir, 'burstlen_nsec.txt')
-    burstlen_nsec_summary_pfile = os.path.join(pickle_dir,
-                                               'burstlen_nsec_summary.txt')
-    burstlen_nsec = sniff.get_burstlen_nsec()
+    # Store the burstlen_pkt, burstlen_nsec and inter-packet arrival time data
+    # for each class as arrays, and their summaries separately
+    summary_burstlen_pkt = sniff.summary_burstlen_pkt()
     summary_burstlen_nsec = sniff.summary_burstlen_nsec()
-    fd = open(burstlen_nsec_pfile, 'wb')
-    cPickle.dump(burstlen_nsec, fd)
-    fd.close()
-    fd = open(burstlen_nsec_summary_pfile, 'wb')
-    cPickle.dump(summary_burstlen_nsec, fd)
-    fd.close()
-
-    # Pickle inter-packet arrival time data
-    ipt_pfile = os.path.join(pickle_dir, 'ipt.txt')
-    ipt_summary_pfile = os.path.join(pickle_dir, 'ipt_summary.txt')
-    ipt = sniff.get_ipt()
     summary_ipt = sniff.summary_ipt()
-    fd = open(ipt_pfile, 'wb')
-    cPickle.dump(ipt, fd)
-    fd.close()
-    fd = open(ipt_summary_pfile, 'wb')
-    cPickle.dump(summary_ipt, fd)
-    fd.close()
-
-    # Pickle packet length data
-    pkt_len_freq_pfile = os.path.join(pickle_dir, 'pkt_len_freq.txt')
+    arrays = {}
+    for (name, data) in [('burstlen_pkt', sniff.get_burstlen_pkt()),
+                         ('burstlen_nsec', sniff.get_burstlen_nsec()),
+                         ('ipt', sniff.get_ipt())]:
+        for (port, arr) in portArrays(data).iteritems():
+            arrays['%s/%s' % (name, port)] = arr
+
+    # Store packet length data
     pkt_len_freq = sniff.get_pkt_len_freq()
     most_freq_pkt_len = sniff.get_most_freq_pkt_length()
-    data = (most_freq_pkt_len, pkt_len_freq)
-    fd = open(pkt_len_freq_pfile, 'wb')
-    cPickle.dump(data, fd)
-    fd.close()
+    pkt_lens = sorted(pkt_len_freq.keys())
+    arrays['pkt_len'] = numpy.array(pkt_lens, dtype=numpy.int64)
+    arrays['pkt_len_freq'] = numpy.array([ pkt_len_freq[l] for l in pkt_lens ],
+                                         dtype=numpy.int64)
+
+    summary = {'burstlen_pkt_summary' : portSummary(summary_burstlen_pkt),
+               'burstlen_nsec_summary' : portSummary(summary_burstlen_nsec),
+               'ipt_summary' : portSummary(summary_ipt),
+               'most_freq_pkt_len' : most_freq_pkt_len}
+    store.put('sniffer', summary, arrays)
 
     # Write stats about the sniffer data
     snf_stats_file = os.path.join(stats_dir, 'snf_stats.txt')
@@ -133,22 +160,20 @@ def pickleSnfFile(snf_file, pickle_dir, stats_dir, max_lines=100000):
 
     # Save first 20000 lines of sniffer file
     snf_head_file = os.path.join(stats_dir, 'pkt_snf_head20000.txt')
-    (head['-n', '20000', snf_file] > snf_head_file)()
+    snf_head_fd = open(snf_head_file, 'w')
+    snf_head_fd.write(sniff.get_head())
+    snf_head_fd.close()
 
 
-def pickleMPStat(mpstat_file, pickle_dir, stats_dir):
+def pickleMPStat(mpstat_file, store, stats_dir):
 
     # Parse the mpstat log file
     mstats = MPStatParser(mpstat_file)
 
-    # Pickle CPU utilization data
-    mpstat_pfile = os.path.join(pickle_dir, 'mpstat_p.txt')
+    # Store CPU utilization data
     kernel_usage = mstats.kernel_usage()
     summary = mstats.summary()
-    data = (kernel_usage, summary)
-    fd = open(mpstat_pfile, 'wb')
-    cPickle.dump(data, fd)
-    fd.close()
+    store.put('mpstat', [kernel_usage, summary])
 
     # Write stats about CPU utilization
     cpu_stats_file = os.path.join(stats_dir, 'cpu_util.txt')
@@ -159,26 +184,89 @@ def pickleMPStat(mpstat_file, pickle_dir, stats_dir):
     cpu_stats_fd.close()
 
 
-def pickleEthstats(ethstats_file, pickle_dir, stats_dir):
+def pickleMPStatCPU(mpstat_all_file, store, stats_dir):
 
-    # Parse the mpstat log file
+    # Parse the per-CPU mpstat log file
+    mstats = MPStatCPUParser(mpstat_all_file)
+
+    # Store the per-CPU utilization time series and summary
+    summary = mstats.summary()
+    store.put('mpstat_cpu', summary, {'usage' : mstats.get_usage()})
+
+    # Write stats about per-CPU utilization
+    cpu_stats_file = os.path.join(stats_dir, 'cpu_util_per_cpu.txt')
+    cpu_stats_fd = open(cpu_stats_file, 'w')
+    writeMPStatCPUSummary(cpu_stats_fd, summary)
+    cpu_stats_fd.close()
+
+
+def writeMPStatCPUSummary(cpu_stats_fd, summary):
+    cpu_stats_fd.write('--- Average usage per CPU ---\n')
+    cpu_stats_fd.write('CPU ')
+    for metric in CPU_METRICS:
+        cpu_stats_fd.write('%8s' % metric)
+    cpu_stats_fd.write('\n')
+    for cpu in xrange(len(summary[CPU_METRICS[0]])):
+        cpu_stats_fd.write('%3d ' % cpu)
+        for metric in CPU_METRICS:
+            cpu_stats_fd.write('%8.2f' % summary[metric][cpu])
+        cpu_stats_fd.write('\n')
+    cpu_stats_fd.write('Highest kernel usage on CPU %s\n' % summary['hot_cpu'])
+
+
+# host_files is a list of (host, mpstat-all.txt of the host). The summaries are
+# stored keyed by host, and the usage of each host as mpstat_cpu_mc/<host>.
+def pickleMPStatCPUMC(host_files, store, stats_dir):
+
+    summaries = {}
+    arrays = {}
+    for (host, mpstat_all_file) in host_files:
+        mstats = MPStatCPUParser(mpstat_all_file)
+        summaries[host] = mstats.summary()
+        arrays[host] = mstats.get_usage()
+    store.put('mpstat_cpu_mc', summaries, arrays)
+
+    # Write stats about per-CPU utilization of each host
+    cpu_stats_file = os.path.join(stats_dir, 'cpu_util_per_cpu.txt')
+    cpu_stats_fd = open(cpu_stats_file, 'w')
+    for (host, mpstat_all_file) in host_files:
+        cpu_stats_fd.write('=== %s ===\n' % host)
+        writeMPStatCPUSummary(cpu_stats_fd, summaries[host])
+    cpu_stats_fd.close()
+
+
+def pickleEthstats(ethstats_file, store, stats_dir):
+
+    # Parse the ethstats log file
     estats = EthstatsParser(ethstats_file)
 
-    # Pickle CPU utilization data
-    ethstats_pfile = os.path.join(pickle_dir, 'net_p.txt')
+    # Store network utilization data. The summary of the default interface is
+    # kept at the top level. The summaries and time series of all metrics of
+    # all interfaces are stored too.
     summary = estats.summary()
-    fd = open(ethstats_pfile, 'wb')
-    cPickle.dump(summary, fd)
-    fd.close()
+    iface_summaries = estats.summaries()
+    arrays = {}
+    for iface in estats.get_ifaces():
+        for metric in METRICS:
+            arrays['%s/%s' % (iface, metric)] = estats.get_series(iface,
+                                                                  metric)
+    store.put('ethstats', dict(summary, ifaces=iface_summaries), arrays)
 
     # Write stats about network utilization
     net_stats_file = os.path.join(stats_dir, 'net_util.txt')
     net_stats_fd = open(net_stats_file, 'w')
     net_stats_fd.write(str(summary))
+    net_stats_fd.write('\n--- Per interface statistics ---\n')
+    for iface in estats.get_ifaces():
+        net_stats_fd.write('---- %s ----\n' % iface)
+        for metric in METRICS:
+            net_stats_fd.write('%s: %s\n' % (metric,
+                                             iface_summaries[iface][metric]))
     net_stats_fd.close()
 
 
-def pickleMcperf(mcperf_files, pickle_dir, stats_dir):
+# hosts is the tuple (servers, clients) from the hosts file
+def pickleMcperf(mcperf_files, hosts, store, stats_dir):
 
     agg_mc_hists = []
     agg_reqrs = []
@@ -189,28 +277,13 @@ def pickleMcperf(mcperf_files, pickle_dir, stats_dir):
     agg_rspss = []
     cli_mcperf_summary = {}
 
-    # Parse the mcperf log files and compute per client summaries
-    for (client, client_files) in mcperf_files:
-        mc_hists = []
-        reqrs = []
-        rsprs = []
-        reqsizes = []
-        rspsizes = []
-        reqss = []
-        rspss = []
-        for mcperf_file in client_files:
-            mcstats = McperfParser(mcperf_file)
-            mc_hists.append(mcstats.get_hist())
-            reqrs.append(mcstats.get_reqr())
-            rsprs.append(mcstats.get_rspr())
-            reqsizes.append(mcstats.get_reqsize())
-            rspsizes.append(mcstats.get_rspsize())
-            reqss.append(mcstats.get_reqs())
-            rspss.append(mcstats.get_rsps())
-        (agg_hist,
-         mcperf_summary) = summarizeMcStats(mc_hists, reqrs, rsprs,
-                                            reqsizes, rspsizes,
-                                            reqss, rspss)
+    # Parse and summarize the log files of each client in parallel
+    client_results = summarizeMcperfClients(
+            [ client_files for (client, client_files) in mcperf_files ])
+
+    # Collect per client summaries
+    for ((client, client_files),
+         (agg_hist, mcperf_summary)) in zip(mcperf_files, client_results):
         cli_mcperf_summary[client] = mcperf_summary
         agg_mc_hists.append(agg_hist)
         agg_reqrs.append(mcperf_summary['agg_reqr'])
@@ -227,17 +300,11 @@ def pickleMcperf(mcperf_files, pickle_dir, stats_dir):
                                             agg_reqsizes, agg_rspsizes,
                                             agg_reqss, agg_rspss)
 
-    # Pickle mcperf histogram data
-    mcperf_pfile = os.path.join(pickle_dir, 'mcperf_p.txt')
-    fd = open(mcperf_pfile, 'wb')
-    cPickle.dump(agg_hist, fd)
-    fd.close()
-
-    # Pickle mcperf latency summary
-    mcperf_summary_pfile = os.path.join(pickle_dir, 'mcperf_summary_p.txt')
-    fd = open(mcperf_summary_pfile, 'wb')
-    cPickle.dump(agg_mcperf_summary, fd)
-    fd.close()
+    # Store mcperf histogram data, latency summary and hosts info
+    (hist_lat, hist_count) = agg_hist.to_arrays()
+    arrays = {'hist_lat' : hist_lat, 'hist_count' : hist_count}
+    store.put('mcperf', {'summary' : agg_mcperf_summary,
+                         'hosts' : list(hosts)}, arrays)
 
     # Write stats about memcached latencies
     mcperf_stats_file = os.path.join(stats_dir, 'mcperf.txt')
@@ -250,6 +317,32 @@ def pickleMcperf(mcperf_files, pickle_dir, stats_dir):
     mcperf_stats_fd.close()
 
 
+# Parses the mcperf log files of a single client and returns the combined
+# histogram and summary of the client (see summarizeMcStats)
+def summarizeMcperfClient(client_files):
+    return summarizeMcStats(*parseMcperfFiles(client_files, processes=1))
+
+
+# Summarizes the mcperf logs of each client (a list with the list of log files
+# of every client) with a pool of worker processes. Only the combined histogram
+# and summary of each client are sent back to this process, which reduces them
+# into the overall summary. Returns a list of (histogram, summary) tuples in
+# the order of the clients.
+# The clients are summarized serially if this is a daemon process (Eg. a worker
+# of plotGraphs), which can not start its own workers.
+def summarizeMcperfClients(client_files_list):
+    if (len(client_files_list) <= 1 or
+        multiprocessing.current_process().daemon):
+        return map(summarizeMcperfClient, client_files_list)
+    pool = multiprocessing.Pool(min(len(client_files_list),
+                                    multiprocessing.cpu_count()))
+    try:
+        return pool.map(summarizeMcperfClient, client_files_list)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def writeMcperfSummary(fd, summary):
     fd.write('Aggregate request rate = %s req/s\n' % str(summary['agg_reqr']))
     fd.write('Aggregate response rate = %s rsp/s\n' % str(summary['agg_rspr']))
@@ -264,14 +357,13 @@ def writeMcperfSummary(fd, summary):
     fd.write('  pc999   = %s\n' % str(summary['lat_pc999']))
 
 
+# mc_hists is a list of LatencyHistogram objects. Returns the combined histogram
+# and a summary of the stats.
 def summarizeMcStats(mc_hists, reqrs, rsprs,
                      reqsizes, rspsizes, reqss, rspss):
 
     # Compute combined histogram
-    agg_hist = dict()
-    for hist in mc_hists:
-        agg_hist.update({k:v+hist[k] for k,v in agg_hist.iteritems() if k in hist})
-        agg_hist.update({k:v for k,v in hist.iteritems() if k not in agg_hist})
+    agg_hist = mergeHistograms(mc_hists)
 
     # Compute total request and response rates
     agg_reqr = sum(reqrs)
@@ -286,14 +378,8 @@ def summarizeMcStats(mc_hists, reqrs, rsprs,
     avg_rspsize = numpy.average(rspsizes, weights = reqss)
 
     # Compute CDF and find avg, median, pc99, pc999 latencies
-    sorted_hist = sorted(agg_hist.items())
-    w_sum = sum(map(lambda (k,v): float(k)*float(v), sorted_hist))
-    cum_sum = numpy.cumsum(map(lambda (k,v): v, sorted_hist))
-    num_samples = cum_sum[-1]
-    lat_avg = w_sum / num_samples
-    lat_median = sorted_hist[bisect.bisect(cum_sum, num_samples * 50 / 100)][0]
-    lat_pc99 = sorted_hist[bisect.bisect(cum_sum, num_samples * 99 / 100)][0]
-    lat_pc999 = sorted_hist[bisect.bisect(cum_sum, int(num_samples * 99.9/100))][0]
+    lat_avg = agg_hist.mean()
+    (lat_median, lat_pc99, lat_pc999) = agg_hist.percentiles([50, 99, 99.9])
 
     # Pickle mcperf latency summary
     mcperf_summary = { 'agg_reqr'   : agg_reqr,
@@ -310,7 +396,7 @@ def summarizeMcStats(mc_hists, reqrs, rsprs,
 
 
 def pickleMPStatMC(client_mpstat_files, server_mpstat_files,
-                   pickle_dir, stats_dir):
+                   store, stats_dir):
 
     client_usage = []
     server_usage = []
@@ -334,15 +420,11 @@ def pickleMPStatMC(client_mpstat_files, server_mpstat_files,
     srv_summary = "user: %.2f, sys: %.2f, sirq: %.2f" % (
             srv_muser, srv_msys, srv_msirq)
 
-    # Pickle CPU utilization data
-    mpstat_pfile = os.path.join(pickle_dir, 'mpstat_mc_p.txt')
+    # Store CPU utilization data
     cli_kernel_usage = cli_msys + cli_msirq
     srv_kernel_usage = srv_msys + srv_msirq
-    summary = mstats.summary()
-    data = (cli_kernel_usage, cli_summary, srv_kernel_usage, srv_summary)
-    fd = open(mpstat_pfile, 'wb')
-    cPickle.dump(data, fd)
-    fd.close()
+    store.put('mpstat_mc', [cli_kernel_usage, cli_summary,
+                            srv_kernel_usage, srv_summary])
 
     # Write stats about CPU utilization
     cpu_stats_file = os.path.join(stats_dir, 'cpu_util.txt')
@@ -356,39 +438,42 @@ def pickleMPStatMC(client_mpstat_files, server_mpstat_files,
     cpu_stats_fd.close()
 
 
-def pickleTrafgen(hosts, logs_dir, pickle_dir, stats_dir):
+# Returns the total trafgen goodput (Mbps) sent and received by a host, as a
+# tuple (tx, rx)
+def trafgenGoodput(host, logs_dir):
+    # Make a list of trafgen log files for the host
+    trafgen_server_files = glob.glob(os.path.join(logs_dir, host,
+                                     'trafgen_server-t*.txt'))
+    trafgen_client_files = glob.glob(os.path.join(logs_dir, host,
+                                     'trafgen_client-t*-*.txt'))
+
+    tx_rate_mbps = 0.0
+    rx_rate_mbps = 0.0
+    # Parse the trafgen client log files
+    for trafgen_file in trafgen_client_files:
+        trafgenstats = TrafgenParser(trafgen_file)
+        tx_rate_mbps += trafgenstats.get_avg_rate()
+
+    # Parse the trafgen server log files
+    for trafgen_file in trafgen_server_files:
+        trafgenstats = TrafgenParser(trafgen_file)
+        rx_rate_mbps += trafgenstats.get_avg_rate()
+
+    return (tx_rate_mbps, rx_rate_mbps)
+
+
+def pickleTrafgen(hosts, logs_dir, store, stats_dir):
 
     host_tx_goodput = dict()
     host_rx_goodput = dict()
 
     # Iterate through hosts and collect stats
     for host in hosts:
-        # Make a list of trafgen log files for the host
-        trafgen_server_files = glob.glob(os.path.join(logs_dir, host,
-                                         'trafgen_server-t*.txt'))
-        trafgen_client_files = glob.glob(os.path.join(logs_dir, host,
-                                         'trafgen_client-t*-*.txt'))
-
-        tx_rate_mbps = 0.0
-        rx_rate_mbps = 0.0
-        # Parse the trafgen client log files
-        for trafgen_file in trafgen_client_files:
-            trafgenstats = TrafgenParser(trafgen_file)
-            tx_rate_mbps += trafgenstats.get_avg_rate()
-
-        # Parse the trafgen server log files
-        for trafgen_file in trafgen_server_files:
-            trafgenstats = TrafgenParser(trafgen_file)
-            rx_rate_mbps += trafgenstats.get_avg_rate()
-
-        host_tx_goodput[host] = tx_rate_mbps
-        host_rx_goodput[host] = rx_rate_mbps
-
-    # Pickle trafgen goodput data
-    trafgen_pfile = os.path.join(pickle_dir, 'trafgen_p.txt')
-    fd = open(trafgen_pfile, 'wb')
-    cPickle.dump((host_tx_goodput, host_rx_goodput), fd)
-    fd.close()
+        (host_tx_goodput[host],
+         host_rx_goodput[host]) = trafgenGoodput(host, logs_dir)
+
+    # Store trafgen goodput data
+    store.put('trafgen', [host_tx_goodput, host_rx_goodput])
 
     # Write stats about network utilization
     trafgen_stats_file = os.path.join(stats_dir, 'trafgen.txt')
@@ -401,12 +486,178 @@ def pickleTrafgen(hosts, logs_dir, pickle_dir, stats_dir):
     trafgen_stats_fd.close()
 
 
-def allFilesGenerated(category, pickle_dir, stats_dir):
-    res = True
-    for filename in pickled_files[category]:
-        filename = os.path.join(pickle_dir, filename)
-        if not os.path.exists(filename):
-            res = False
+# Returns the count of each of PER_PACKET_EVENTS per packet. The count is None
+# if the event was not counted or no packets were seen.
+def perPacketCounts(totals, packets):
+    ret = {}
+    for event in PER_PACKET_EVENTS:
+        ret[event] = None
+        if event in totals and packets > 0:
+            ret[event] = totals[event] / packets
+    return ret
+
+
+# Returns the number of packets per second sent and received on the NIC, from
+# the mean packet rates in the ethstats log net_file
+def ethstatsPacketRate(net_file):
+    estats = EthstatsParser(net_file)
+    return (estats.iface_summary(estats.iface, 'pkts_in')['mean'] +
+            estats.iface_summary(estats.iface, 'pkts_out')['mean'])
+
+
+# perf_files is a list of (host, perf log file) tuples. pkt_rates maps each
+# host to the number of packets per second it sent and received during the
+# experiment.
+def picklePerfStat(perf_files, pkt_rates, store, stats_dir):
+
+    host_summaries = {}
+    arrays = {}
+    agg_totals = {}
+    agg_packets = 0.0
+
+    # Parse the perf log files and compute per host summaries
+    for (host, perf_file) in perf_files:
+        pstats = PerfStatParser(perf_file)
+        totals = pstats.totals()
+        elapsed = pstats.get_elapsed()
+        packets = pkt_rates.get(host, 0.0) * (elapsed or 0.0)
+        host_summaries[host] = {'elapsed' : elapsed,
+                                'packets' : packets,
+                                'totals' : totals,
+                                'per_pkt' : perPacketCounts(totals, packets)}
+        for event in pstats.get_events():
+            arrays['%s/%s' % (host, event)] = pstats.get_counts(event)
+        for event in PER_PACKET_EVENTS:
+            if event in totals:
+                agg_totals[event] = agg_totals.get(event, 0.0) + totals[event]
+        agg_packets += packets
+
+    # Store the per-CPU counters and the summaries
+    summary = {'hosts' : host_summaries,
+               'packets' : agg_packets,
+               'per_pkt' : perPacketCounts(agg_totals, agg_packets)}
+    store.put('perf', summary, arrays)
+
+    # Write stats about the counters
+    perf_stats_file = os.path.join(stats_dir, 'perf_counters.txt')
+    perf_stats_fd = open(perf_stats_file, 'w')
+    writePerPacketCounts(perf_stats_fd, summary)
+    perf_stats_fd.write('--- Per host statistics ---\n')
+    for (host, perf_file) in perf_files:
+        perf_stats_fd.write('---- %s ----\n' % host)
+        writePerPacketCounts(perf_stats_fd, host_summaries[host])
+        for (event, total) in sorted(host_summaries[host]['totals'].items()):
+            perf_stats_fd.write('  %s = %.0f\n' % (event, total))
+    perf_stats_fd.close()
+
+
+def writePerPacketCounts(fd, summary):
+    fd.write('Packets = %.0f\n' % summary['packets'])
+    for event in PER_PACKET_EVENTS:
+        count = summary['per_pkt'][event]
+        if count is None:
+            fd.write('%s/packet = n/a\n' % event)
+        else:
+            fd.write('%s/packet = %.1f\n' % (event, count))
+
+
+# Returns the rate accuracy summary of the classes, given arrays with the
+# configured rate (NaN if unknown) and the measured average rate (Mbps) of each
+# class. Idle classes and classes without a configured rate are ignored.
+# - fairness = Jain's fairness index of the measured/configured rate ratios
+# - mean_rate_error, max_rate_error = Relative error of the measured rates
+def summarizeClassAccuracy(classids, configured, rates):
+    valid = (numpy.nan_to_num(configured) > 0) & (rates > 0)
+    summary = {'num_active_classes' : int(valid.sum()),
+               'fairness' : None,
+               'mean_rate_error' : None,
+               'max_rate_error' : None,
+               'worst_class' : None}
+    if not valid.any():
+        return summary
+    ratios = rates[valid] / configured[valid]
+    errors = numpy.abs(ratios - 1)
+    worst = errors.argmax()
+    summary['fairness'] = (ratios.sum() ** 2 /
+                           (len(ratios) * (ratios ** 2).sum()))
+    summary['mean_rate_error'] = errors.mean()
+    summary['max_rate_error'] = errors[worst]
+    summary['worst_class'] = numpy.asarray(classids)[valid][worst]
+    return summary
+
+
+# class_dump_files is a list of dumps of tc -s class show, and class_stats_file
+# is the class-stats.txt (or .bin) time series (or None if it was not
+# recorded)
+def pickleTcClass(class_dump_files, class_stats_file, store, stats_dir):
+
+    # Parse the class dumps and the class rate time series
+    classes = {}
+    leaves = set()
+    for dump_file in class_dump_files:
+        tstats = TcClassParser(dump_file)
+        classes.update(tstats.classes)
+        leaves.update(tstats.get_leaf_classids())
+    cstats = None
+    if class_stats_file is not None:
+        cstats = ClassStatsParser(class_stats_file)
+        for classid in cstats.get_classids():
+            classes.setdefault(classid, {})
+    classids = sorted(classes.keys(), key=classidKey)
+
+    # Per class arrays, in the order of classids
+    arrays = {'classids' : numpy.array(classids, dtype=str)}
+    arrays['configured_mbps'] = numpy.array(
+            [ classes[classid].get('configured_mbps')
+              for classid in classids ], dtype=numpy.float64)
+    for counter in TC_COUNTERS:
+        arrays[counter] = numpy.array(
+                [ classes[classid].get(counter, 0) for classid in classids ],
+                dtype=numpy.int64)
+    rates = numpy.zeros(len(classids))
+    if cstats is not None:
+        positions = dict((c, i) for (i, c) in enumerate(classids))
+        index = [ positions[classid] for classid in cstats.get_classids() ]
+        rates[index] = cstats.get_avg_rates()
+        for column in ['rate', 'drops', 'backlog']:
+            if cstats.has_column(column):
+                series = numpy.zeros((len(classids),
+                                      cstats.get_series(column).shape[1]))
+                series[index] = cstats.get_series(column)
+                arrays[column + '_series'] = series
+    arrays['avg_rate_mbps'] = rates
+
+    # Only leaf classes are counted in the totals, since the counters of HTB
+    # inner classes include their children
+    summary = summarizeClassAccuracy(classids, arrays['configured_mbps'],
+                                     rates)
+    summary['num_classes'] = len(classids)
+    for counter in ['dropped', 'overlimits', 'requeues']:
+        summary[counter] = sum(classes[classid].get(counter, 0)
+                               for classid in leaves)
+    store.put('tc_class', summary, arrays)
+
+    # Write stats about the classes
+    tc_stats_file = os.path.join(stats_dir, 'tc_class.txt')
+    tc_stats_fd = open(tc_stats_file, 'w')
+    for key in sorted(summary.keys()):
+        tc_stats_fd.write('%s = %s\n' % (key, summary[key]))
+    tc_stats_fd.write('--- Per class statistics ---\n')
+    tc_stats_fd.write('%-10s %12s %12s %10s %10s %12s\n' % (
+            'class', 'conf (Mbps)', 'rate (Mbps)', 'dropped', 'overlimits',
+            'backlog (B)'))
+    for (i, classid) in enumerate(classids):
+        tc_stats_fd.write('%-10s %12.3f %12.3f %10d %10d %12d\n' % (
+                classid, arrays['configured_mbps'][i], rates[i],
+                arrays['dropped'][i], arrays['overlimits'][i],
+                arrays['backlog_bytes'][i]))
+    tc_stats_fd.close()
+
+
+# Checks if the data of the category is in the experiment store and all its
+# stats files exist
+def allFilesGenerated(category, stored, stats_dir):
+    res = stored.has_category(category)
     for filename in stats_files[category]:
         filename = os.path.join(stats_dir, filename)
         if not os.path.exists(filename):
@@ -414,103 +665,338 @@ def allFilesGenerated(category, pickle_dir, stats_dir):
     return res
 
 
-def main(argv):
-    # Parse flags
-    args = parser.parse_args()
+# Returns the signature (size, mtime and sha1) of a source log file, or None if
+# the file does not exist. If the size and mtime match the old signature, the
+# file is assumed to be unchanged and its hash is not recomputed.
+def sourceSignature(filename, old_sig=None):
+    if not os.path.exists(filename):
+        return None
+    st = os.stat(filename)
+    sig = {'size' : st.st_size, 'mtime' : st.st_mtime}
+    if (old_sig is not None and old_sig['size'] == sig['size'] and
+        old_sig['mtime'] == sig['mtime']):
+        sig['sha1'] = old_sig['sha1']
+        return sig
+    sha1 = hashlib.sha1()
+    fd = open(filename, 'rb')
+    while True:
+        block = fd.read(1<<20)
+        if not block:
+            break
+        sha1.update(block)
+    fd.close()
+    sig['sha1'] = sha1.hexdigest()
+    return sig
+
+
+def sourceHashes(sigs):
+    return dict((relpath, sig and sig['sha1'])
+                for (relpath, sig) in sigs.iteritems())
 
+
+def readManifest(pickle_dir):
+    manifest_file = os.path.join(pickle_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_file):
+        return {}
+    fd = open(manifest_file, 'r')
+    try:
+        manifest = json.load(fd)
+    except ValueError:
+        manifest = {}
+    fd.close()
+    return manifest
+
+
+def writeManifest(pickle_dir, manifest):
+    # Write to a temp file first so that an interrupted run never leaves a
+    # truncated manifest behind
+    manifest_file = os.path.join(pickle_dir, MANIFEST_FILE)
+    fd = open(manifest_file + '.tmp', 'w')
+    json.dump(manifest, fd, indent=1, sort_keys=True)
+    fd.close()
+    os.rename(manifest_file + '.tmp', manifest_file)
+
+
+# Compares the source logs of a category against the manifest.
+# Returns a tuple (changed, entry) where changed is True if the category has to
+# be pickled again, i.e. its outputs are missing, its parser version was bumped
+# or the contents of any of its source logs changed. entry is the new manifest
+# entry for the category.
+def checkCategory(category, sources, expt_dir, stored, stats_dir,
+                  manifest):
+    old_entry = manifest.get(category, {})
+    old_sigs = old_entry.get('sources', {})
+    sigs = {}
+    for filename in sources:
+        relpath = os.path.relpath(filename, expt_dir)
+        sigs[relpath] = sourceSignature(filename, old_sigs.get(relpath))
+    entry = {'parser_version' : PARSER_VERSIONS[category], 'sources' : sigs}
+
+    changed = (not allFilesGenerated(category, stored, stats_dir) or
+               old_entry.get('parser_version') != entry['parser_version'] or
+               sourceHashes(old_sigs) != sourceHashes(sigs))
+    return (changed, entry)
+
+
+# Records the manifest entries of the categories that have been pickled (or
+# found to be up to date).
+def updateManifest(entries, pickle_dir, manifest):
+    changed = False
+    for (category, entry) in entries.iteritems():
+        if manifest.get(category) != entry:
+            manifest[category] = entry
+            changed = True
+    if changed:
+        writeManifest(pickle_dir, manifest)
+
+
+# Pickles the logs of a single experiment directory into the experiment store
+# (pickled/expt_store.npz, see ExptStore). A manifest of the source logs of
+# each category is kept in the pickled directory, and only the categories whose
+# source logs (or parser version) changed since they were last pickled are
+# regenerated, unless force_rewrite is set.
+# The summaries and tags of the experiment are then added to the summary index
+# index_file, or to the index in the nearest parent directory if index_file is
+# None (see summaryIndex).
+# Raises ValueError if the workload of the experiment is not recognized.
+def pickleExptDir(expt_dir, force_rewrite=False, snf_binary=False,
+                  index_file=None):
     # Read the workload type for the experiment directory
-    workload = readDirTagFileProperty(args.expt_dir, 'workload')
+    workload = readDirTagFileProperty(expt_dir, 'workload')
     if (not workload in trafgen_workloads and
         not workload in memcached_workloads):
-       print 'Workload not recognized for expt: %s' % args.expt_dir
-       sys.exit(1)
+        raise ValueError('Workload not recognized for expt: %s' % expt_dir)
 
     # Create directory for pickled files
-    pickle_dir = os.path.join(args.expt_dir, 'pickled')
+    pickle_dir = os.path.join(expt_dir, 'pickled')
     if not os.path.exists(pickle_dir):
         os.makedirs(pickle_dir)
 
     # Create directory for saving statistics
-    stats_dir = os.path.join(args.expt_dir, 'stats')
+    stats_dir = os.path.join(expt_dir, 'stats')
     if not os.path.exists(stats_dir):
         os.makedirs(stats_dir)
 
+    manifest = readManifest(pickle_dir)
+    stored = ExptStore(expt_dir)
+    store = ExptStoreWriter(pickle_dir)
+    entries = {}
+    try:
+        pickleWorkload(workload, expt_dir, stored, store, stats_dir,
+                       manifest, entries, force_rewrite, snf_binary)
+    finally:
+        # Save the data of all categories pickled so far, even if a later one
+        # failed, and record them in the manifest
+        store.commit()
+        updateManifest(entries, pickle_dir, manifest)
+
+    # Update the summary index
+    if index_file is None:
+        index_file = findSummaryIndex(expt_dir)
+    if index_file is not None:
+        updateSummaryIndex(index_file, expt_dir,
+                           ExptStore(expt_dir).summaries,
+                           readDirTagFile(expt_dir))
+
+
+# Pickles each category of the workload into store if it changed since it was
+# last pickled. The manifest entry of each category that was pickled (or found
+# to be up to date) is added to entries.
+def pickleWorkload(workload, expt_dir, stored, store, stats_dir,
+                   manifest, entries, force_rewrite, snf_binary):
+
     # Pickle data for trafgen workloads
     if workload in trafgen_workloads:
 
-        # Temp directory to extract the sniffer data and pickle it
-        snf_data_dir = os.path.join(args.tmp_dir, 'snf_data')
-        if not os.path.exists(snf_data_dir):
-            os.makedirs(snf_data_dir)
-
-        # Extract the sniffer data to the temp directory
-        snf_tarfile = os.path.join(args.expt_dir, 'logs/pkt_snf.tar.gz')
-        tar = tarfile.open(snf_tarfile)
-        tar.extractall(snf_data_dir)
-        tar.close()
-
-        # Pickle sniffer data if required
-        if (args.force_rewrite or
-            not allFilesGenerated('sniffer', pickle_dir, stats_dir)):
-            pickleSnfFile(os.path.join(snf_data_dir, 'pkt_snf.txt'),
-                          pickle_dir, stats_dir, max_lines = 1000000)
+        # Pickle sniffer data if required. The sniffer log is streamed out of
+        # the tarball, and the columnar parser is fast enough to process the
+        # whole capture. If a binary copy of the capture exists, it is
+        # memory-mapped instead.
+        snf_tarfile = os.path.join(expt_dir, 'logs/pkt_snf.tar.gz')
+        snf_binfile = os.path.join(expt_dir, 'logs/pkt_snf.snfbin')
+        (changed, entry) = checkCategory('sniffer', [snf_tarfile], expt_dir,
+                                         stored, stats_dir, manifest)
+        # A binary copy of an older capture is stale, and so is one without
+        # the head of the text log (written by older versions)
+        if (os.path.exists(snf_binfile) and
+            (manifest.get('sniffer', {}).get('sources') != entry['sources'] or
+             readSnfBinaryHead(snf_binfile) is None)):
+            os.remove(snf_binfile)
+        if snf_binary and not os.path.exists(snf_binfile):
+            tar = tarfile.open(snf_tarfile, 'r|gz')
+            convertSnfToBinary(openSnfTarMember(tar), snf_binfile,
+                               head_lines=SNF_HEAD_LINES)
+            tar.close()
+        if force_rewrite or changed:
+            if os.path.exists(snf_binfile):
+                pickleSnfFile(snf_binfile, store, stats_dir,
+                              max_lines = None, binary = True)
+            else:
+                tar = tarfile.open(snf_tarfile, 'r|gz')
+                pickleSnfFile(openSnfTarMember(tar), store, stats_dir,
+                              max_lines = None)
+                tar.close()
+        entries['sniffer'] = entry
 
         # Pickle mpstat data
-        if (args.force_rewrite or
-            not allFilesGenerated('mpstat', pickle_dir, stats_dir)):
-            pickleMPStat(os.path.join(args.expt_dir, 'logs/mpstat.txt'),
-                         pickle_dir, stats_dir)
+        mpstat_file = os.path.join(expt_dir, 'logs/mpstat.txt')
+        (changed, entry) = checkCategory('mpstat', [mpstat_file], expt_dir,
+                                         stored, stats_dir, manifest)
+        if force_rewrite or changed:
+            pickleMPStat(mpstat_file, store, stats_dir)
+        entries['mpstat'] = entry
+
+        # Pickle per-CPU mpstat data (only recorded by newer experiments)
+        mpstat_all_file = os.path.join(expt_dir, 'logs/mpstat-all.txt')
+        if os.path.exists(mpstat_all_file):
+            (changed, entry) = checkCategory('mpstat_cpu', [mpstat_all_file],
+                                             expt_dir, stored, stats_dir,
+                                             manifest)
+            if force_rewrite or changed:
+                pickleMPStatCPU(mpstat_all_file, store, stats_dir)
+            entries['mpstat_cpu'] = entry
 
         # Pickle ethstats data
-        if (args.force_rewrite or
-            not allFilesGenerated('ethstats', pickle_dir, stats_dir)):
-            pickleEthstats(os.path.join(args.expt_dir, 'logs/net.txt'),
-                           pickle_dir, stats_dir)
+        net_file = os.path.join(expt_dir, 'logs/net.txt')
+        (changed, entry) = checkCategory('ethstats', [net_file], expt_dir,
+                                         stored, stats_dir, manifest)
+        if force_rewrite or changed:
+            pickleEthstats(net_file, store, stats_dir)
+        entries['ethstats'] = entry
+
+        # Pickle tc class statistics of the rate limiter if they were recorded
+        class_dump_files = [ os.path.join(expt_dir, 'logs', name)
+                             for name in ['qfq-stats.txt', 'htb-class.txt'] ]
+        class_dump_files = filter(os.path.exists, class_dump_files)
+        # Binary logs are recorded by newer versions of class-rate.py
+        class_stats_files = [ os.path.join(expt_dir, 'logs', name)
+                              for name in ['class-stats.bin',
+                                           'class-stats.txt'] ]
+        class_stats_files = filter(os.path.exists, class_stats_files)
+        class_stats_file = None
+        if class_stats_files:
+            class_stats_file = class_stats_files[0]
+        if class_dump_files or class_stats_file is not None:
+            sources = class_dump_files + filter(None, [class_stats_file])
+            (changed, entry) = checkCategory('tc_class', sources, expt_dir,
+                                             stored, stats_dir, manifest)
+            if force_rewrite or changed:
+                pickleTcClass(class_dump_files, class_stats_file, store,
+                              stats_dir)
+            entries['tc_class'] = entry
+
+        # Pickle perf counters if they were recorded. Packets are counted from
+        # the packet rates of the NIC in the ethstats log.
+        perf_file = os.path.join(expt_dir, 'logs/perf.txt')
+        if os.path.exists(perf_file):
+            (changed, entry) = checkCategory('perf', [perf_file, net_file],
+                                             expt_dir, stored, stats_dir,
+                                             manifest)
+            if force_rewrite or changed:
+                picklePerfStat([('client', perf_file)],
+                               {'client' : ethstatsPacketRate(net_file)},
+                               store, stats_dir)
+            entries['perf'] = entry
 
     # Pickle data for memcached workloads
     elif workload in memcached_workloads:
 
         # Read the list of server and client machines used for the experiment
-        (servers, clients) = parseHostsFile(os.path.join(args.expt_dir,
-                                                         'logs/hostsfile.txt'))
+        hosts_file = os.path.join(expt_dir, 'logs/hostsfile.txt')
+        (servers, clients) = parseHostsFile(hosts_file)
 
         # Pickle mcperf data
-        if (args.force_rewrite or
-            not allFilesGenerated('mcperf', pickle_dir, stats_dir)):
-
-            # Pickle hosts info separately
-            hosts_pfile = os.path.join(pickle_dir, 'hosts_p.txt')
-            fd = open(hosts_pfile, 'wb')
-            cPickle.dump((servers, clients), fd)
-            fd.close()
-
-            mcperf_files = []
-            for client in clients:
-                files = glob.glob(os.path.join(args.expt_dir, 'logs',
-                                  client, 'mcperf-t*-c*-*.txt'))
-                mcperf_files.append((client, files))
-
-            pickleMcperf(mcperf_files, pickle_dir, stats_dir)
+        mcperf_files = []
+        for client in clients:
+            files = glob.glob(os.path.join(expt_dir, 'logs',
+                              client, 'mcperf-t*-c*-*.txt'))
+            mcperf_files.append((client, files))
+        sources = [hosts_file] + [ f for (client, files) in mcperf_files
+                                   for f in files ]
+        (changed, entry) = checkCategory('mcperf', sources, expt_dir,
+                                         stored, stats_dir, manifest)
+        if force_rewrite or changed:
+            pickleMcperf(mcperf_files, (servers, clients), store, stats_dir)
+        entries['mcperf'] = entry
 
         # Pickle mpstat data for clients and servers
-        if (args.force_rewrite or
-            not allFilesGenerated('mpstat_mc', pickle_dir, stats_dir)):
-            client_mpstat_files = [ os.path.join(args.expt_dir, 'logs',
-                                                 client, 'mpstat.txt')
-                                    for client in clients ]
-            server_mpstat_files = [ os.path.join(args.expt_dir, 'logs',
-                                                 server, 'mpstat.txt')
-                                    for server in servers ]
-
+        client_mpstat_files = [ os.path.join(expt_dir, 'logs',
+                                             client, 'mpstat.txt')
+                                for client in clients ]
+        server_mpstat_files = [ os.path.join(expt_dir, 'logs',
+                                             server, 'mpstat.txt')
+                                for server in servers ]
+        sources = [hosts_file] + client_mpstat_files + server_mpstat_files
+        (changed, entry) = checkCategory('mpstat_mc', sources, expt_dir,
+                                         stored, stats_dir, manifest)
+        if force_rewrite or changed:
             pickleMPStatMC(client_mpstat_files, server_mpstat_files,
-                           pickle_dir, stats_dir)
+                           store, stats_dir)
+        entries['mpstat_mc'] = entry
+
+        # Pickle per-CPU mpstat data of the hosts that recorded it (only
+        # newer experiments)
+        mpstat_all_files = [ (host, os.path.join(expt_dir, 'logs', host,
+                                                 'mpstat-all.txt'))
+                             for host in servers + clients ]
+        mpstat_all_files = [ (host, f) for (host, f) in mpstat_all_files
+                             if os.path.exists(f) ]
+        if mpstat_all_files:
+            sources = [hosts_file] + [ f for (host, f) in mpstat_all_files ]
+            (changed, entry) = checkCategory('mpstat_cpu_mc', sources,
+                                             expt_dir, stored, stats_dir,
+                                             manifest)
+            if force_rewrite or changed:
+                pickleMPStatCPUMC(mpstat_all_files, store, stats_dir)
+            entries['mpstat_cpu_mc'] = entry
 
         # Pickle trafgen data
-        if (args.force_rewrite or
-            not allFilesGenerated('trafgen', pickle_dir, stats_dir)):
-            hosts = clients + servers
-            pickleTrafgen(hosts, os.path.join(args.expt_dir, 'logs'),
-                          pickle_dir, stats_dir)
+        hosts = clients + servers
+        sources = [hosts_file]
+        for host in hosts:
+            sources += glob.glob(os.path.join(expt_dir, 'logs', host,
+                                              'trafgen_*-t*.txt'))
+        (changed, entry) = checkCategory('trafgen', sources, expt_dir,
+                                         stored, stats_dir, manifest)
+        if force_rewrite or changed:
+            pickleTrafgen(hosts, os.path.join(expt_dir, 'logs'),
+                          store, stats_dir)
+        entries['trafgen'] = entry
+
+        # Pickle perf counters of the hosts that recorded them. Packets
+        # (memcached requests and responses, and trafgen packets) are counted
+        # from the NIC packet rates in the ethstats log of each host.
+        perf_files = []
+        net_files = []
+        for host in hosts:
+            perf_file = os.path.join(expt_dir, 'logs', host, 'perf.txt')
+            if os.path.exists(perf_file):
+                perf_files.append((host, perf_file))
+                net_file = os.path.join(expt_dir, 'logs', host, 'net.txt')
+                if os.path.exists(net_file):
+                    net_files.append((host, net_file))
+        if perf_files:
+            (changed, entry) = checkCategory(
+                    'perf', [hosts_file] +
+                    [ f for (host, f) in perf_files + net_files ],
+                    expt_dir, stored, stats_dir, manifest)
+            if force_rewrite or changed:
+                pkt_rates = dict((host, ethstatsPacketRate(net_file))
+                                 for (host, net_file) in net_files)
+                picklePerfStat(perf_files, pkt_rates, store, stats_dir)
+            entries['perf'] = entry
+
+
+def main(argv):
+    # Parse flags
+    args = parser.parse_args()
+
+    try:
+        pickleExptDir(args.expt_dir, args.force_rewrite, args.snf_binary,
+                      args.index_file)
+    except ValueError as e:
+        print e
+        sys.exit(1)
 
 
 if __name__ == '__main__':
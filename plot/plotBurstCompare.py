@@ -5,8 +5,10 @@ import numpy
 import os
 import sys
 
-from pickleExptLogs import readPickledFile
+from ExptStore import readExptData
 from expsiftUtils import *
+from summaryIndex import findExptDirs
+from summaryIndex import loadSummaryIndex
 from plotCompare import plotClusterBarComparisonDirs
 from plotCompare import getRateMbpsFromPropValSet
 from plotCompare import getNClassesFromPropValSet
@@ -26,9 +28,7 @@ parser.add_argument('-r', dest='recursive', action='store_true',
 def getAvgBurstLenPkt(directory):
     # Read the sniffer pickle file and return the average burst length in
     # packets
-    burstlen_pkt_summary_pfile = os.path.join(
-            directory, 'pickled/burstlen_pkt_summary.txt')
-    summary = readPickledFile(burstlen_pkt_summary_pfile)
+    summary = readExptData(directory, 'burstlen_pkt_summary.txt')
     avg_burstlen = numpy.average(map(lambda port: summary[port][0],
                                      summary.keys()))
     return avg_burstlen
@@ -37,9 +37,7 @@ def getAvgBurstLenPkt(directory):
 def getAvgBurstLenUsec(directory):
     # Read the sniffer pickle file and return the average burst length in
     # usecs (convert from nsecs)
-    burstlen_nsec_summary_pfile = os.path.join(
-            directory, 'pickled/burstlen_nsec_summary.txt')
-    summary = readPickledFile(burstlen_nsec_summary_pfile)
+    summary = readExptData(directory, 'burstlen_nsec_summary.txt')
     avg_burstlen = (numpy.average(map(lambda port: summary[port][0],
                                       summary.keys())) / 1000.0)
     return avg_burstlen
@@ -48,9 +46,7 @@ def getAvgBurstLenUsec(directory):
 def getPc99BurstLenUsec(directory):
     # Read the sniffer pickle file and return the average of pc99 burst length
     # in usecs (convert from nsecs)
-    burstlen_nsec_summary_pfile = os.path.join(
-            directory, 'pickled/burstlen_nsec_summary.txt')
-    summary = readPickledFile(burstlen_nsec_summary_pfile)
+    summary = readExptData(directory, 'burstlen_nsec_summary.txt')
     avg_pc99_burstlen = (numpy.average(map(lambda port: summary[port][1],
                                            summary.keys())) / 1000.0)
     return avg_pc99_burstlen
@@ -130,12 +126,7 @@ def main(argv):
     expt_dirs = []
     if args.recursive:
         for directory in args.expt_dirs:
-            directory = os.path.abspath(directory)
-            for (path, dirs, files) in os.walk(directory, followlinks=True):
-                # Check if an experiment directory was found
-                if os.path.exists(os.path.join(path, 'expsift_tags')):
-                    #print 'Found experiment directory:', path
-                    expt_dirs.append(path)
+            expt_dirs.extend(findExptDirs(directory))
         print 'Found %d experiment directories to compare' % len(expt_dirs)
     else:
         expt_dirs = args.expt_dirs
@@ -144,8 +135,9 @@ def main(argv):
     if len(expt_dirs) == 0:
         return
 
-    # Read the properties for each directory from the expsift tags files
-    dir2props_dict = getDir2PropsDict(expt_dirs)
+    # Read the properties and summaries for each directory from the summary
+    # index (or the expsift tags files if the directories are not indexed)
+    dir2props_dict = loadSummaryIndex(expt_dirs)
 
     # Plot burstlen_pkt comparison graph
     _, _, _, _, burstlen_pkt_plot_layout = (
@@ -1,11 +1,18 @@
 #!/usr/bin/env python
 
 import argparse
+import matplotlib
+matplotlib.rcParams['backend'] = 'Agg'
+from matplotlib import pyplot
 import os
 import sys
 
-from pickleExptLogs import readPickledFile
+from ExptStore import openExptStore
+from ExptStore import readExptData
+from MPStatCPUParser import METRICS
 from expsiftUtils import *
+from summaryIndex import findExptDirs
+from summaryIndex import loadSummaryIndex
 from plotCompare import plotClusterBarComparisonDirs
 from plotCompare import getRateMbpsFromPropValSet
 from plotCompare import getNClassesFromPropValSet
@@ -20,15 +27,67 @@ parser.add_argument('plot_filename', help='Filename for the graph')
 parser.add_argument('-r', dest='recursive', action='store_true',
                     help='Recursively look for experiment directories under '
                          'each specified directory')
+parser.add_argument('--heatmap', dest='heatmap_filename', default=None,
+                    help='Filename for a heatmap of the per-CPU utilization '
+                         'over time of each experiment')
+parser.add_argument('--heatmap_metric', dest='heatmap_metric',
+                    choices=METRICS, default='soft',
+                    help='CPU utilization metric shown in the heatmap '
+                         '(default: soft)')
 
 
 def getKernelCPUUtil(directory):
     # Read the mpstat pickle file and return the kernel CPU utilization
-    mpstat_pfile = os.path.join(directory, 'pickled/mpstat_p.txt')
-    (kernel_usage, summary) = readPickledFile(mpstat_pfile)
+    (kernel_usage, summary) = readExptData(directory, 'mpstat_p.txt')
     return kernel_usage
 
 
+# Returns the utilization of the given metric of every CPU over time as a list
+# of (host, array of shape (CPUs, samples)). The host is None for trafgen
+# experiments, which record one log, and the list is empty if per-CPU data was
+# not recorded for the experiment.
+def getPerCPUUtil(directory, metric):
+    store = openExptStore(directory)
+    ret = []
+    if store.has_category('mpstat_cpu'):
+        usage = store.get_array('mpstat_cpu/usage')
+        ret.append((None, usage[:, :, METRICS.index(metric)]))
+    if store.has_category('mpstat_cpu_mc'):
+        arrays = store.get_arrays('mpstat_cpu_mc')
+        for host in sorted(arrays.keys()):
+            ret.append((host, arrays[host][:, :, METRICS.index(metric)]))
+    return ret
+
+
+# Returns a figure with a heatmap of the per-CPU utilization over time for each
+# experiment (and each host of memcached experiments) that recorded per-CPU
+# data. It shows whether the kernel overhead
+# (Eg. soft IRQs) is concentrated on the cores that handle NIC interrupts.
+def plotCPUHeatmapDirs(dir2props_dict, metric='soft'):
+    common_props, unique_props = getCommonAndUniqueProperties(dir2props_dict)
+    heatmaps = []
+    for directory in sorted(dir2props_dict.keys()):
+        for (host, util) in getPerCPUUtil(directory, metric):
+            label = ', '.join(sorted(unique_props[directory]))
+            if host is not None:
+                label = '%s (%s)' % (label, host)
+            heatmaps.append((label, util))
+    heatmaps.sort(key=lambda (label, util): label)
+
+    fig = pyplot.figure(figsize=(10, 2.5 * max(len(heatmaps), 1)))
+    for (index, (label, util)) in enumerate(heatmaps):
+        ax = fig.add_subplot(len(heatmaps), 1, index + 1)
+        image = ax.imshow(util, aspect='auto', interpolation='nearest',
+                          origin='lower', vmin=0, vmax=100)
+        ax.set_title(label, fontsize='small')
+        ax.set_ylabel('CPU')
+        if index == len(heatmaps) - 1:
+            ax.set_xlabel('Time (s)')
+        fig.colorbar(image, ax=ax).set_label('%%%s' % metric)
+    fig.tight_layout()
+    return fig
+
+
 # Returns the CPU comparison summary graph
 def plotCPUComparisonDirs(dir2props_dict = {}):
     return plotClusterBarComparisonDirs(
@@ -66,12 +125,7 @@ def main(argv):
     expt_dirs = []
     if args.recursive:
         for directory in args.expt_dirs:
-            directory = os.path.abspath(directory)
-            for (path, dirs, files) in os.walk(directory, followlinks=True):
-                # Check if an experiment directory was found
-                if os.path.exists(os.path.join(path, 'expsift_tags')):
-                    #print 'Found experiment directory:', path
-                    expt_dirs.append(path)
+            expt_dirs.extend(findExptDirs(directory))
         print 'Found %d experiment directories to compare' % len(expt_dirs)
     else:
         expt_dirs = args.expt_dirs
@@ -80,13 +134,19 @@ def main(argv):
     if len(expt_dirs) == 0:
         return
 
-    # Read the properties for each directory from the expsift tags files
-    dir2props_dict = getDir2PropsDict(expt_dirs)
+    # Read the properties and summaries for each directory from the summary
+    # index (or the expsift tags files if the directories are not indexed)
+    dir2props_dict = loadSummaryIndex(expt_dirs)
 
     # Plot CPU comparison graph
     _, _, _, _, cpu_plot_layout = plotCPUComparisonDirs(dir2props_dict)
     cpu_plot_layout.save(args.plot_filename)
 
+    # Plot per-CPU utilization heatmaps
+    if args.heatmap_filename is not None:
+        fig = plotCPUHeatmapDirs(dir2props_dict, args.heatmap_metric)
+        fig.savefig(args.heatmap_filename)
+
 
 if __name__ == '__main__':
     main(sys.argv)
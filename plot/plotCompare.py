@@ -187,13 +187,20 @@ def plotClusterBarComparisonDirs(dir2props_dict, # dict
 
     # 10. Compute average and stddev for each (subplot, majorgroup, cluster)
     #     combination. This represents the avg and stddev across multiple
-    #     trials. Add these to the corresponding bar graphs.
+    #     trials. Add these to the corresponding bar graphs. Datapoints that
+    #     are None (not available for the directory) are left out, and no bar
+    #     is drawn if none are available.
     for subplot, subplot_dict in datapoints_dict.iteritems():
         for majorgroup, majorgroup_dict in subplot_dict.iteritems():
             bar_values = []
             for cluster, datapoints in majorgroup_dict.iteritems():
-                avg = numpy.average(datapoints)
-                stddev = numpy.std(datapoints)
+                datapoints = [ d for d in datapoints if d is not None ]
+                if not datapoints:
+                    avg = numpy.nan
+                    stddev = 0
+                else:
+                    avg = numpy.average(datapoints)
+                    stddev = numpy.std(datapoints)
 
                 # Append an (xValue, yValue, yError) tuple
                 bar_values.append((cluster2xValue_dict[cluster], avg, stddev))
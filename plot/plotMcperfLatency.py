@@ -8,7 +8,8 @@ import numpy
 import os
 import sys
 
-from pickleExptLogs import readPickledFile
+from ExptStore import readExptData
+from LatencyHistogram import histFromDict
 
 
 parser = argparse.ArgumentParser(description='Plot mcperf latency data')
@@ -22,16 +23,16 @@ parser.add_argument('--force_replot', '-f', dest='force_replot',
 
 # Return a CDF line from histogram data
 #
-# @hist : List of tuples representing the histogram. Each tuple contains the
-#         sample value and frequency
+# @hist : LatencyHistogram, or a dict that maps each sample value to its
+#         frequency
 def cdfLineFromHist(hist, color="blue", width=2):
-    sorted_hist = sorted(hist.items())
-    cum_sum = numpy.cumsum(map(lambda (k,v): v, sorted_hist))
-    num_samples = cum_sum[-1]
+    if isinstance(hist, dict):
+        hist = histFromDict(hist)
+    (values, cdf) = hist.cdf()
 
     cdf_line = boomslang.Line(color=color, width=width)
-    cdf_line.xValues = map(lambda (k,v): k, sorted_hist)
-    cdf_line.yValues = map(lambda y: y * 1.0 / num_samples, cum_sum)
+    cdf_line.xValues = values.tolist()
+    cdf_line.yValues = cdf.tolist()
 
     return cdf_line
 
@@ -42,8 +43,8 @@ def cdfLineFromHist(hist, color="blue", width=2):
 # 3. pc99 VLine : (99th percentile) in red color
 # 4. pc99 VLine : (99.9th percentile) in magenta color
 #
-# @hist : List of tuples representing the histogram. Each tuple contains the
-#         sample value and frequency
+# @hist : LatencyHistogram, or a dict that maps each sample value to its
+#         frequency
 def plotCDFGraphFromHist(hist, avg, pc99, pc999,
                          xLabel, yLabel, title):
 
@@ -96,11 +97,8 @@ def plotCDFGraphFromHist(hist, avg, pc99, pc999,
 # Plot CDF of burst lengths in packets for each traffic class
 def plotMcperfLatency(directory):
     # Read latency histogram from the mcperf pickled files
-    mcperf_pfile = os.path.join(directory, 'pickled/mcperf_p.txt')
-    mcperf_summary_pfile = os.path.join(
-            directory, 'pickled/mcperf_summary_p.txt')
-    agg_hist = readPickledFile(mcperf_pfile)
-    mcperf_summary = readPickledFile(mcperf_summary_pfile)
+    agg_hist = readExptData(directory, 'mcperf_p.txt')
+    mcperf_summary = readExptData(directory, 'mcperf_summary_p.txt')
 
     return plotCDFGraphFromHist(agg_hist, mcperf_summary['lat_avg'],
                                 mcperf_summary['lat_pc99'],
@@ -110,15 +108,22 @@ def plotMcperfLatency(directory):
                                 "CDF of memcached transaction latency")
 
 
+# Plots the memcached latency graphs of an experiment. Graphs that already
+# exist are skipped unless force_replot is set.
+def plotMcperfLatencyGraphs(expt_dir, plotfile_prefix, force_replot=False):
+    # Plot memcached latency in microseconds
+    if (force_replot or
+        not os.path.exists(plotfile_prefix + 'mcperf_lat_cdf.png')):
+        mclat_plot = plotMcperfLatency(expt_dir)
+        mclat_plot.save(plotfile_prefix + 'mcperf_lat_cdf.png')
+
+
 def main(argv):
     # Parse flags
     args = parser.parse_args()
 
-    # Plot memcached latency in microseconds
-    if (args.force_replot or
-        not os.path.exists(args.plotfile_prefix + 'mcperf_lat_cdf.png')):
-        mclat_plot = plotMcperfLatency(args.expt_dir)
-        mclat_plot.save(args.plotfile_prefix + 'mcperf_lat_cdf.png')
+    plotMcperfLatencyGraphs(args.expt_dir, args.plotfile_prefix,
+                            args.force_replot)
 
 
 if __name__ == '__main__':
@@ -9,8 +9,12 @@ import numpy
 import os
 import sys
 
-from pickleExptLogs import readPickledFile
+from ExptStore import readExptData
+from LatencyHistogram import LatencyHistogram
+from LatencyHistogram import histFromDict
 from expsiftUtils import *
+from summaryIndex import findExptDirs
+from summaryIndex import loadSummaryIndex
 from plotMcperfLatency import cdfLineFromHist
 from plotCompare import plotLineComparisonDirs
 
@@ -41,37 +45,30 @@ def serverLoadFromMcrate(mcrate_val_set, mctenants = 1, numclients = 1):
 
 def getAvgLatency(directory):
     # Read the mcperf pickle file and return the average latency
-    mcperf_summary_pfile = os.path.join(
-            directory, 'pickled/mcperf_summary_p.txt')
-    mcperf_summary = readPickledFile(mcperf_summary_pfile)
+    mcperf_summary = readExptData(directory, 'mcperf_summary_p.txt')
     return mcperf_summary['lat_avg']
 
 
 def getpc99Latency(directory):
     # Read the mcperf pickle file and return the average latency
-    mcperf_summary_pfile = os.path.join(
-            directory, 'pickled/mcperf_summary_p.txt')
-    mcperf_summary = readPickledFile(mcperf_summary_pfile)
+    mcperf_summary = readExptData(directory, 'mcperf_summary_p.txt')
     return mcperf_summary['lat_pc99']
 
 
 def getpc999Latency(directory):
     # Read the mcperf pickle file and return the average latency
-    mcperf_summary_pfile = os.path.join(
-            directory, 'pickled/mcperf_summary_p.txt')
-    mcperf_summary = readPickledFile(mcperf_summary_pfile)
+    mcperf_summary = readExptData(directory, 'mcperf_summary_p.txt')
     return mcperf_summary['lat_pc999']
 
 
 # Returns the CDF of latency line for the mcperf experiment directory
 def getLatencyCDF(directory):
     # Read latency histogram from the mcperf pickled files
-    mcperf_pfile = os.path.join(directory, 'pickled/mcperf_p.txt')
-    agg_hist = readPickledFile(mcperf_pfile)
+    agg_hist = histFromDict(readExptData(directory, 'mcperf_p.txt'))
 
     if FOR_PAPER:
         # Convert usec sample values to msec
-        agg_hist = {k / 1000.0: v for k, v in agg_hist.items()}
+        agg_hist = LatencyHistogram(agg_hist.values / 1000.0, agg_hist.counts)
 
     return cdfLineFromHist(agg_hist)
 
@@ -79,8 +76,7 @@ def getLatencyCDF(directory):
 # Find the client and server machines used for the experiment
 def getServersAndClients(directory):
     # Read the hosts info pickle file
-    hosts_pfile = os.path.join(directory, 'pickled/hosts_p.txt')
-    (servers, clients) = readPickledFile(hosts_pfile)
+    (servers, clients) = readExptData(directory, 'hosts_p.txt')
     return (servers, clients)
 
 
@@ -256,12 +252,7 @@ def main(argv):
     expt_dirs = []
     if args.recursive:
         for directory in args.expt_dirs:
-            directory = os.path.abspath(directory)
-            for (path, dirs, files) in os.walk(directory, followlinks=True):
-                # Check if an experiment directory was found
-                if os.path.exists(os.path.join(path, 'expsift_tags')):
-                    #print 'Found experiment directory:', path
-                    expt_dirs.append(path)
+            expt_dirs.extend(findExptDirs(directory))
         print 'Found %d experiment directories to compare' % len(expt_dirs)
     else:
         expt_dirs = args.expt_dirs
@@ -270,8 +261,9 @@ def main(argv):
     if len(expt_dirs) == 0:
         return
 
-    # Read the properties for each directory from the expsift tags files
-    dir2props_dict = getDir2PropsDict(expt_dirs)
+    # Read the properties and summaries for each directory from the summary
+    # index (or the expsift tags files if the directories are not indexed)
+    dir2props_dict = loadSummaryIndex(expt_dirs)
 
     # Plot memcached latency comparison graph (microseconds)
     mclat_plot = plotMcperfLatencyCDFComparisonDirs(dir2props_dict)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import sys
+
+from ExptStore import readExptData
+from expsiftUtils import *
+from summaryIndex import findExptDirs
+from summaryIndex import loadSummaryIndex
+from plotCompare import plotClusterBarComparisonDirs
+from plotCompare import getSysConfLabel
+from plotCompare import getRateMbpsFromPropValSet
+from plotCompare import getNClassesFromPropValSet
+from plotCompare import sortRateValSets
+from plotCompare import sortNClassesValSets
+from pickleExptLogs import PER_PACKET_EVENTS
+
+
+RL_ORDER = { 'htb' : 1, 'eyeq' : 2, 'qfq' : 3, 'hwrl' : 4, 'none' : 5 }
+
+
+parser = argparse.ArgumentParser(description='Plot per packet CPU overhead '
+                                 'comparison graph')
+parser.add_argument('expt_dirs', nargs='+', help='Experiment directories')
+parser.add_argument('plot_filename', help='Filename for the graph')
+parser.add_argument('-r', dest='recursive', action='store_true',
+                    help='Recursively look for experiment directories under '
+                         'each specified directory')
+parser.add_argument('-e', dest='event', choices=PER_PACKET_EVENTS,
+                    default='cycles',
+                    help='Hardware event counted per packet (default: cycles)')
+
+
+def getPerPacketCount(directory, event):
+    # Read the perf pickle file and return the event count per packet over
+    # all hosts, or None if no packets were counted for the experiment (Eg.
+    # hosts without an ethstats log)
+    perf_summary = readExptData(directory, 'perf_p.txt')
+    count = perf_summary['per_pkt'][event]
+    if count is None:
+        print 'No packet count for %s, its %s per packet is n/a' % (
+                directory, event)
+    return count
+
+
+def getIntFromPropValSet(prop_val_set, prop):
+    return int(getPropsDict(prop_val_set)[prop])
+
+
+def sortRLValSets(rl_val_sets):
+    rl_val_sets.sort(key = lambda rl_val_set:
+                     RL_ORDER.get(getPropsDict(rl_val_set).get('rl'),
+                                  len(RL_ORDER) + 1))
+
+
+# Returns the kind of workload ('memcached' or 'trafgen') of the experiments.
+# Raises ValueError if the experiments have different kinds of workloads, as
+# their graphs have different layouts.
+def getWorkloadKind(dir2props_dict):
+    kinds = set(getPropsDict(props).get('workload', '').split('_')[0]
+                for props in dir2props_dict.values())
+    if len(kinds) != 1:
+        raise ValueError('Cannot compare experiments of different workloads: '
+                         '%s' % ', '.join(sorted(kinds)))
+    return kinds.pop()
+
+
+# Returns the per packet overhead comparison graph of memcached experiments.
+# There is a cluster of bars for each memcached request rate, with a bar for
+# each rate limiter.
+def plotMcPerfComparisonDirs(dir2props_dict = {}, event = 'cycles'):
+    return plotClusterBarComparisonDirs(
+            dir2props_dict,
+
+            subplot_props = ['mctenants'],
+            cluster_props = ['mcrate'],
+            trial_props = ['run'],
+
+            fn_sort_subplots = lambda subplots: subplots.sort(
+                key = lambda mctenants_val_set:
+                    getIntFromPropValSet(mctenants_val_set, 'mctenants')),
+            fn_sort_clusters = lambda clusters: clusters.sort(
+                key = lambda mcrate_val_set:
+                    getIntFromPropValSet(mcrate_val_set, 'mcrate')),
+            fn_sort_majorgroups = lambda majorgroups: sortRLValSets(
+                majorgroups),
+
+            fn_get_subplot_title = (lambda mctenants_val_set:
+                'Memcached tenants: %d' %
+                getIntFromPropValSet(mctenants_val_set, 'mctenants')),
+
+            fn_get_cluster_label = (lambda mcrate_val_set:
+                str(getIntFromPropValSet(mcrate_val_set, 'mcrate'))),
+
+            fn_get_majorgroup_label = (lambda sysconf, common_props:
+                getSysConfLabel(sysconf, common_props)),
+
+            fn_get_datapoint = (lambda directory:
+                getPerPacketCount(directory, event)),
+
+            xLabel = 'Load per tenant per client (reqs/sec)',
+            yLabel = '%s per packet' % event.capitalize())
+
+
+# Returns the per packet overhead comparison graph of trafgen experiments.
+# There is a cluster of bars for each number of classes, with a bar for each
+# rate limiter.
+def plotTrafgenPerfComparisonDirs(dir2props_dict = {}, event = 'cycles'):
+    return plotClusterBarComparisonDirs(
+            dir2props_dict,
+
+            subplot_props = ['rate_mbps'],
+            cluster_props = ['nclasses'],
+            trial_props = ['run'],
+
+            fn_sort_subplots = lambda subplots: sortRateValSets(subplots),
+            fn_sort_clusters = lambda clusters: sortNClassesValSets(clusters),
+            fn_sort_majorgroups = lambda majorgroups: sortRLValSets(
+                majorgroups),
+
+            fn_get_subplot_title = (lambda rate_val_set:
+                'Rate: %s Gbps' %
+                (getRateMbpsFromPropValSet(rate_val_set) / 1000)),
+
+            fn_get_cluster_label = (lambda nclasses_val_set:
+                str(getNClassesFromPropValSet(nclasses_val_set))),
+
+            fn_get_majorgroup_label = (lambda sysconf, common_props:
+                getSysConfLabel(sysconf, common_props)),
+
+            fn_get_datapoint = (lambda directory:
+                getPerPacketCount(directory, event)),
+
+            xLabel = 'Number of classes',
+            yLabel = '%s per packet' % event.capitalize())
+
+
+# Returns the per packet overhead comparison graph, with the layout for the
+# workload of the experiments
+def plotPerfComparisonDirs(dir2props_dict = {}, event = 'cycles'):
+    if getWorkloadKind(dir2props_dict) == 'trafgen':
+        return plotTrafgenPerfComparisonDirs(dir2props_dict, event)
+    return plotMcPerfComparisonDirs(dir2props_dict, event)
+
+
+def main(argv):
+    # Parse flags
+    args = parser.parse_args()
+
+    # Generate the list of experiment directories to compare
+    expt_dirs = []
+    if args.recursive:
+        for directory in args.expt_dirs:
+            expt_dirs.extend(findExptDirs(directory))
+        print 'Found %d experiment directories to compare' % len(expt_dirs)
+    else:
+        expt_dirs = args.expt_dirs
+
+    # Check if any experiment directories were found or not
+    if len(expt_dirs) == 0:
+        return
+
+    # Read the properties and summaries for each directory from the summary
+    # index (or the expsift tags files if the directories are not indexed)
+    dir2props_dict = loadSummaryIndex(expt_dirs)
+
+    # Plot per packet overhead comparison graph
+    try:
+        _, _, _, _, perf_plot_layout = plotPerfComparisonDirs(dir2props_dict,
+                                                              args.event)
+    except ValueError as e:
+        print e
+        sys.exit(1)
+    perf_plot_layout.save(args.plot_filename)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
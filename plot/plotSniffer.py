@@ -8,7 +8,7 @@ import os
 import sys
 
 from SnifferParser import SnifferParser
-from pickleExptLogs import readPickledFile
+from ExptStore import readExptData
 from expsiftUtils import readDirTagFileProperty
 
 
@@ -88,11 +88,8 @@ def plotCDFGraphSimple(cdf_data, avg_data, pc99_data,
 # Plot CDF of burst lengths in packets for each traffic class
 def plotBurstlenPkt(directory):
     # Read burst lengths from the sniffer pickled files
-    burstlen_pkt_pfile = os.path.join(directory, 'pickled/burstlen_pkt.txt')
-    burstlen_pkt_summary_pfile = os.path.join(
-            directory, 'pickled/burstlen_pkt_summary.txt')
-    burstlen_pkt = readPickledFile(burstlen_pkt_pfile)
-    summary = readPickledFile(burstlen_pkt_summary_pfile)
+    burstlen_pkt = readExptData(directory, 'burstlen_pkt.txt')
+    summary = readExptData(directory, 'burstlen_pkt_summary.txt')
     ports = summary.keys()
 
     cdf_data = []
@@ -114,11 +111,8 @@ def plotBurstlenPkt(directory):
 # Plot CDF of burst lengths in microseconds for each traffic class
 def plotBurstlenUsec(directory):
     # Read burst lengths from the sniffer pickled files
-    burstlen_nsec_pfile = os.path.join(directory, 'pickled/burstlen_nsec.txt')
-    burstlen_nsec_summary_pfile = os.path.join(
-            directory, 'pickled/burstlen_nsec_summary.txt')
-    burstlen_nsec = readPickledFile(burstlen_nsec_pfile)
-    summary = readPickledFile(burstlen_nsec_summary_pfile)
+    burstlen_nsec = readExptData(directory, 'burstlen_nsec.txt')
+    summary = readExptData(directory, 'burstlen_nsec_summary.txt')
     ports = summary.keys()
 
     cdf_data = []
@@ -141,15 +135,13 @@ def plotBurstlenUsec(directory):
 # Plot CDF of inter-packet arrival times microseconds for each traffic class
 def plotIpt(directory):
     # Read inter-packet arrival times from the sniffer pickled files
-    ipt_pfile = os.path.join(directory, 'pickled/ipt.txt')
-    ipt_summary_pfile = os.path.join(directory, 'pickled/ipt_summary.txt')
-    ipt = readPickledFile(ipt_pfile)
-    summary = readPickledFile(ipt_summary_pfile)
+    ipt = readExptData(directory, 'ipt.txt')
+    summary = readExptData(directory, 'ipt_summary.txt')
     ports = summary.keys()
 
     # Read packet lengths from sniffer pickled files
-    pkt_len_freq_pfile = os.path.join(directory, 'pickled/pkt_len_freq.txt')
-    (most_freq_pkt_len, pkt_len_freq) = readPickledFile(pkt_len_freq_pfile)
+    (most_freq_pkt_len, pkt_len_freq) = readExptData(directory,
+                                                     'pkt_len_freq.txt')
 
     cdf_data = []
     avg_data = []
@@ -186,27 +178,33 @@ def plotIpt(directory):
     return plot
 
 
-def main(argv):
-    # Parse flags
-    args = parser.parse_args()
-
+# Plots all sniffer graphs of an experiment. Graphs that already exist are
+# skipped unless force_replot is set.
+def plotSnifferGraphs(expt_dir, plotfile_prefix, force_replot=False):
     # Plot inter-packet arrival time in microseconds
-    if (args.force_replot or
-        not os.path.exists(args.plotfile_prefix + 'ipt.png')):
-        ipt_plot = plotIpt(args.expt_dir)
-        ipt_plot.save(args.plotfile_prefix + 'ipt.png')
+    if (force_replot or
+        not os.path.exists(plotfile_prefix + 'ipt.png')):
+        ipt_plot = plotIpt(expt_dir)
+        ipt_plot.save(plotfile_prefix + 'ipt.png')
 
     # Plot burstlen in packets
-    if (args.force_replot or
-        not os.path.exists(args.plotfile_prefix + 'burstlen_pkt.png')):
-        burstlen_pkt_plot = plotBurstlenPkt(args.expt_dir)
-        burstlen_pkt_plot.save(args.plotfile_prefix + 'burstlen_pkt.png')
+    if (force_replot or
+        not os.path.exists(plotfile_prefix + 'burstlen_pkt.png')):
+        burstlen_pkt_plot = plotBurstlenPkt(expt_dir)
+        burstlen_pkt_plot.save(plotfile_prefix + 'burstlen_pkt.png')
 
     # Plot burstlen in microseconds
-    if (args.force_replot or
-        not os.path.exists(args.plotfile_prefix + 'burstlen_usec.png')):
-        burstlen_usec_plot = plotBurstlenUsec(args.expt_dir)
-        burstlen_usec_plot.save(args.plotfile_prefix + 'burstlen_usec.png')
+    if (force_replot or
+        not os.path.exists(plotfile_prefix + 'burstlen_usec.png')):
+        burstlen_usec_plot = plotBurstlenUsec(expt_dir)
+        burstlen_usec_plot.save(plotfile_prefix + 'burstlen_usec.png')
+
+
+def main(argv):
+    # Parse flags
+    args = parser.parse_args()
+
+    plotSnifferGraphs(args.expt_dir, args.plotfile_prefix, args.force_replot)
 
 
 if __name__ == '__main__':
@@ -9,8 +9,10 @@ import numpy
 import os
 import sys
 
-from pickleExptLogs import readPickledFile
+from ExptStore import readExptData
 from expsiftUtils import *
+from summaryIndex import findExptDirs
+from summaryIndex import loadSummaryIndex
 from plotCompare import plotLineComparisonDirs
 
 
@@ -41,8 +43,8 @@ def serverLoadFromMcrate(mcrate_val_set, mctenants = 1, numclients = 1):
 def getServerAvgTxRate(directory):
     # Read the trafgen pickle file and return the average trafgen Tx rate on
     # server machines
-    trafgen_pfile = os.path.join(directory, 'pickled/trafgen_p.txt')
-    (host_tx_goodput, host_rx_goodput) = readPickledFile(trafgen_pfile)
+    (host_tx_goodput, host_rx_goodput) = readExptData(directory,
+                                                      'trafgen_p.txt')
 
     # Find the list of servers used for the experiment
     servers, clients = getServersAndClients(directory)
@@ -56,8 +58,7 @@ def getServerAvgTxRate(directory):
 # Find the client and server machines used for the experiment
 def getServersAndClients(directory):
     # Read the hosts info pickle file
-    hosts_pfile = os.path.join(directory, 'pickled/hosts_p.txt')
-    (servers, clients) = readPickledFile(hosts_pfile)
+    (servers, clients) = readExptData(directory, 'hosts_p.txt')
     return (servers, clients)
 
 
@@ -146,12 +147,7 @@ def main(argv):
     expt_dirs = []
     if args.recursive:
         for directory in args.expt_dirs:
-            directory = os.path.abspath(directory)
-            for (path, dirs, files) in os.walk(directory, followlinks=True):
-                # Check if an experiment directory was found
-                if os.path.exists(os.path.join(path, 'expsift_tags')):
-                    #print 'Found experiment directory:', path
-                    expt_dirs.append(path)
+            expt_dirs.extend(findExptDirs(directory))
         print 'Found %d experiment directories to compare' % len(expt_dirs)
     else:
         expt_dirs = args.expt_dirs
@@ -160,8 +156,9 @@ def main(argv):
     if len(expt_dirs) == 0:
         return
 
-    # Read the properties for each directory from the expsift tags files
-    dir2props_dict = getDir2PropsDict(expt_dirs)
+    # Read the properties and summaries for each directory from the summary
+    # index (or the expsift tags files if the directories are not indexed)
+    dir2props_dict = loadSummaryIndex(expt_dirs)
 
     # Plot trafgen throughput comparison graph
     trafgenrate_plot = plotTrafgenThroughputComparisonDirs(dir2props_dict)
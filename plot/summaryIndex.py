@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+import time
+
+from ExptStore import ExptStore
+from ExptStore import decodeStrings
+from ExptStore import jsonDefault
+from ExptStore import open_stores
+from expsiftUtils import readDirTagFile
+
+
+# Summary index for all experiments under a base directory
+#
+# The index is an SQLite database (expt_summary_index.db) in the base directory.
+# It holds the JSON summaries of every category in the experiment stores (see
+# ExptStore) and the expsift tags of every experiment directory, so that
+# comparison plots can read the summaries of thousands of experiments with a
+# single query instead of opening files in every experiment directory.
+#
+# Rows are only ever appended. When an experiment is repickled, the summaries
+# that changed are appended again and the latest row for each (directory,
+# category) wins. Directories are stored relative to the base directory, so the
+# index remains valid if the base directory is mounted at a different path.
+
+SUMMARY_INDEX_FILE = 'expt_summary_index.db'
+
+
+def openSummaryIndex(index_file):
+    conn = sqlite3.connect(index_file, timeout=60)
+    conn.execute('CREATE TABLE IF NOT EXISTS summaries '
+                 '(directory TEXT, category TEXT, summary TEXT, updated REAL)')
+    conn.execute('CREATE INDEX IF NOT EXISTS summaries_directory '
+                 'ON summaries (directory)')
+    conn.execute('CREATE TABLE IF NOT EXISTS tags '
+                 '(directory TEXT, tags TEXT, updated REAL)')
+    conn.execute('CREATE INDEX IF NOT EXISTS tags_directory '
+                 'ON tags (directory)')
+    return conn
+
+
+# Cache of the index file for each directory that was looked up
+index_locations = {}
+
+
+# Returns the index file in the directory or in the nearest parent directory
+# that has one, or None if there is no such index.
+def findSummaryIndex(directory):
+    directory = os.path.abspath(directory)
+    visited = []
+    index_file = None
+    while True:
+        if directory in index_locations:
+            index_file = index_locations[directory]
+            break
+        visited.append(directory)
+        if os.path.exists(os.path.join(directory, SUMMARY_INDEX_FILE)):
+            index_file = os.path.join(directory, SUMMARY_INDEX_FILE)
+            break
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    for directory in visited:
+        index_locations[directory] = index_file
+    return index_file
+
+
+def indexRelPath(index_file, directory):
+    return os.path.relpath(os.path.abspath(directory),
+                           os.path.dirname(os.path.abspath(index_file)))
+
+
+# Appends the summaries (a dict keyed by category) and the set of prop=val tags
+# of an experiment directory to the index, unless they are unchanged.
+def updateSummaryIndex(index_file, expt_dir, summaries, tags):
+    directory = indexRelPath(index_file, expt_dir)
+    conn = openSummaryIndex(index_file)
+    latest = dict(conn.execute(
+            'SELECT category, summary FROM summaries WHERE rowid IN '
+            '(SELECT MAX(rowid) FROM summaries WHERE directory = ? '
+            'GROUP BY category)', (directory,)))
+    latest_tags = conn.execute(
+            'SELECT tags FROM tags WHERE rowid = '
+            '(SELECT MAX(rowid) FROM tags WHERE directory = ?)',
+            (directory,)).fetchone()
+
+    now = time.time()
+    for (category, summary) in summaries.iteritems():
+        summary = json.dumps(summary, sort_keys=True, default=jsonDefault)
+        if latest.get(category) != summary:
+            conn.execute('INSERT INTO summaries VALUES (?, ?, ?, ?)',
+                         (directory, category, summary, now))
+    tags = '\n'.join(sorted(tags))
+    if latest_tags is None or latest_tags[0] != tags:
+        conn.execute('INSERT INTO tags VALUES (?, ?, ?)',
+                     (directory, tags, now))
+    conn.commit()
+    conn.close()
+
+
+# Reads the latest summaries and tags of all directories in the index.
+# Returns a tuple (summaries, tags): summaries maps each directory to a dict of
+# summaries keyed by category, and tags maps each directory to its set of
+# prop=val strings. Directories are relative to the base directory.
+def readSummaryIndex(index_file):
+    summaries = {}
+    tags = {}
+    conn = openSummaryIndex(index_file)
+    for (directory, category, summary) in conn.execute(
+            'SELECT directory, category, summary FROM summaries '
+            'WHERE rowid IN (SELECT MAX(rowid) FROM summaries '
+            'GROUP BY directory, category)'):
+        directory = directory.encode('utf-8')
+        summaries.setdefault(directory, {})[category.encode('utf-8')] = (
+                decodeStrings(json.loads(summary)))
+    for (directory, dir_tags) in conn.execute(
+            'SELECT directory, tags FROM tags WHERE rowid IN '
+            '(SELECT MAX(rowid) FROM tags GROUP BY directory)'):
+        tags[directory.encode('utf-8')] = set(
+                tag for tag in dir_tags.encode('utf-8').split('\n') if tag)
+    conn.close()
+    return (summaries, tags)
+
+
+# Loads the summaries of the given experiment directories from their summary
+# index, so that readExptData() returns their summaries without opening any
+# file in the experiment directories.
+# Returns a dictionary that maps each directory to its set of prop=val strings
+# (like expsiftUtils.getDir2PropsDict). Tags of directories that are not in an
+# index are read from their expsift_tags files.
+def loadSummaryIndex(directories):
+    dirs_by_index = {}
+    for directory in directories:
+        index_file = findSummaryIndex(directory)
+        dirs_by_index.setdefault(index_file, []).append(directory)
+
+    dir2props_dict = {}
+    for (index_file, index_dirs) in dirs_by_index.iteritems():
+        summaries = {}
+        tags = {}
+        if index_file is not None:
+            (summaries, tags) = readSummaryIndex(index_file)
+        for directory in index_dirs:
+            relpath = None
+            if index_file is not None:
+                relpath = indexRelPath(index_file, directory)
+            if relpath in summaries:
+                open_stores[directory] = ExptStore(directory,
+                                                   summaries[relpath])
+            if relpath in tags:
+                dir2props_dict[directory] = tags[relpath]
+            else:
+                dir2props_dict[directory] = readDirTagFile(directory)
+    return dir2props_dict
+
+
+# Returns the experiment directories under base_dir, found by walking the
+# directory tree looking for expsift_tags files. The tree is always walked, as
+# the summary index only lists the experiments that were pickled; the index is
+# used to read the summaries and tags of the directories found.
+def findExptDirs(base_dir):
+    base_dir = os.path.abspath(base_dir)
+    expt_dirs = []
+    for (path, dirs, files) in os.walk(base_dir, followlinks=True):
+        # Check if an experiment directory was found
+        if os.path.exists(os.path.join(path, 'expsift_tags')):
+            expt_dirs.append(path)
+    return expt_dirs
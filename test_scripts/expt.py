@@ -26,6 +26,8 @@ class Expt(object):
         self._opts.update(opts)
         self._monitors = []
         self.procs = []
+        # Plan (see plan.py) recording the commands of a dry run of start()
+        self.plan = None
 
     def start(self):
         pass
@@ -33,6 +35,12 @@ class Expt(object):
     def stop(self):
         pass
 
+    # Waits for the workload started by start() to finish, for at most timeout
+    # seconds. Experiments whose workload ends by itself override this to
+    # stop waiting as soon as it does.
+    def wait_done(self, timeout):
+        progress(timeout)
+
     def opts(self, name):
         return self._opts.get(name, None)
 
@@ -43,12 +51,19 @@ class Expt(object):
                 os.makedirs(dir)
             self.start()
             t = self.opts('t')
-            progress(t + delta)
+            self.wait_done(t + delta)
         except KeyboardInterrupt:
             self.log("Stopping tests...")
         self.stop_monitors()
         self.stop()
 
+    # Sleeps, or records the sleep in the plan of a dry run
+    def sleep(self, t):
+        if self.plan is not None:
+            self.plan.sleep(t)
+        else:
+            sleep(t)
+
     def start_monitor(self, m):
         self._monitors.append(m)
         m.start()
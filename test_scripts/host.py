@@ -3,35 +3,268 @@ import paramiko
 from subprocess import Popen
 import termcolor as T
 import os
+import sys
 import socket
 from time import sleep
 from site_config import *
-import pexpect
+import transport
 import math
-
+import pipes
+import json
+import threading
+from multiprocessing.pool import ThreadPool
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import conf
+
+
+# Log lines of the calls made by HostList worker threads are buffered per
+# thread, and printed host by host when the calls complete
+_log_buffer = threading.local()
+
+def start_log_buffer():
+    _log_buffer.lines = []
+
+def stop_log_buffer():
+    lines = _log_buffer.lines
+    _log_buffer.lines = None
+    return lines
+
+def log_line(line):
+    lines = getattr(_log_buffer, 'lines', None)
+    if lines is None:
+        print line
+    else:
+        lines.append(line)
+
+class HostListError(Exception):
+    # Raised when a call on a HostList fails on some of the hosts. results is
+    # the list of return values of the hosts (None for the hosts that failed)
+    # and errors maps the address of each failed host to its exception.
+    def __init__(self, name, results, errors):
+        Exception.__init__(self, "%s failed on %s" %
+                           (name, ', '.join(sorted(errors.keys()))))
+        self.results = results
+        self.errors = errors
 
 class HostList(object):
-    def __init__(self, *lst):
+    def __init__(self, *lst, **kwargs):
         self.lst = list(lst)
+        # Maximum number of hosts a call is run on concurrently. With 1, the
+        # call is run on one host after another.
+        self.parallel = max(1, kwargs.get('parallel') or 1)
 
     def append(self, host):
         self.lst.append(host)
 
+    def set_parallel(self, parallel):
+        self.parallel = max(1, parallel or 1)
+
     def __getattribute__(self, name, *args):
         try:
             return object.__getattribute__(self, name)
         except AttributeError:
+            if self.parallel > 1 and len(self.lst) > 1:
+                return lambda *args: self.call_parallel(name, args)
             ret = lambda *args: map(lambda h: h.__getattribute__(name)(*args), self.lst)
             return ret
 
+    # Calls a Host method on each host with the arguments of the host, given
+    # as a list of argument tuples in the order of the hosts
+    def call_each(self, name, args):
+        if self.parallel > 1 and len(self.lst) > 1:
+            return self.call_parallel(name, args, each=True)
+        return [ h.__getattribute__(name)(*a) for (h, a) in zip(self.lst, args) ]
+
+    # Calls a Host method on all hosts using a pool of self.parallel threads.
+    # Returns the results in the order of the hosts, and raises HostListError
+    # if the call failed on any host after all the calls complete. The log
+    # output of each host is printed in order once the calls complete. With
+    # each, args is the list of the arguments of each host.
+    def call_parallel(self, name, args, each=False):
+        def call((h, args)):
+            start_log_buffer()
+            try:
+                out = (h.__getattribute__(name)(*args), None)
+            except Exception, e:
+                out = (None, e)
+            return out + (stop_log_buffer(),)
+
+        if not each:
+            args = [args] * len(self.lst)
+        pool = ThreadPool(min(self.parallel, len(self.lst)))
+        try:
+            outs = pool.map(call, zip(self.lst, args))
+        finally:
+            pool.close()
+            pool.join()
+
+        results = []
+        errors = {}
+        for (h, (ret, err, lines)) in zip(self.lst, outs):
+            for line in lines:
+                log_line(line)
+            results.append(ret)
+            if err is not None:
+                errors[h.addr] = err
+        if errors:
+            raise HostListError(name, results, errors)
+        return results
+
     def __iter__(self):
         return self.lst
 
+# Returns the hash keys for the filters of nclass consecutive dports. More than
+# 256 classes need a second level of hash tables.
+def dport_hash_keys(nclass):
+    if nclass > conf.MAX_BUCKETS:
+        return ['dport', 'dport_hi']
+    return ['dport']
+
+# Plan (see plan.py) that records the commands of the Hosts created while it
+# is set, instead of running them
+_plan = None
+
+def set_plan(plan):
+    global _plan
+    _plan = plan
+
+# Shell conditions for Host.wait_for
+def port_open(port):
+    return "ss -ltn | grep -qE ':%d\\s'" % port
+
+# The program is matched by name with pidof, as pgrep -f would also match the
+# shell that waits for it
+def exited(program):
+    return "! pidof -s %s > /dev/null" % pipes.quote(program)
+
+def running(program):
+    return "pidof -s %s > /dev/null" % pipes.quote(program)
+
+# Returns a shell command that runs each of the commands, with sep between
+# them, and fails if any of them failed
+def all_of(cmds, sep="; "):
+    cmds = [ "{ %s; } || ok=1" % c for c in cmds ]
+    return "ok=0; %s; [ $ok = 0 ]" % sep.join(cmds)
+
 def local_cmd(c):
-    print T.colored(c, "green")
+    log_line(T.colored(c, "green"))
     p = Popen(c, shell=True)
     p.wait()
 
+# Resolver cache, so that the addresses and names of the hosts are looked up
+# once per run. overrides maps an address to a dict with any of 'ip',
+# 'hostname' (its reverse name) and 'control' (its control hostname), which
+# are used instead of looking them up. If cache_file is given, the lookups are
+# also kept on disk across runs.
+class Resolver:
+    def __init__(self, overrides=None, cache_file=None):
+        self.overrides = overrides or {}
+        self.cache_file = cache_file
+        self.lock = threading.Lock()
+        self.cache = {'ip' : {}, 'hostname' : {}}
+        if cache_file and os.path.exists(cache_file):
+            f = open(cache_file)
+            try:
+                self.cache.update(json.load(f))
+            finally:
+                f.close()
+
+    def lookup(self, kind, name, fn):
+        override = self.overrides.get(name, {}).get(kind)
+        if override is not None:
+            return override
+        with self.lock:
+            if name in self.cache[kind]:
+                return self.cache[kind][name]
+        ret = fn(name)
+        with self.lock:
+            self.cache[kind][name] = ret
+            self.save()
+        return ret
+
+    def save(self):
+        if not self.cache_file:
+            return
+        f = open(self.cache_file, 'w')
+        try:
+            json.dump(self.cache, f, indent=1, sort_keys=True)
+        finally:
+            f.close()
+
+    # Returns the IP of the reverse name of an address
+    def ip(self, addr):
+        return self.lookup('ip', addr, lambda addr:
+                           socket.gethostbyname(self.hostname(addr)))
+
+    # Returns the reverse name of an address, or the address if it has none
+    def hostname(self, addr):
+        def reverse(addr):
+            try:
+                return socket.gethostbyaddr(addr)[0]
+            except:
+                return addr
+        return self.lookup('hostname', addr, reverse)
+
+    def control(self, addr):
+        return self.overrides.get(addr, {}).get('control') or controladdr(addr)
+
+resolver = Resolver(config.get('HOST_OVERRIDES'), config.get('RESOLVER_CACHE'))
+
+# Configuration applied to the hosts, kept in a file across the runs of a
+# sweep (see sweep.py) so that a run only applies what changed since the
+# previous one. It maps the address of each host to the value each aspect of
+# its configuration (Eg. 'mtu', 'rl') was set to. Without a file nothing is
+# kept, and every run configures the hosts from scratch.
+class HostState:
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {}
+        if path and os.path.exists(path):
+            f = open(path)
+            try:
+                self.state = json.load(f)
+            finally:
+                f.close()
+
+    # Values are compared as they are kept in the file
+    def normalize(self, value):
+        return json.loads(json.dumps(value))
+
+    def get(self, addr, aspect):
+        with self.lock:
+            return self.state.get(addr, {}).get(aspect)
+
+    def set(self, addr, aspect, value):
+        if not self.path:
+            return
+        with self.lock:
+            self.state.setdefault(addr, {})[aspect] = self.normalize(value)
+            self.save()
+
+    def forget(self, addr, aspect):
+        with self.lock:
+            if aspect in self.state.get(addr, {}):
+                del self.state[addr][aspect]
+                self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        f = open(self.path, 'w')
+        try:
+            json.dump(self.state, f)
+        finally:
+            f.close()
+
+host_state = HostState()
+
+def set_host_state(path):
+    global host_state
+    host_state = HostState(path)
+
 def controladdr(addr):
     # TODO: this is a simple mapping scheme from the 10GbE
     # interface hostname to the control interface hostname.
@@ -50,113 +283,192 @@ class ShellWrapper:
         self.chan.recv_ready()
         return self.chan.recv(10**6)
 
-class SSHWrapper:
-    def __init__(self, ssh):
-        self.ssh = ssh
-
-    def cmd_async(self, cmd):
-        cmd = " (%s;) &" % cmd
-        self.ssh.sendline(cmd)
-        self.ssh.expect(config['PEXPECT_PROMPT'])
-
-    def cmd(self, c):
-        c = " %s" % c
-        self.ssh.sendline(c)
-        self.ssh.expect(config['PEXPECT_PROMPT'])
-
 class Host(object):
-    _ssh_cache = {}
-    _shell_cache = {}
+    _transport_cache = {}
+    # A lock per ssh connection, so that a connection is opened by one thread
+    # when HostList calls hosts in parallel
+    _ssh_locks = {}
+    _ssh_locks_lock = threading.Lock()
     def __init__(self, addr):
         self.addr = addr
-        self.sshaddr = controladdr(addr)
+        self.sshaddr = resolver.control(addr)
         # List of processes spawned async on this host
         self.procs = []
+        # Commands (and whether they are async) collected while delay is set,
+        # to be pipelined by delayed_cmds_execute
         self.delay = False
         self.delayed_cmds = []
-        self.dryrun = False
+        self.plan = _plan
+        self.dryrun = _plan is not None
+        # tc commands collected between start_tc_batch and apply_tc_batch
+        self.tc_batch = None
 
     def set_dryrun(self, state=True):
         self.dryrun = state
 
+    def set_delay(self, state=True):
+        self.delay = state
+
+    def lock(self):
+        with Host._ssh_locks_lock:
+            return Host._ssh_locks.setdefault(self.sshaddr, threading.RLock())
+
+    # Returns the transport to the host (see transport.py), which is shared by
+    # all Host objects of the host. config['TRANSPORT'] selects ssh, or local
+    # to run the commands on this machine. A transport whose shell has exited
+    # (or was killed after a command timed out) is replaced by a new one.
     def get(self):
-        global config
-        ssh = Host._ssh_cache.get(self.sshaddr, None)
-        if ssh is None:
-            ssh = pexpect.spawn("ssh %s" % self.sshaddr, timeout=120)
-            ssh.expect(config['SHELL_PROMPT'])
-            config['PEXPECT_PROMPT'] = '\[PEXPECT\]\$ '
-            ssh.sendline('PS1="[PEXPECT]\$ "')
-            ssh.expect(config['PEXPECT_PROMPT'])
-            Host._ssh_cache[self.sshaddr] = ssh
-        return ssh
+        with self.lock():
+            shell = Host._transport_cache.get(self.sshaddr, None)
+            if shell is None or shell.is_closed():
+                shell = transport.connect(self.sshaddr,
+                                          config.get('TRANSPORT', 'ssh'))
+                Host._transport_cache[self.sshaddr] = shell
+        return shell
 
     def get_shell(self):
-        shell = Host._shell_cache.get(self.addr, None)
-        if shell is None:
-            client = self.get()
-            shell = SSHWrapper(client)
-            Host._shell_cache[self.addr] = shell
-        return shell
+        return self.get()
+
+    # Records a command in the plan of a dry run
+    def record(self, kind, c, tc_ops=None):
+        if self.plan is not None:
+            self.plan.add(self.addr, kind, c, tc_ops)
 
     def cmd(self, c, dryrun=False):
         self.log(c)
         if not self.delay:
             if dryrun or self.dryrun:
+                self.record('cmd', c)
                 return (self.addr, c)
-            ssh = self.get()
             self.get_shell().cmd(c)
             return (self.addr, c)
         else:
-            self.delayed_cmds.append(c)
+            self.delayed_cmds.append((c, False))
         return (self.addr, c)
 
+    # Runs a command and returns its (exit code, output). timeout is the
+    # number of seconds to wait for it (default: Transport.TIMEOUT).
+    def cmd_output(self, c, timeout=None):
+        self.log(c)
+        if self.dryrun:
+            self.record('cmd', c)
+            return (0, '')
+        return self.get_shell().cmd(c, timeout)
+
+    # Runs a command and returns whether it exited with status 0
+    def cmd_ok(self, c):
+        (status, output) = self.cmd_output(c)
+        if status != 0:
+            log_line(T.colored("%s: failed with status %d: %s" %
+                               (self.addr, status, c), "red"))
+        return status == 0
+
+    # Waits until the shell condition holds on the host, checking it every
+    # interval seconds on the host, for at most timeout seconds. Returns
+    # whether the condition holds.
+    def wait_for(self, cond, timeout, interval=0.1):
+        loop = "until %s; do sleep %s; done" % (cond, interval)
+        c = "timeout %s bash -c %s" % (timeout, pipes.quote(loop))
+        (status, output) = self.cmd_output(c, timeout + 10)
+        if status != 0:
+            log_line(T.colored("%s: timed out after %ss waiting for %s" %
+                               (self.addr, timeout, cond), "red"))
+        return status == 0
+
+    def wait_port(self, port, timeout=10):
+        return self.wait_for(port_open(port), timeout)
+
+    def wait_exit(self, program, timeout):
+        return self.wait_for(exited(program), timeout)
+
+    # Waits for a program that was just started async to run and then exit.
+    # cmd_async returns before the program is exec'd, so waiting for it to
+    # exit right away could find it not running yet. Returns whether it was
+    # seen running within start_timeout seconds and exited within timeout.
+    def wait_run(self, program, timeout, start_timeout=5):
+        if not self.wait_for(running(program), start_timeout):
+            return False
+        return self.wait_exit(program, timeout)
+
+    # Waits until the qdiscs of the 10G interface have no backlog
+    def wait_drained(self, timeout=5):
+        c = "! sudo %s -s qdisc show dev %s | grep -q 'backlog [1-9]'"
+        return self.wait_for(c % (config['TC'], self.get_10g_dev()), timeout)
+
+    # Pipelines the commands collected while delay was set, without waiting
+    # for each one to complete before sending the next. Returns the (exit
+    # code, output) of each command that is not async.
     def delayed_cmds_execute(self):
         if len(self.delayed_cmds) == 0:
             return None
         self.delay = False
-        ssh = self.get()
-        cmds = ';'.join(self.delayed_cmds)
-        out = ssh.exec_command(cmds)[1].read()
+        cmds = self.delayed_cmds
         self.delayed_cmds = []
-        return out
+        if self.dryrun:
+            for (c, async) in cmds:
+                self.record('async' if async else 'cmd', c)
+            return []
+        shell = self.get_shell()
+        ids = []
+        for (c, async) in cmds:
+            if async:
+                shell.cmd_async(c)
+            else:
+                ids.append(shell.send(c))
+        return [ shell.wait(id) for id in ids ]
 
     def cmd_async(self, c, dryrun=False):
         self.log(c)
         if not self.delay:
             if dryrun or self.dryrun:
+                self.record('async', c)
                 return (self.addr, c)
-            #ssh = self.get()
-            #out = ssh.exec_command(c)
-            sh = self.get_shell()
-            sh.cmd_async(c)
+            self.get_shell().cmd_async(c)
         else:
-            self.delayed_cmds.append(c)
+            self.delayed_cmds.append((c, True))
         return (self.addr, c)
 
     def delayed_async_cmds_execute(self):
-        if len(self.delayed_cmds) == 0:
-            return None
-        self.delay = False
-        ssh = self.get()
-        cmds = ';'.join(self.delayed_cmds)
-        out = ssh.exec_command(cmds)[1]
-        self.delayed_cmds = []
-        return out
+        return self.delayed_cmds_execute()
+
+    # Runs the commands of a host in a phase of a plan (see plan.py) in one
+    # pipelined batch
+    def run_batch(self, cmds):
+        self.set_delay()
+        for (kind, c, tc_procs, tc_ops) in cmds:
+            if kind == 'async':
+                self.cmd_async(c)
+            else:
+                self.cmd(c)
+        return self.delayed_cmds_execute()
 
     def log(self, c):
         addr = T.colored(self.sshaddr, "magenta")
         c = T.colored(c, "grey", attrs=["bold"])
-        print "%s: %s" % (addr, c)
+        log_line("%s: %s" % (addr, c))
 
     def get_10g_dev(self):
         return config['DEFAULT_DEV'][self.addr]
 
+    # Returns whether the host state says the aspect of the host is set to
+    # value (see HostState)
+    def is_configured(self, aspect, value):
+        current = host_state.get(self.addr, aspect)
+        return current is not None and current == host_state.normalize(value)
+
+    def configured(self, aspect, value):
+        if not self.dryrun:
+            host_state.set(self.addr, aspect, value)
+
+    def unconfigured(self, aspect):
+        if not self.dryrun:
+            host_state.forget(self.addr, aspect)
+
     def mkdir(self, dir):
         self.cmd("mkdir -p %s" % dir)
 
     def rmrf(self, dir):
-        print T.colored("removing %s" % dir, "red", attrs=["bold"])
+        log_line(T.colored("removing %s" % dir, "red", attrs=["bold"]))
         if dir == "/tmp" or dir == "~" or dir == "/":
             # useless
             return
@@ -178,23 +490,75 @@ class Host(object):
         self.cmd("sudo sysctl -w net.ipv6.conf.%s.disable_ipv6=1;" % dev)
 
     def rmmod_qfq(self):
+        self.unconfigured('rl')
         self.cmd("sudo rmmod sch_qfq")
 
+    # Returns whether the module was inserted
     def insmod_qfq(self):
-        self.cmd("sudo rmmod sch_qfq; sudo insmod %s" % config['QFQ_PATH'])
+        self.unconfigured('rl')
+        ok = self.cmd_ok("sudo rmmod sch_qfq; sudo insmod %s" % config['QFQ_PATH'])
         self.disable_ipv6()
+        return ok
 
+    # Returns whether the module was inserted
     def insmod_eyeq(self):
-        self.cmd("sudo rmmod sch_htb; sudo rmmod sch_eyeq; sudo insmod %s" % config['EYEQ_PATH'])
+        self.unconfigured('rl')
+        ok = self.cmd_ok("sudo rmmod sch_htb; sudo rmmod sch_eyeq; sudo insmod %s" % config['EYEQ_PATH'])
         self.disable_ipv6()
+        return ok
 
     def rmmod_eyeq(self):
+        self.unconfigured('rl')
         self.cmd("sudo rmmod sch_eyeq")
 
     def remove_qdiscs(self):
+        self.unconfigured('rl')
         iface = self.get_10g_dev()
         self.cmd("sudo %s qdisc del dev %s root" % (config['TC'], iface))
 
+    # Sets up the rate limiter kind (htb, qfq, eyeq or none) with the qdisc,
+    # classes and filters of tc_conf (a conf.HTB or conf.QFQ, or None for
+    # none) in a single tc -batch. If the host state says the same rate
+    # limiter is set up with a configuration that only differs in the rates
+    # of classes, only those classes are changed. The rate limiter is kept in
+    # the host state only if all the steps succeeded.
+    def setup_rl(self, kind, tc_conf, path):
+        cmds = tc_conf.cmds if tc_conf is not None else []
+        rl = {'kind' : kind, 'cmds' : cmds}
+        old = host_state.get(self.addr, 'rl')
+        if old is not None and old['kind'] == kind:
+            change = conf.change_cmds(old['cmds'], cmds)
+            if change is not None:
+                self.log("%s already set up, changing %d classes" %
+                         (kind, len(change)))
+                self.start_tc_batch()
+                for c in change:
+                    self.tc(c)
+                ret = self.apply_tc_batch(path)
+                if self.tc_batch_ok(ret):
+                    self.configured('rl', rl)
+                else:
+                    self.unconfigured('rl')
+                return ret
+        self.remove_qdiscs()
+        ok = True
+        if kind == "qfq":
+            ok = self.insmod_qfq()
+        elif kind == "eyeq":
+            self.rmmod_qfq()
+            ok = self.insmod_eyeq()
+        elif kind == "htb":
+            self.rmmod_qfq()
+        ret = None
+        if tc_conf is not None:
+            ret = self.apply_tc_conf(tc_conf, path)
+            ok = self.tc_batch_ok(ret) and ok
+        if ok:
+            self.configured('rl', rl)
+        else:
+            self.unconfigured('rl')
+        return ret
+
     def add_htb_qdisc(self, rate='5Gbit', mtu=1500):
         iface = self.get_10g_dev()
         self.remove_qdiscs()
@@ -206,32 +570,16 @@ class Host(object):
         c += "htb rate %s mtu %s burst 15k;" % (rate, mtu)
         self.cmd(c)
 
-    def add_htb_hash(self, num_hash_bits=4):
-        num_hash_bits = min(8, num_hash_bits)
-        num_hash = 1 << num_hash_bits
-        self.num_hash = num_hash
-        self.hash_mask = hex((1 << num_hash_bits) - 1)
-        dev = self.get_10g_dev()
-        c  = "sudo %s filter add dev %s parent 1: prio 1 protocol all u32; " % (config['TC'], dev)
-        c += "sudo %s filter add dev %s parent 1: prio 1 handle 2: protocol all u32 divisor %s; " % (config['TC'], dev, num_hash)
-        c += "sudo %s filter add dev %s protocol all parent 1: prio 1 u32 ht 800::  match ip protocol 0 0 hashkey mask %s at 20  link 2:; " % (config['TC'], dev, self.hash_mask)
-        self.cmd(c)
-
-    def add_one_htb_class(self, rate='5Gbit', ceil='5Gbit', port=1000, klass=1):
-        dev = self.get_10g_dev()
-        c  = "sudo %s class add dev %s classid 1:%d parent 1: htb rate %s ceil %s; " % (config['TC'], dev, klass, rate, ceil)
-        c += "sudo %s filter add dev %s protocol all parent 1: prio 1 u32 ht 2:%d: match ip dport %d %d flowid 1:%d" % (config['TC'], dev, hash, port, self.hash_mask, klass)
-        self.cmd(c)
-
-    def add_n_htb_class(self, rate='5Gbit', ceil='5Gbit', start_port=1000, num_class=8):
-        num_hash = self.num_hash
-        dev = self.get_10g_dev()
-        c  = "for klass in `seq %s %s`; do " % (start_port, start_port + num_class)
-        c += "  hexclass=`perl -e \"printf('%%x', $klass %% %s)\"`; " % (num_hash)
-        c += "  sudo %s filter add dev %s protocol all parent 1: prio 1 u32 ht 2:$hexclass: match ip dport $klass %s flowid 1:%s; " % (config['TC'], dev, "0xffff", "$klass")
-        c += "  sudo %s class add dev %s classid 1:%s parent 1: htb rate %s ceil %s; " % (config['TC'], dev, "$klass", rate, ceil)
-        c += "done;"
-        self.cmd(c)
+    # Adds nclass classes of the rate (Mbps) for the dports starting at
+    # startport, with filters hashed on the dport. The HTB qdisc is added by
+    # add_htb_qdisc.
+    def add_htb_classes(self, rate, nclass=8, startport=1000, mtu=1500,
+                        batch_file="/tmp/tc-batch.txt"):
+        htb = conf.HTB(self.get_10g_dev(), mtu=mtu)
+        for klass in xrange(startport, startport + nclass):
+            htb.add_one_class(klass, klass, rate)
+        htb.add_hash_filters(keys=dport_hash_keys(nclass))
+        self.apply_tc_conf(htb, batch_file)
 
     def htb_class_filter_output(self, dir):
         dev = self.get_10g_dev()
@@ -240,70 +588,58 @@ class Host(object):
         c  = "sudo %s -s filter show dev %s > %s/htb-filter.txt" % (config['TC'], dev, dir)
         self.cmd(c)
 
-    def mc_add_htb_qdisc(self, mtu=1500, eyeq_mode=False):
-        # Default qdisc class has rate limit of 100Mbit
-        iface = self.get_10g_dev()
-        self.remove_qdiscs()
-        self.rmmod_qfq()
-        if eyeq_mode:
-            self.insmod_eyeq()
-        c  = ("sudo %s qdisc add dev %s root handle 1: htb default 1;"
-              % (config['TC'], iface))
-        c += ("sudo %s class add dev %s classid 1:1 parent 1: "
-              % (config['TC'], iface))
-        c += "htb rate 100Mbit mtu %s burst 15k;" % mtu
-        self.cmd(c)
-
-    def mc_add_qfq_qdisc(self, mtu=1500):
-        # Default qdisc class has rate limit of 100Mbit
-        iface = self.get_10g_dev()
-        self.remove_qdiscs()
-        self.insmod_qfq()
-        # 1. Add QFQ root qdisc
-        # 2. Create default class
-        # 3. Add pfifo qdisc to default class
-        # 4. Create default filter
-        c  = ("sudo %s qdisc add dev %s root handle 1: qfq;"
-              % (config['TC'], iface))
-
-        c += ("sudo %s class add dev %s classid 1:1 parent 1: "
-              % (config['TC'], iface))
-        c += "qfq weight 100 maxpkt %s;" % mtu
-
-        c += ("sudo %s qdisc add dev %s parent 1:1 pfifo limit 200;"
-              % (config['TC'], iface))
-
-        c += ("sudo %s filter add dev %s parent 1: "
-              % (config['TC'], iface))
-        c += "protocol all prio 2 u32 match u32 0 0 flowid 1:1"
-        self.cmd(c)
-
-    def mc_add_qdisc_filter(self, dst_ip, sport=5000, dport=5000, klass=5000):
-        dev = self.get_10g_dev()
-        c  = ("sudo %s filter add dev %s parent 1: protocol ip prio 1 "
-              % (config['TC'], dev))
-        c += "u32 match ip dst %s match ip " % dst_ip
-        if sport:
-            c += "sport %d 0xffff flowid 1:%x" % (sport, klass)
-        elif dport:
-            c += "dport %d 0xffff flowid 1:%x" % (dport, klass)
-        self.cmd(c)
-
-    def mc_add_htb_class(self, rate='5Gbit', ceil='5Gbit', klass=5000, htb_mtu=1500):
-        dev = self.get_10g_dev()
-        c  = ("sudo %s class add dev %s classid 1:%x parent 1: "
-             % (config['TC'], dev, klass))
-        c += "htb rate %s ceil %s mtu %s burst 15k;" % (rate, ceil, htb_mtu)
-        self.cmd(c)
-
-    def mc_add_qfq_class(self, rate='5Gbit', klass=5000, mtu=1500):
-        dev = self.get_10g_dev()
-        c  = ("sudo %s class add dev %s classid 1:%x parent 1: "
-              % (config['TC'], dev, klass))
-        c += "qfq weight %s maxpkt %s;" % (int(rate), mtu)
-        c += ("sudo %s qdisc add dev %s parent 1:%x pfifo limit 200;"
-              % (config['TC'], dev, klass))
-        self.cmd(c)
+    # Runs a tc command, or adds it to the batch if one was started
+    def tc(self, args):
+        if self.tc_batch is not None:
+            self.tc_batch.append(args)
+            return (self.addr, args)
+        return self.cmd("sudo %s %s" % (config['TC'], args))
+
+    # Collects the following tc commands of the host (Eg. the commands of a
+    # conf.HTB or conf.QFQ added by add_tc_conf) in a batch, instead of
+    # running each one with a separate cmd
+    def start_tc_batch(self):
+        self.tc_batch = []
+
+    # Writes the batch of tc commands to path on the host and runs them with a
+    # single tc -batch, in one round trip. Commands that fail are skipped, as
+    # they would have been when run one by one.
+    def apply_tc_batch(self, path):
+        cmds = self.tc_batch
+        self.tc_batch = None
+        if not cmds:
+            return None
+        self.log("tc batch of %d commands: %s" % (len(cmds), path))
+        c  = "cat > %s << 'TC_BATCH_EOF'\n" % path
+        c += '\n'.join(cmds)
+        c += "\nTC_BATCH_EOF\n"
+        c += "sudo %s -force -batch %s" % (config['TC'], path)
+        if self.dryrun:
+            self.record('tc_batch', c, len(cmds))
+            return (self.addr, path)
+        return self.get_shell().cmd(c)
+
+    # Returns whether the tc batch run by apply_tc_batch succeeded
+    def tc_batch_ok(self, ret):
+        if ret is None or self.dryrun:
+            return True
+        (status, output) = ret
+        if status != 0:
+            log_line(T.colored("%s: tc batch failed with status %d" %
+                               (self.addr, status), "red"))
+        return status == 0
+
+    # Adds the commands of a conf.QFQ or conf.HTB to the tc batch, or runs
+    # them if no batch was started
+    def add_tc_conf(self, tc_conf):
+        for cmd in tc_conf.cmds:
+            self.tc(cmd)
+
+    # Runs the commands of a conf.QFQ or conf.HTB with a single tc -batch
+    def apply_tc_conf(self, tc_conf, path):
+        self.start_tc_batch()
+        self.add_tc_conf(tc_conf)
+        return self.apply_tc_batch(path)
 
     def add_intel_hw_rate_limit(self, rate='5000', queue=2):
         # rate in Mbps
@@ -311,16 +647,33 @@ class Host(object):
         c  = "echo %s | sudo tee " % rate
         c += "/sys/class/net/%s/queues/tx-%d/tx_rate_limit > " % (iface, queue)
         c += "/dev/null"
+        self.unconfigured('intel_hwrl')
         self.cmd(c)
 
+    # Splits the rate (Mbps) over the first num_queues queues, in one round
+    # trip. The queues are set 0.5s apart, as the NIC needs.
+    def add_intel_hw_rate_limits(self, rate=5000, num_queues=1):
+        hwrl = conf.HWRL(self.get_10g_dev())
+        hwrl.add_rates(rate, num_queues)
+        if self.cmd_ok(all_of(hwrl.get_cmds(), "; sleep 0.5; ")):
+            self.configured('intel_hwrl', [rate, num_queues])
+        else:
+            self.unconfigured('intel_hwrl')
+
     def clear_intel_hw_rate_limits(self, numqueues=16):
+        if self.is_configured('intel_hwrl', "cleared"):
+            return
         iface = self.get_10g_dev()
         c  = "maxqueue=`echo $[%d - 1]`; " % numqueues
+        c += "ok=0; "
         c += "for queue in `seq 0 $maxqueue`; do "
-        c += "  echo 0 | sudo tee /sys/class/net/%s/queues/tx-$queue/tx_rate_limit > /dev/null; " % iface
+        c += "  echo 0 | sudo tee /sys/class/net/%s/queues/tx-$queue/tx_rate_limit > /dev/null || ok=1; " % iface
         c += "  sleep 0.1;"
-        c += "done;"
-        self.cmd(c)
+        c += "done; [ $ok = 0 ]"
+        if self.cmd_ok(c):
+            self.configured('intel_hwrl', "cleared")
+        else:
+            self.unconfigured('intel_hwrl')
 
     def add_mellanox_hw_rate_limit(self, rates=[0,0,0,0,0,0,0,0]):
         # sk_prio 0-7 mapped to TC 0-7 respectively
@@ -328,30 +681,44 @@ class Host(object):
         # rate in Mbps for each of the 8 classes.
         # rate = 0 => unlimited
         iface = self.get_10g_dev()
-        c = "sudo python %s -i %s -u 0,1,2,3,4,5,6,7,7,7,7,7,7,7,7,7; "
-        c = c % (config['TC_WRAP'], iface)
-        c += "%s -i %s -p 0,1,2,3,4,5,6,7 -r %s;"
-        c = c % (config['MLNX_QOS'], iface, ','.join(str(x) for x in rates))
-        self.cmd(c)
+        c1 = "sudo python %s -i %s -u 0,1,2,3,4,5,6,7,7,7,7,7,7,7,7,7"
+        c1 = c1 % (config['TC_WRAP'], iface)
+        c2 = "%s -i %s -p 0,1,2,3,4,5,6,7 -r %s"
+        c2 = c2 % (config['MLNX_QOS'], iface, ','.join(str(x) for x in rates))
+        if self.cmd_ok(all_of([c1, c2])):
+            self.configured('mellanox_hwrl', rates)
+        else:
+            self.unconfigured('mellanox_hwrl')
 
     def clear_mellanox_hw_rate_limits(self):
         # Qdiscs should be removed first to configure the mappings
         # Map all sk_priorities to UP 0
         # Map all UPs to TC 0
         # Remove rate limits for all TCs
+        if self.is_configured('mellanox_hwrl', "cleared"):
+            return
         self.remove_qdiscs()
         iface = self.get_10g_dev()
-        c = "sudo python %s -i %s -u 0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0; "
-        c = c % (config['TC_WRAP'], iface)
-        c += "%s -i %s -p 0,0,0,0,0,0,0,0 -r 0,0,0,0,0,0,0,0;"
-        c = c % (config['MLNX_QOS'], iface)
-        self.cmd(c)
+        c1 = "sudo python %s -i %s -u 0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0"
+        c1 = c1 % (config['TC_WRAP'], iface)
+        c2 = "%s -i %s -p 0,0,0,0,0,0,0,0 -r 0,0,0,0,0,0,0,0"
+        c2 = c2 % (config['MLNX_QOS'], iface)
+        ok = self.cmd_ok(all_of([c1, c2]))
         self.remove_qdiscs()
+        if ok:
+            self.configured('mellanox_hwrl', "cleared")
+        else:
+            self.unconfigured('mellanox_hwrl')
 
     def set_mtu(self, mtu=1500):
+        if self.is_configured('mtu', str(mtu)):
+            return
         iface = self.get_10g_dev()
         c = "sudo ifconfig %s mtu %s" % (iface, mtu)
-        self.cmd(c)
+        if self.cmd_ok(c):
+            self.configured('mtu', str(mtu))
+        else:
+            self.unconfigured('mtu')
 
     def add_tbf_qdisc(self, rate='5Gbit'):
         iface = self.get_10g_dev()
@@ -370,32 +737,21 @@ class Host(object):
         c = "%s -s class show dev %s > %s/qfq-stats.txt" % (config['TC'], iface, dir)
         self.cmd(c)
 
-    def add_qfq_qdisc(self, rate='5000', mtu=1500, nclass=8, startport=1000):
+    def add_qfq_qdisc(self, rate='5000', mtu=1500, nclass=8, startport=1000,
+                      batch_file="/tmp/tc-batch.txt"):
         iface = self.get_10g_dev()
         self.remove_qdiscs()
         self.rmmod()
         self.ifdown()
-        c  = "sudo %s qdisc add dev %s root handle 1: qfq;" % (config['TC'], iface)
-        self.cmd(c)
-        c = "for klass in {%d..%d}; do " % (startport, startport+nclass-1)
-        c += "  sudo %s class add dev %s parent 1: classid 1:$klass qfq weight %s maxpkt 2048; " % (config['TC'], iface, rate)
-        c += "  sudo %s filter add dev %s parent 1: protocol all prio 1 u32 match ip dport $klass 0xffff flowid 1:$klass; " % (config['TC'], iface)
-        c += "done;"
-        """
-        for klass in xrange((1 << bits) +1):
-            classid = klass + 1
-            c += "tc class add dev %s parent 1: classid 1:%d qfq weight %s maxpkt 2048; " % (iface, classid, rate)
-            c += "tc filter add dev %s parent 1: protocol all prio 1 u32 match ip sport %d %s flowid 1:%d; " % (iface, klass, mask, classid)
-            if klass % 50 == 0:
-                self.cmd(c)
-                c = ''
-        """
-        self.cmd(c)
-        c = ''
-        # Default class
-        c += "sudo %s class add dev %s parent 1: classid 1:1 qfq weight %s maxpkt 2048; " % (config['TC'], iface, rate)
-        c += "sudo %s filter add dev %s parent 1: protocol all prio 2 u32 match u32 0 0 flowid 1:1; " % (config['TC'], iface)
-        self.cmd(c)
+        # A class for each dport with filters hashed on the dport, and the
+        # default class 1:1
+        qfq = conf.QFQ(iface)
+        qfq.add_qdisc(rate)
+        for klass in xrange(startport, startport + nclass):
+            qfq.add_one_class(klass, klass, rate)
+        qfq.add_hash_filters(keys=dport_hash_keys(nclass))
+        qfq.add_default_filter()
+        self.apply_tc_conf(qfq, batch_file)
         self.ifup()
         self.disable_tso_gso()
 
@@ -424,6 +780,33 @@ class Host(object):
         c = "sudo %s filter add dev %s parent 1: protocol all prio 1 u32 match ip dport %d 0xffff flowid 1:%d; " % (config['TC'], dev, dport, dport)
         self.cmd(c)
 
+    # Returns the stats of the memcached listening on the port as a dict, or
+    # None if there is none
+    def memcached_stats(self, port):
+        c  = "exec 3<>/dev/tcp/127.0.0.1/%d && " % port
+        c += "printf 'stats\\r\\nquit\\r\\n' >&3 && cat <&3"
+        (status, output) = self.cmd_output("timeout 5 bash -c %s" %
+                                           pipes.quote(c))
+        stats = {}
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) == 3 and parts[0] == "STAT":
+                stats[parts[1]] = parts[2]
+        if status != 0 or not stats:
+            return None
+        return stats
+
+    # Stops the memcached started by MemcachedCluster on the port, and waits
+    # until the port is closed so that a new memcached can bind it. Returns
+    # whether the port was closed.
+    def stop_memcached(self, port, timeout=10):
+        c = "pkill%%s -f 'memcached -m [0-9]* -p %d '" % port
+        self.cmd(c % "")
+        if self.wait_for("! " + port_open(port), timeout):
+            return True
+        self.cmd(c % " -9")
+        return self.wait_for("! " + port_open(port), timeout)
+
     def killall(self, extra=""):
         for p in self.procs:
             try:
@@ -439,18 +822,23 @@ class Host(object):
         self.cmd(c)
 
     def configure_iface_interrupt_affinity(self, cpus=[0]):
+        if self.is_configured('irq_affinity', cpus):
+            return
         dev = self.get_10g_dev()
         self.stop_irqbalance()
         c  = "irqs=`grep '%s' /proc/interrupts | awk -F ':' '{print $1}'`; " % dev
-        c += "cpus=(%s); cnt=0;" % ' '.join(map(lambda x: str(x), cpus))
+        c += "cpus=(%s); cnt=0; ok=0;" % ' '.join(map(lambda x: str(x), cpus))
         c += "for irq in $irqs; do"
         c += "  ind=$(($cnt %% %d));" % len(cpus)
         c += "  cpu=$((1 << ${cpus[ind]}));"
         c += '  mask=`echo "obase=16; $cpu" | bc`;'
-        c += "  echo $mask | sudo tee /proc/irq/$irq/smp_affinity > /dev/null;"
+        c += "  echo $mask | sudo tee /proc/irq/$irq/smp_affinity > /dev/null || ok=1;"
         c += "  cnt=$(($cnt+1));"
-        c += "done;"
-        self.cmd(c)
+        c += "done; [ $ok = 0 ]"
+        if self.cmd_ok(c):
+            self.configured('irq_affinity', cpus)
+        else:
+            self.unconfigured('irq_affinity')
 
     def stop_irqbalance(self):
         c = "sudo service irqbalance stop"
@@ -514,9 +902,9 @@ class Host(object):
         # of all classes.
         nclass_per_prog = nclass / nprogs
         if nclass % nprogs != 0:
-            print "Warning: nclass % nprogs is not zero."
+            log_line("Warning: nclass % nprogs is not zero.")
         if nclass_per_prog == 0:
-            print "Warning: nclass per prog is 0. No traffic will be generated"
+            log_line("Warning: nclass per prog is 0. No traffic will be generated")
 
 
         while nprogs:
@@ -591,7 +979,7 @@ class Host(object):
         return self.cmd_async(cmd)
 
     def start_qfq_monitor(self, dir):
-        cmd = "python %s -i %s > %s/class-stats.txt"
+        cmd = "python %s -i %s -b > %s/class-stats.bin"
         cmd = cmd % (config['CLASS_RATE'], self.get_10g_dev(), dir)
         self.cmd_async(cmd)
 
@@ -611,30 +999,44 @@ class Host(object):
               config['SNIFFER'], board, path)
         return self.cmd_async(cmd)
 
-    def stop_sniffer(self, dir="/tmp"):
+    def stop_sniffer(self, dir="/tmp", timeout=120):
         self.cmd("killall -s INT %s" % config['SNIFFER'])
-        print 'waiting for sniffer to flush data...'
-        self.cmd("while (pidof -s %s > /dev/null); do sleep 1; done" % config['SNIFFER'])
+        log_line('waiting for sniffer to flush data...')
+        self.wait_exit(config['SNIFFER'], timeout)
         snf_file = os.path.join(dir, "pkt_snf.txt")
         self.cmd("tar czf %s/pkt_snf.tar.gz %s --transform='s|%s/||'" % (dir,
                  snf_file, dir.lstrip('/')))
         self.cmd("rm -f %s" % snf_file)
 
+    # The sniffer started by start_sniffer_delayed creates this file in its
+    # directory once it has exited
+    SNIFFER_DONE = "pkt_snf.done"
+
     def start_sniffer_delayed(self, dir="/tmp", board=0, delay=15, duration=10):
         # board 0 = captures Tx, board 1 = captures Rx
         dir = os.path.abspath(dir)
         path = os.path.join(dir, "pkt_snf.txt")
-        self.cmd("mkdir -p %s" % dir)
+        done = os.path.join(dir, Host.SNIFFER_DONE)
+        self.cmd("mkdir -p %s; rm -f %s" % (dir, done))
         # Start the sniffer after an initial delay
         cmd = "sleep %s" % delay
         cmd = "%s; taskset -c %d %s -b %d -f %s" % (cmd, config['SNIFFER_CPU'],
                 config['SNIFFER'], board, path)
+        cmd = "%s; touch %s" % (cmd, done)
         self.cmd_async(cmd)
         # Kill sniffer after appropriate duration
         cmd = "sleep %s; killall -s INT %s" % (delay + duration,
               config['SNIFFER'])
         return self.cmd_async(cmd)
 
+    # Waits until the sniffer started by start_sniffer_delayed in dir has
+    # captured for its duration and flushed its data. Unlike waiting for the
+    # sniffer process to exit, this also waits through the initial delay,
+    # before the sniffer is started.
+    def wait_sniffer(self, dir, timeout):
+        done = os.path.join(os.path.abspath(dir), Host.SNIFFER_DONE)
+        return self.wait_for("test -e %s" % pipes.quote(done), timeout)
+
     def stop_mpstat(self):
         self.cmd("killall -9 mpstat")
 
@@ -653,15 +1055,17 @@ class Host(object):
         if src_dir == tmpdir:
             return
         if exptid is None:
-            print "Please supply experiment id"
+            log_line("Please supply experiment id")
             return
 
         # First compress output
         self.cmd("tar czf %s/%s.tar.gz %s --transform='s|%s/||'" % (tmpdir,
                  exptid, src_dir, tmpdir.lstrip('/')))
-        opts = "-o StrictHostKeyChecking=no"
-        c = "scp %s -r %s:%s/%s.tar.gz ." % (opts, self.hostname(), tmpdir, exptid)
-        print "Copying experiment output"
+        # Copied from the control host, over the ControlMaster connection of
+        # the ssh transport
+        opts = ' '.join(map(pipes.quote, transport.SSH_OPTS))
+        c = "scp %s -r %s:%s/%s.tar.gz ." % (opts, self.sshaddr, tmpdir, exptid)
+        log_line("Copying experiment output")
         local_cmd(c)
 
     def copy_by_host(self, src_dir="/tmp", out_dir="/tmp", exptid=None):
@@ -670,7 +1074,7 @@ class Host(object):
         for analysis
         """
         if exptid is None:
-            print "Please supply experiment id"
+            log_line("Please supply experiment id")
             return
 
         src_dir = os.path.abspath(src_dir)
@@ -680,13 +1084,19 @@ class Host(object):
         self.mkdir(dst_dir)
         cmd = "cp -r %s/* %s" % (src_dir, dst_dir)
         self.cmd(cmd)
-        print "Copying experiment output from %s" % self.hostname()
+        log_line("Copying experiment output from %s" % self.hostname())
 
     def hostname(self):
-        try:
-            return socket.gethostbyaddr(self.addr)[0]
-        except:
-            return self.addr
+        return resolver.hostname(self.addr)
+
+    # Returns the data-plane IP of the host
+    def ip(self):
+        return resolver.ip(self.addr)
+
+    # Looks up the names and address of the host, so that later calls are
+    # served from the resolver cache
+    def resolve(self):
+        return (self.hostname(), self.ip())
 
     def start_profile(self, dir="/tmp"):
         dir = os.path.join(os.path.abspath(dir), "profile")
@@ -21,10 +21,17 @@ parser.add_argument('--clients',
                     help="Memcached clients to run tests",
                     nargs="+", default=config['DEFAULT_MC_CLIENTS'])
 
+parser.add_argument('--parallel',
+                    dest="parallel",
+                    type=int,
+                    help="Number of hosts to run each command on "
+                         "concurrently",
+                    default=1)
+
 args = parser.parse_args()
 
 
-hlist = HostList()
+hlist = HostList(parallel=args.parallel)
 
 print T.colored("Servers:---", "green")
 for ip in args.servers:
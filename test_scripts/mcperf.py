@@ -4,13 +4,21 @@ import argparse
 import multiprocessing
 import termcolor as T
 from expt import Expt
-from expt import progress
 from time import sleep
 from host import *
 from site_config import *
+import conf
 import os
+import json
 
 MC_PREPOPULATE_TIME = 150
+MC_MEM = 2048
+MC_THREADS = 1
+# With --warm, the memcached of a tenant is kept from an earlier run if on
+# every server it is the instance that was prepopulated (same pid) with the
+# same configuration, and still has this fraction of the items it had after
+# prepopulation
+MC_WARM_FRACTION = 0.95
 
 parser = argparse.ArgumentParser(description="Memcached test for various rate limiters.")
 
@@ -133,6 +141,34 @@ parser.add_argument('--trafgenproto',
                     help="trafgen: Transport protocol (udp/tcp)",
                     default="udp")
 
+parser.add_argument('--parallel',
+                    dest="parallel",
+                    type=int,
+                    help="Number of hosts to run each command on "
+                         "concurrently",
+                    default=1)
+
+parser.add_argument('--warm',
+                    dest="warm",
+                    help="Keep memcached running after the run, and reuse "
+                         "the populated memcached instances of earlier runs "
+                         "instead of prepopulating them again",
+                    action="store_true",
+                    default=False)
+
+parser.add_argument('--warm-state',
+                    dest="warm_state",
+                    help="File recording the prepopulated memcached "
+                         "instances for --warm",
+                    default="/tmp/mcperf-warm.json")
+
+parser.add_argument('--host-state',
+                    dest="host_state",
+                    help="Keep the configuration of the hosts in this file "
+                         "across runs, and only apply what changed since the "
+                         "previous run (used by sweep.py)",
+                    default=None)
+
 args = parser.parse_args()
 
 
@@ -143,6 +179,28 @@ def e(s, tmpdir="/tmp"):
         return os.path.join(tmpdir, args.exptid)
 
 
+# Returns the configuration of a memcached instance that its cache depends on
+def memcached_signature(mem, threads, cpus, mcsize):
+    return ("mem=%d threads=%d cpus=%s mcsize=%d" %
+            (mem, threads, ','.join(map(str, cpus)), mcsize))
+
+def load_warm_state(path):
+    if not os.path.exists(path):
+        return {}
+    f = open(path)
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+def save_warm_state(path, state):
+    f = open(path, 'w')
+    try:
+        json.dump(state, f, indent=1, sort_keys=True)
+    finally:
+        f.close()
+
+
 class MemcachedCluster(Expt):
 
     def start_memcached(self, hlist, mem=1024, port=5000, threads=1, cpus=[1]):
@@ -207,12 +265,51 @@ class MemcachedCluster(Expt):
             h.cmd_async(cmd)
 
 
+    # Returns whether the memcached on the port of the server is the one
+    # recorded in the warm state, and is still populated
+    def is_warm(self, hserver, port, signature, state):
+        entry = state.get("%s:%d" % (hserver.addr, port))
+        if entry is None or entry['signature'] != signature:
+            return False
+        stats = hserver.memcached_stats(port)
+        if stats is None or stats.get('pid') != entry['pid']:
+            return False
+        items = int(stats.get('curr_items', 0))
+        self.log("%s:%d: %d items, %d after prepopulation" %
+                 (hserver.addr, port, items, entry['items']))
+        return entry['items'] > 0 and items >= MC_WARM_FRACTION * entry['items']
+
+    # Returns the tenants whose memcached instances are warm on all servers
+    def warm_tenants(self, hservers, signatures, state):
+        start_port = self.opts("startport")
+        return set(tenant for (tenant, signature) in signatures.iteritems()
+                   if all(self.is_warm(h, start_port + tenant, signature, state)
+                          for h in hservers.lst))
+
+    # Records the memcached instances of the tenants after they were
+    # prepopulated
+    def record_warm_state(self, hservers, tenants, signatures, state):
+        start_port = self.opts("startport")
+        for tenant in tenants:
+            for h in hservers.lst:
+                port = start_port + tenant
+                stats = h.memcached_stats(port)
+                if stats is None:
+                    continue
+                state["%s:%d" % (h.addr, port)] = {
+                    'signature' : signatures[tenant],
+                    'pid' : stats.get('pid'),
+                    'items' : int(stats.get('curr_items', 0))}
+        save_warm_state(self.opts("warm_state"), state)
+
     def start(self):
         sniffer = self.opts("sniffer")
+        if self.opts("host_state"):
+            set_host_state(self.opts("host_state"))
 
-        hservers = HostList()
-        hclients = HostList()
-        hlist = HostList()
+        hservers = HostList(parallel=self.opts("parallel"))
+        hclients = HostList(parallel=self.opts("parallel"))
+        hlist = HostList(parallel=self.opts("parallel"))
         if sniffer:
             hsniffer = Host(sniffer)
 
@@ -230,6 +327,10 @@ class MemcachedCluster(Expt):
             hlist.append(h)
             self.log(T.colored(ip, "yellow"))
 
+        # Look up the addresses of the hosts once, so that the setup loops
+        # below are served from the resolver cache
+        hlist.resolve()
+
         # Reset/clear state on servers and clients
         hlist.rmrf(e(""))
         hlist.mkdir(e("logs"))
@@ -254,8 +355,12 @@ class MemcachedCluster(Expt):
         hlist.rmmod()
         hlist.stop_trafgen()
         hlist.cmd("sudo service memcached stop")
-        hlist.killall("udp memcached mcperf")
-        hlist.remove_qdiscs()
+        if self.opts("warm"):
+            hlist.killall("udp mcperf")
+        else:
+            hlist.killall("udp memcached mcperf")
+        if not self.opts("host_state"):
+            hlist.remove_qdiscs()
         hlist.clear_intel_hw_rate_limits(config['NIC_HW_QUEUES'])
         hlist.clear_mellanox_hw_rate_limits()
         sleep(1)
@@ -289,15 +394,35 @@ class MemcachedCluster(Expt):
         #    generator)
 
         # Start memcached on servers - one instance for each tenant, pinned to a
-        # different CPU core
+        # different CPU core. With --warm, the instances of the tenants that
+        # are still populated from an earlier run are kept.
+        signatures = {}
+        for tenant in xrange(0, self.opts("mctenants")):
+            cpus = [avail_cpus[tenant % len(avail_cpus)]]
+            signatures[tenant] = memcached_signature(MC_MEM, MC_THREADS, cpus,
+                                                     self.opts("mcsize"))
+        warm_state = {}
+        warm = set()
+        if self.opts("warm"):
+            warm_state = load_warm_state(self.opts("warm_state"))
+            warm = self.warm_tenants(hservers, signatures, warm_state)
         assigned_cpus = 0
         for tenant in xrange(0, self.opts("mctenants")):
-            self.start_memcached(hservers, mem = 2048,
+            if tenant in warm:
+                self.log(T.colored("Reusing warm memcached of tenant %d" %
+                                   tenant, "green"))
+                assigned_cpus += 1
+                continue
+            if self.opts("warm"):
+                hservers.stop_memcached(start_port + tenant)
+            self.start_memcached(hservers, mem = MC_MEM,
                                  port = start_port + tenant,
-                                 threads = 1,
+                                 threads = MC_THREADS,
                                  cpus = [avail_cpus[assigned_cpus %
                                                     len(avail_cpus)]])
             assigned_cpus += 1
+        for tenant in xrange(0, self.opts("mctenants")):
+            hservers.wait_port(start_port + tenant)
 
         # Start trafgen servers/sinks - one instance for each tenant, pinned to
         # a different CPU core on each host
@@ -314,13 +439,18 @@ class MemcachedCluster(Expt):
         # If mcworkload=get, first run mcperf with set requests to full up the
         # cache.  For each (tenant, server) pair, create a separate mcperf
         # instance on each client.
-        if self.opts("mcworkload") == "get":
+        cold = [ tenant for tenant in xrange(0, self.opts("mctenants"))
+                 if tenant not in warm ]
+        if self.opts("mcworkload") == "get" and cold:
 
             tmp_assigned_cpus = 0
             hlist.mkdir(e("logs_unused"))
             for tenant in xrange(0, self.opts("mctenants")):
+                if tenant in warm:
+                    tmp_assigned_cpus += 1
+                    continue
                 for (srv_id, hserver) in enumerate(hservers.lst):
-                    server_ip = socket.gethostbyname(hserver.hostname())
+                    server_ip = hserver.ip()
                     for (cli_id, hclient) in enumerate(hclients.lst):
 
                         # Index of tenant and client connecting to this
@@ -351,8 +481,12 @@ class MemcachedCluster(Expt):
                                           dir=e('logs_unused'))
                 tmp_assigned_cpus += 1
 
+            # The set mcperfs exit when their requests are done
             self.log(T.colored("Populating caches first", "blue"))
-            progress(MC_PREPOPULATE_TIME + 5)
+            done = hclients.wait_run("mcperf", MC_PREPOPULATE_TIME + 5)
+            # Caches that may be partly populated are not recorded as warm
+            if self.opts("warm") and all(done):
+                self.record_warm_state(hservers, cold, signatures, warm_state)
 
         # Configure rate limits
         # mcperf tenants:
@@ -376,12 +510,20 @@ class MemcachedCluster(Expt):
         self.log(T.colored("Pair rate mc client = %s" % mc_pair_rate_client, "blue"))
         self.log(T.colored("Pair rate mc server = %s" % mc_pair_rate_server, "blue"))
         self.log(T.colored("Trafgen pair rate = %s" % trafgen_pair_rate, "blue"))
-        if self.opts("rl") == "htb":
-            hlist.mc_add_htb_qdisc(self.opts("htb_mtu"))
-        elif self.opts("rl") == "qfq":
-            hlist.mc_add_qfq_qdisc(self.opts("mtu"))
-        elif self.opts("rl") == "eyeq":
-            hlist.mc_add_htb_qdisc(self.opts("mtu"), True)
+        # The qdisc, classes and filters of each host are collected in a
+        # conf.HTB or conf.QFQ, and set up with a single tc -batch, which is
+        # also recorded in the logs. The default class 1:1 has a rate of
+        # 100Mbit, and the filters are hashed on the destination IP.
+        tc_confs = {}
+        for h in hlist.lst:
+            if self.opts("rl") in ["htb", "eyeq"]:
+                tc_confs[h] = conf.HTB(h.get_10g_dev(),
+                                       mtu=self.opts("htb_mtu"))
+            elif self.opts("rl") == "qfq":
+                tc_confs[h] = conf.QFQ(h.get_10g_dev(), mtu=self.opts("mtu"),
+                                       leaf_qdisc="pfifo limit 200")
+            if h in tc_confs:
+                tc_confs[h].add_qdisc()
 
         # Qdisc classes
         # class 1 : default class
@@ -400,48 +542,31 @@ class MemcachedCluster(Expt):
         for tenant in xrange(0, self.opts("mctenants")):
 
             for (srv_id, hserver) in enumerate(hservers.lst):
-                server_ip = socket.gethostbyname(hserver.hostname())
+                server_ip = hserver.ip()
 
                 for (cli_id, hclient) in enumerate(hclients.lst):
-                    client_ip = socket.gethostbyname(hclient.hostname())
+                    client_ip = hclient.ip()
 
                     srv_port = start_port + tenant
-                    rate_str_client = '%.3fMbit' % mc_pair_rate_client
-                    rate_str_server = '%.3fMbit' % mc_pair_rate_server
                     klass = (start_port +
                              (tenant * len(hservers.lst) * len(hclients.lst)) +
                              (srv_id * len(hclients.lst)) +
                              (cli_id))
 
-                    if self.opts("rl") in ["htb", "eyeq"]:
-                        hclient.mc_add_htb_class(rate=rate_str_client,
-                                                 ceil=rate_str_client,
-                                                 klass=klass,
-                                                 htb_mtu=self.opts("htb_mtu"))
-                        hserver.mc_add_htb_class(rate=rate_str_server,
-                                                 ceil=rate_str_server,
-                                                 klass=klass,
-                                                 htb_mtu=self.opts("htb_mtu"))
-                    elif self.opts("rl") == "qfq":
-                        hclient.mc_add_qfq_class(rate=mc_pair_rate_client,
-                                                 klass=klass,
-                                                 mtu=self.opts("mtu"))
-                        hserver.mc_add_qfq_class(rate=mc_pair_rate_server,
-                                                 klass=klass,
-                                                 mtu=self.opts("mtu"))
-
                     if self.opts("rl") in ["htb", "eyeq", "qfq"]:
                         # Client -> Server traffic
-                        hclient.mc_add_qdisc_filter(server_ip, sport=0,
-                                                    dport=srv_port, klass=klass)
+                        tc_confs[hclient].add_one_class(
+                            klass, (server_ip, None, srv_port),
+                            mc_pair_rate_client)
                         # Server -> Client traffic
-                        hserver.mc_add_qdisc_filter(client_ip, sport=srv_port,
-                                                    dport=0, klass=klass)
+                        tc_confs[hserver].add_one_class(
+                            klass, (client_ip, srv_port, None),
+                            mc_pair_rate_server)
 
         for tenant in xrange(0, self.opts("trafgentenants")):
             trafgen_port = start_port + 1000 + tenant
             for (src_id, hsrc) in enumerate(hlist.lst):
-                src_ip = socket.gethostbyname(hsrc.hostname())
+                src_ip = hsrc.ip()
                 for (dst_id, hdst) in enumerate(hlist.lst):
                     if hsrc == hdst:
                         continue
@@ -450,35 +575,29 @@ class MemcachedCluster(Expt):
                     # dst_id).
                     # NOTE: Trafgen server -> client traffic (only ACKs) is
                     # allocated a rate limit of only 5Mbit.
-                    dst_ip = socket.gethostbyname(hdst.hostname())
-                    rate_str = '%.3fMbit' % trafgen_pair_rate
-                    rate_str_acks = '5Mbit'
+                    dst_ip = hdst.ip()
                     klass = (start_port + 10000 +
                              (tenant * len(hlist.lst) * len(hlist.lst)) +
                              (src_id * len(hlist.lst)) +
                              (dst_id))
 
-                    if self.opts("rl") in ["htb", "eyeq"]:
-                        hsrc.mc_add_htb_class(rate=rate_str, ceil=rate_str,
-                                              klass=klass,
-                                              htb_mtu=self.opts("htb_mtu"))
-                        hdst.mc_add_htb_class(rate=rate_str_acks,
-                                              ceil=rate_str_acks, klass=klass,
-                                              htb_mtu=self.opts("htb_mtu"))
-                    elif self.opts("rl") == "qfq":
-                        hsrc.mc_add_qfq_class(rate=trafgen_pair_rate,
-                                              klass=klass, mtu=self.opts("mtu"))
-                        hdst.mc_add_qfq_class(rate=5, klass=klass,
-                                              mtu=self.opts("mtu"))
-
                     if self.opts("rl") in ["htb", "eyeq", "qfq"]:
-                        # Trafgen client -> server traffic filter
-                        hsrc.mc_add_qdisc_filter(dst_ip, sport=0,
-                                                 dport=trafgen_port, klass=klass)
-                        # Trafgen server -> client traffic filter (only affects ACKs)
-                        hdst.mc_add_qdisc_filter(src_ip, sport=trafgen_port,
-                                                 dport=0, klass=klass)
-
+                        # Trafgen client -> server traffic
+                        tc_confs[hsrc].add_one_class(
+                            klass, (dst_ip, None, trafgen_port),
+                            trafgen_pair_rate)
+                        # Trafgen server -> client traffic (only ACKs)
+                        tc_confs[hdst].add_one_class(
+                            klass, (src_ip, trafgen_port, None), 5)
+
+        # With --host-state, hosts that have the rate limiter set up from the
+        # previous run only change the rates of their classes
+        for tc_conf in tc_confs.values():
+            tc_conf.add_hash_filters(keys=['dst'])
+            tc_conf.add_default_filter()
+        hlist.call_each("setup_rl", [ (self.opts("rl"), tc_confs.get(h),
+                                       e('logs/tc-batch.txt'))
+                                      for h in hlist.lst ])
 
         hlist.start_bw_monitor(e('logs'))
         hlist.start_mpstat(e('logs'))
@@ -500,7 +619,7 @@ class MemcachedCluster(Expt):
                 for hdst in hlist.lst:
                     if hsrc == hdst:
                         continue
-                    dst_ip = socket.gethostbyname(hdst.hostname())
+                    dst_ip = hdst.ip()
 
                     self.start_trafgen_client(hsrc, dst_ip,
                                               tenant_id = tenant_id,
@@ -518,8 +637,8 @@ class MemcachedCluster(Expt):
         # memcached servers.
         tmp_assigned_cpus = 0
         for tenant in xrange(0, self.opts("mctenants")):
-            for hserver in hservers.lst:
-                server_ip = socket.gethostbyname(hserver.hostname())
+            for (srv_id, hserver) in enumerate(hservers.lst):
+                server_ip = hserver.ip()
                 for (cli_id, hclient) in enumerate(hclients.lst):
 
                     # Index of tenant and client connecting to this particular
@@ -559,15 +678,34 @@ class MemcachedCluster(Expt):
             self.hsniffer = hsniffer
 
 
+    # The mcperf clients exit when their requests are done
+    def wait_done(self, timeout):
+        self.log(T.colored("Waiting for mcperf clients to finish", "blue"))
+        self.hclients.wait_run("mcperf", timeout)
+
     def stop(self):
-        self.hlist.killall("memcached mcperf")
+        # If the run ended early, the sniffer may still be capturing: let it
+        # capture the traffic for its duration and flush before the traffic
+        # is stopped and its data copied
+        if self.opts("sniffer"):
+            self.log(T.colored("... Waiting for the sniffer to flush", "blue"))
+            self.hsniffer.wait_sniffer(e('logs', tmpdir=config['SNIFFER_TMPDIR']),
+                                       config['SNIFFER_DELAY'] +
+                                       config['SNIFFER_DURATION'])
+        if self.opts("warm"):
+            self.hlist.killall("mcperf")
+        else:
+            self.hlist.killall("memcached mcperf")
         self.hlist.stop_trafgen()
         self.hlist.stop_mpstat()
         self.log(T.colored("... Waiting for qdiscs to drain", "blue"))
-        progress(5)
-        self.hlist.remove_qdiscs()
-        self.hlist.rmmod_qfq()
-        self.hlist.rmmod_eyeq()
+        self.hlist.wait_drained(5)
+        # With --host-state, the rate limiters are left set up for the next
+        # run of the sweep
+        if not self.opts("host_state"):
+            self.hlist.remove_qdiscs()
+            self.hlist.rmmod_qfq()
+            self.hlist.rmmod_eyeq()
         if self.opts("sniffer"):
             self.hsniffer.copy_local(e('', tmpdir=config['SNIFFER_TMPDIR']),
                                     self.opts("exptid") + "-snf",
@@ -0,0 +1,264 @@
+#!/usr/bin/python
+# Plans of the commands the hosts of an experiment run to set it up.
+#
+# Plan.compile runs the start() of an Expt with every Host in dry run mode:
+# the commands are recorded in the plan instead of being run. They are grouped
+# in phases, which are separated by the sleeps of the experiment, and within a
+# phase by host in the order they were issued. Each command is recorded with
+# its kind:
+#   cmd       a command the host waits for (one round trip)
+#   async     a command started in the background (no round trip)
+#   tc_batch  a tc -batch of several tc operations (one round trip)
+#
+# The setup time of a plan is estimated from a LatencyModel, both as the
+# commands are run by the experiment (one round trip per command, host after
+# host) and as one pipelined batch per host per phase, which is how
+# Plan.execute runs a saved plan.
+#
+# Usage:
+#   trafgen.py --dryrun --num-class 2048 --rl qfq --plan plan.json
+#   plan.py show plan.json [--model model.json]
+#   plan.py measure e1 > model.json
+#   plan.py run plan.json [--parallel 2]
+
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import host
+from site_config import config
+
+
+# Costs in seconds. The defaults are close to what measure_model gives on a
+# local shell, with tc_op doubled for adds.
+class LatencyModel:
+    def __init__(self, rtt=0.001, cmd=0.001, tc_exec=0.0025, tc_op=0.00004):
+        # Round trip to the shell of a host
+        self.rtt = rtt
+        # Run time of a (trivial) command in the shell
+        self.cmd = cmd
+        # Start of a tc process
+        self.tc_exec = tc_exec
+        # A tc operation (a line of a tc batch)
+        self.tc_op = tc_op
+
+    # Returns the time a command takes to run, without the round trip
+    def run_time(self, kind, tc_procs, tc_ops):
+        if kind == 'async':
+            return self.cmd
+        return self.cmd + tc_procs * self.tc_exec + tc_ops * self.tc_op
+
+    def to_dict(self):
+        return {'rtt' : self.rtt, 'cmd' : self.cmd,
+                'tc_exec' : self.tc_exec, 'tc_op' : self.tc_op}
+
+    def __str__(self):
+        return ("rtt %.2fms cmd %.2fms tc exec %.2fms tc op %.3fms" %
+                (self.rtt * 1e3, self.cmd * 1e3, self.tc_exec * 1e3,
+                 self.tc_op * 1e3))
+
+def load_model(path):
+    f = open(path)
+    try:
+        return LatencyModel(**json.load(f))
+    finally:
+        f.close()
+
+def timed(fn, *args):
+    start = time.time()
+    fn(*args)
+    return time.time() - start
+
+# Measures the latency model of a host with the transport shell. The tc costs
+# are measured with read-only operations (qdisc show on lo), so measuring does
+# not change the host; adding classes and filters takes about twice as long.
+def measure_model(shell, n=50):
+    tc = "sudo %s" % config['TC']
+    per_cmd = timed(lambda: [ shell.cmd("/bin/true") for i in xrange(n) ]) / n
+    batch = timed(shell.run_batch, ["/bin/true"] * n)
+    cmd = max(0, (batch - per_cmd) / (n - 1))
+    rtt = max(0, per_cmd - cmd)
+    show = "%s qdisc show dev lo > /dev/null" % tc
+    tc_exec = timed(shell.run_batch, [show] * n) / n - cmd
+    lines = "qdisc show dev lo\\n" * n
+    c = "printf '%s' | %s -batch - > /dev/null" % (lines, tc)
+    tc_batch = timed(shell.cmd, c) - per_cmd - tc_exec
+    return LatencyModel(rtt, cmd, max(0, tc_exec), max(0, tc_batch / n))
+
+
+class Plan:
+    def __init__(self):
+        # Each phase is a dict with its name, the addresses of its hosts in
+        # the order they first issued a command, the commands of each host as
+        # [kind, command, tc processes, tc operations], and the time the
+        # experiment sleeps after the phase.
+        self.phases = []
+        self.lock = threading.Lock()
+        self.phase()
+
+    def phase(self, name=None):
+        if name is None:
+            name = "phase %d" % (len(self.phases) + 1)
+        self.phases.append({'name' : name, 'hosts' : [], 'cmds' : {},
+                            'sleep' : 0})
+
+    def sleep(self, t):
+        with self.lock:
+            self.phases[-1]['sleep'] += t
+            self.phase()
+
+    # Records a command of the host. The tc processes and operations of
+    # commands other than tc batches are the tc invocations in the command.
+    def add(self, addr, kind, c, tc_ops=None):
+        tc_procs = len(re.findall(r'\bsudo %s ' % re.escape(config['TC']), c))
+        if tc_ops is None:
+            tc_ops = tc_procs
+        with self.lock:
+            phase = self.phases[-1]
+            if addr not in phase['cmds']:
+                phase['hosts'].append(addr)
+                phase['cmds'][addr] = []
+            phase['cmds'][addr].append([kind, c, tc_procs, tc_ops])
+
+    # Records the commands of expt.start(). The Hosts of the experiment must
+    # be created in start().
+    def compile(self, expt):
+        host.set_plan(self)
+        expt.plan = self
+        try:
+            expt.start()
+        finally:
+            host.set_plan(None)
+            expt.plan = None
+        # Phases without commands only carry their sleep
+        self.phases = [ p for p in self.phases if p['hosts'] or p['sleep'] ]
+        return self
+
+    def save(self, path):
+        f = open(path, 'w')
+        try:
+            json.dump({'phases' : self.phases}, f, indent=1)
+        finally:
+            f.close()
+
+    # Returns the (round trips, commands, tc operations) of the commands of a
+    # host in a phase
+    def counts(self, cmds):
+        round_trips = len([ c for c in cmds if c[0] != 'async' ])
+        return (round_trips, len(cmds), sum(c[3] for c in cmds))
+
+    # Returns the time the commands of a host in a phase take when each is run
+    # in its own round trip, and when they are pipelined in one batch
+    def host_times(self, cmds, model):
+        run = sum(model.run_time(kind, tc_procs, tc_ops)
+                  for (kind, c, tc_procs, tc_ops) in cmds)
+        (round_trips, _, _) = self.counts(cmds)
+        return (run + round_trips * model.rtt, run + model.rtt)
+
+    # Returns the estimated setup time as run by the experiment, and as one
+    # batch per host per phase run on parallel hosts at a time, and the time
+    # slept
+    def estimate(self, model, parallel=1):
+        as_run = 0
+        batched = 0
+        slept = 0
+        for phase in self.phases:
+            times = [ self.host_times(phase['cmds'][addr], model)
+                      for addr in phase['hosts'] ]
+            as_run += sum(t[0] for t in times)
+            batch_times = sorted([ t[1] for t in times ], reverse=True)
+            # Hosts are run in waves of parallel hosts
+            batched += sum(batch_times[::max(1, parallel)])
+            slept += phase['sleep']
+        return (as_run, batched, slept)
+
+    def summary(self, model, parallel=1):
+        lines = []
+        totals = [0, 0, 0]
+        for phase in self.phases:
+            lines.append("%s: %d hosts, sleep %ss after" %
+                         (phase['name'], len(phase['hosts']), phase['sleep']))
+            for addr in phase['hosts']:
+                cmds = phase['cmds'][addr]
+                counts = self.counts(cmds)
+                (as_run, batched) = self.host_times(cmds, model)
+                lines.append("  %s: %d round trips, %d commands, %d tc ops; "
+                             "%.3fs as run, %.3fs batched" %
+                             ((addr,) + counts + (as_run, batched)))
+                totals = [ a + b for (a, b) in zip(totals, counts) ]
+        (as_run, batched, slept) = self.estimate(model, parallel)
+        lines.append("total: %d round trips, %d commands, %d tc ops" %
+                     tuple(totals))
+        lines.append("model: %s" % model)
+        lines.append("estimated setup: %.3fs as run, %.3fs as one batch per "
+                     "host per phase (%d hosts at a time), plus %ss of sleeps"
+                     % (as_run, batched, parallel, slept))
+        return '\n'.join(lines)
+
+    # Runs the plan with one pipelined batch per host per phase, on parallel
+    # hosts at a time, sleeping between phases as the experiment did
+    def execute(self, parallel=1):
+        def run(args):
+            (addr, cmds) = args
+            return host.Host(addr).run_batch(cmds)
+
+        for phase in self.phases:
+            work = [ (addr, phase['cmds'][addr]) for addr in phase['hosts'] ]
+            if parallel > 1 and len(work) > 1:
+                pool = ThreadPool(min(parallel, len(work)))
+                try:
+                    pool.map(run, work)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                map(run, work)
+            time.sleep(phase['sleep'])
+
+def load_plan(path):
+    f = open(path)
+    try:
+        plan = Plan()
+        plan.phases = json.load(f)['phases']
+        return plan
+    finally:
+        f.close()
+
+
+parser = argparse.ArgumentParser(description="Show, measure the latency "
+                                 "model for, or run an experiment setup plan.")
+parser.add_argument('action',
+                    choices=["show", "measure", "run"])
+parser.add_argument('target',
+                    help="Plan file (show, run), or host to measure")
+parser.add_argument('--model',
+                    dest="model",
+                    help="Latency model file written by measure",
+                    default=None)
+parser.add_argument('--parallel',
+                    dest="parallel",
+                    type=int,
+                    help="Number of hosts to run a phase on concurrently",
+                    default=1)
+
+def main(argv):
+    args = parser.parse_args(argv[1:])
+    if args.action == "measure":
+        model = measure_model(host.Host(args.target).get())
+        print json.dumps(model.to_dict(), indent=1)
+        return
+    plan = load_plan(args.target)
+    if args.action == "show":
+        model = LatencyModel()
+        if args.model:
+            model = load_model(args.model)
+        print plan.summary(model, args.parallel)
+    else:
+        plan.execute(args.parallel)
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -5,17 +5,38 @@
 # graphs for the individual experiments.
 # The corresponding data for plotting is also pickled and stored in each
 # experiment directory.
+#
+# Experiment directories are processed in parallel by a pool of worker
+# processes. Each worker imports the pickling and plotting modules once and
+# then processes experiments in-process, so the interpreter, numpy and
+# matplotlib start-up cost is paid once per worker rather than once per
+# experiment. A failure or timeout in one experiment does not stop the others;
+# all failures are summarized at the end. The outputs of an experiment that
+# timed out may be partially written, so they are removed and regenerated on
+# the next run.
+#
+# The summaries of all experiments are added to the summary index in the base
+# directory (or in the nearest parent directory that already has one), which
+# the comparison plots read instead of the individual experiment directories.
 
 import argparse
-import imp
+import multiprocessing
 import os
-import plumbum
+import shutil
+import signal
 import sys
+import time
+import traceback
 from site_config import *
 
-# Import expsiftUtils from PLOT_SCRIPTS_DIR
+# Import the pickling and plotting modules from PLOT_SCRIPTS_DIR
 sys.path.append(config['PLOT_SCRIPTS_DIR'])
 from expsiftUtils import readDirTagFileProperty
+import pickleExptLogs
+import plotMcperfLatency
+import plotSniffer
+from summaryIndex import SUMMARY_INDEX_FILE
+from summaryIndex import findSummaryIndex
 
 
 parser = argparse.ArgumentParser(description='Plot graphs recursively for '
@@ -23,9 +44,22 @@ parser = argparse.ArgumentParser(description='Plot graphs recursively for '
 parser.add_argument('base_dir',
                     help='Base directory to search for experiments')
 parser.add_argument('--force_replot', '-f', dest='force_replot',
-                    help='Replot graphs even if they already exist '
-                         '(not implemented yet)',
+                    help='Repickle data and replot graphs even if they '
+                         'already exist',
                     action="store_true")
+parser.add_argument('--jobs', '-j', dest='jobs', type=int,
+                    default=multiprocessing.cpu_count(),
+                    help='Number of experiments to process in parallel '
+                         '(default: number of CPUs)')
+parser.add_argument('--max_snf_jobs', dest='max_snf_jobs', type=int,
+                    default=2,
+                    help='Maximum number of sniffer captures parsed at the '
+                         'same time. Parsing a capture holds all its packets '
+                         'in memory, so this bounds the memory used by the '
+                         'workers (default: 2)')
+parser.add_argument('--timeout', '-t', dest='timeout', type=int, default=0,
+                    help='Abort processing an experiment after these many '
+                         'seconds (default: 0, no timeout)')
 
 
 memcached_workloads = ['memcached_set', 'memcached_get',
@@ -34,6 +68,95 @@ memcached_workloads = ['memcached_set', 'memcached_get',
 trafgen_workloads = ['trafgen_tcp', 'trafgen_udp']
 
 
+# Semaphore limiting the number of concurrent sniffer parses. It is inherited
+# by the worker processes through the pool initializer.
+snf_semaphore = None
+
+
+class ExptTimeout(Exception):
+    pass
+
+
+def alarmHandler(signum, frame):
+    raise ExptTimeout('timed out')
+
+
+def initWorker(semaphore):
+    global snf_semaphore
+    snf_semaphore = semaphore
+    signal.signal(signal.SIGALRM, alarmHandler)
+    # Let the parent process handle Ctrl-C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+# Pickles the logs and plots the graphs for a single experiment directory.
+# The experiment summaries are added to the summary index index_file. The
+# timeout is armed only once processing starts, so that the time spent waiting
+# for the sniffer semaphore does not count against it.
+def processExptDir(path, force_replot, index_file, timeout):
+    # Read the workload type for the experiment directory
+    workload = readDirTagFileProperty(path, 'workload')
+    if (not workload in trafgen_workloads and
+        not workload in memcached_workloads):
+        raise ValueError('Workload not recognized for expt: %s' % path)
+
+    # Pickle experiment logs. Trafgen experiments parse the sniffer capture
+    # which is bounded by the sniffer semaphore.
+    if workload in trafgen_workloads:
+        snf_semaphore.acquire()
+        try:
+            signal.alarm(timeout)
+            pickleExptLogs.pickleExptDir(path, force_replot,
+                                         index_file=index_file)
+        finally:
+            snf_semaphore.release()
+    else:
+        signal.alarm(timeout)
+        pickleExptLogs.pickleExptDir(path, force_replot,
+                                     index_file=index_file)
+
+    # Plot experiment graphs
+    expt_plot_dir = os.path.join(path, 'plot/')
+    if not os.path.exists(expt_plot_dir):
+        os.makedirs(expt_plot_dir)
+    if workload in trafgen_workloads:
+        plotSniffer.plotSnifferGraphs(path, expt_plot_dir, force_replot)
+    elif workload in memcached_workloads:
+        plotMcperfLatency.plotMcperfLatencyGraphs(path, expt_plot_dir,
+                                                  force_replot)
+
+
+# Removes the outputs of an experiment whose processing was interrupted: the
+# stats and plots, and the manifest so that every category is pickled again.
+# The experiment store is kept, as it is only ever replaced whole.
+def removeExptOutputs(path):
+    manifest_file = os.path.join(path, 'pickled', pickleExptLogs.MANIFEST_FILE)
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+    for name in ['stats', 'plot']:
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+# Worker task. Returns a tuple (path, elapsed seconds, error) where error is
+# None if the experiment was processed successfully. The alarm is only armed
+# by processExptDir, so a timeout means that processing had started.
+def runExptTask(task):
+    (path, force_replot, timeout, index_file) = task
+    start = time.time()
+    error = None
+    try:
+        processExptDir(path, force_replot, index_file, timeout)
+    except ExptTimeout:
+        signal.alarm(0)
+        error = 'Timed out after %d seconds' % timeout
+        removeExptOutputs(path)
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        signal.alarm(0)
+    return (path, time.time() - start, error)
+
+
 def main(argv):
     # Parse flags
     args = parser.parse_args()
@@ -48,59 +171,57 @@ def main(argv):
         print 'Base directory not valid'
         sys.exit(1)
     args.base_dir = os.path.abspath(args.base_dir)
-
-    # Create Plumbum commands for pickling data and plotting
-    pickle_cmd = plumbum.local[os.path.join(config['PLOT_SCRIPTS_DIR'],
-                                            'pickleExptLogs.py')]
-    plot_sniffer_cmd = plumbum.local[os.path.join(config['PLOT_SCRIPTS_DIR'],
-                                                  'plotSniffer.py')]
-    plot_mcperf_lat_cmd = plumbum.local[os.path.join(config['PLOT_SCRIPTS_DIR'],
-                                                     'plotMcperfLatency.py')]
-
-    # Temp directory for plotting graphs
-    plot_tmpdir = config['PLOT_TMPDIR']
+    if args.jobs < 1 or args.max_snf_jobs < 1:
+        print 'Number of jobs must be at least 1'
+        sys.exit(1)
 
     print 'Exploring base directory :', args.base_dir
 
-    num_exp_dirs = 0
+    # Collect the experiment directories
+    expt_dirs = []
     for (path, dirs, files) in os.walk(args.base_dir, followlinks=True):
         # Check if an experiment directory was found
         if os.path.exists(os.path.join(path, 'expsift_tags')):
             print 'Found experiment directory:', path
-            num_exp_dirs += 1
-
-            # Pickle experiment logs
-            print '... Pickling experiment data'
-            if args.force_replot:
-                pickle_cmd('-f', path, plot_tmpdir)
+            expt_dirs.append(path)
+
+    # Process the experiments in parallel
+    print 'Processing %d experiments with %d workers' % (len(expt_dirs),
+                                                         args.jobs)
+    semaphore = multiprocessing.Semaphore(args.max_snf_jobs)
+    pool = multiprocessing.Pool(args.jobs, initWorker, (semaphore,))
+    index_file = findSummaryIndex(args.base_dir)
+    if index_file is None:
+        index_file = os.path.join(args.base_dir, SUMMARY_INDEX_FILE)
+    tasks = [ (path, args.force_replot, args.timeout, index_file)
+              for path in expt_dirs ]
+    failed = []
+    try:
+        for (path, elapsed, error) in pool.imap_unordered(runExptTask, tasks):
+            if error is None:
+                print '... Done (%.1fs): %s' % (elapsed, path)
             else:
-                pickle_cmd(path, plot_tmpdir)
-
-            # Read the workload type for the experiment directory
-            workload = readDirTagFileProperty(path, 'workload')
-            if (not workload in trafgen_workloads and
-                not workload in memcached_workloads):
-               print 'Workload not recognized for expt: %s' % args.expt_dir
-               sys.exit(1)
-
-            # Plot experiment graphs
-            print '... Plotting experiment graphs'
-            expt_plot_dir = os.path.join(path, 'plot/')
-            if not os.path.exists(expt_plot_dir):
-                os.makedirs(expt_plot_dir)
-            if workload in trafgen_workloads:
-                if args.force_replot:
-                    plot_sniffer_cmd('-f', path, expt_plot_dir)
-                else:
-                    plot_sniffer_cmd(path, expt_plot_dir)
-            elif workload in memcached_workloads:
-                if args.force_replot:
-                    plot_mcperf_lat_cmd('-f', path, expt_plot_dir)
-                else:
-                    plot_mcperf_lat_cmd(path, expt_plot_dir)
-
-    print 'Plotted graphs for %d experiments under %s' % (num_exp_dirs,
-            args.base_dir)
+                print '... FAILED (%.1fs): %s' % (elapsed, path)
+                failed.append((path, error))
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    print 'Plotted graphs for %d experiments under %s' % (
+            len(expt_dirs) - len(failed), args.base_dir)
+
+    # Summarize failures
+    if failed:
+        print
+        print '%d experiments failed:' % len(failed)
+        for (path, error) in sorted(failed):
+            print '=' * 79
+            print path
+            print error.rstrip()
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -22,7 +22,7 @@ if SITE == 'Vimal':
     config['RL_MODULE_NAME'] = ''
     config['RL_MODULE'] = ''
     config['NETPERF_DIR'] = '/root/vimal/exports/netperf'
-    config['SHELL_PROMPT'] = '#'
+    config['TRANSPORT'] = 'ssh'
     config['UDP'] = '/root/vimal/rl-qfq/utils/udp'
     config['TC'] = '/root/vimal/rl-qfq/iproute2/tc/tc'
     config['QFQ_PATH'] = '/root/vimal/rl-qfq/sch_qfq.ko'
@@ -82,7 +82,7 @@ elif SITE == 'Siva':
     config['RL_MODULE_NAME'] = ''
     config['RL_MODULE'] = ''
     config['NETPERF_DIR'] = '/home/ssradhak/src/software/netperf/bin'
-    config['SHELL_PROMPT'] = '$'
+    config['TRANSPORT'] = 'ssh'
     config['UDP'] = '/home/ssradhak/src/rate_limiting/qfq-rl-eval/utils/udp'
     config['TC'] = '/home/ssradhak/src/rate_limiting/iproute2/tc/tc'
     config['QFQ_PATH'] = '/home/ssradhak/src/rate_limiting/qfq-rl/sch_qfq.ko'
@@ -147,7 +147,7 @@ elif SITE == 'Siva-MC':
 
     config['RL_MODULE_NAME'] = ''
     config['RL_MODULE'] = ''
-    config['SHELL_PROMPT'] = '$'
+    config['TRANSPORT'] = 'ssh'
     config['TC'] = '/home/ssradhak/src/rate_limiting/iproute2/tc/tc'
     config['QFQ_PATH'] = '/home/ssradhak/src/rate_limiting/qfq-rl/sch_qfq.ko'
     config['EYEQ_PATH'] = '/home/ssradhak/src/rate_limiting/eyeq++/sch_eyeq.ko'
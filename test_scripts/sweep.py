@@ -0,0 +1,274 @@
+#!/usr/bin/python
+# Runs an experiment script over a grid of parameters, with the hosts kept
+# configured between the points of the sweep.
+#
+# Each point is a run of the script (Eg. mcperf.py) with --host-state, so
+# that the qdiscs, kernel modules, IRQ affinity, MTU and NIC rate limits set
+# up by a point are left in place for the next one, which only applies what
+# changed (see HostState and Host.setup_rl in host.py). Points that only
+# change the rates of classes change them with tc class change.
+#
+# The points are ordered to minimise reconfiguration: parameters that are
+# costly to change (COSTS) vary slowest, and the points snake through the
+# grid so that consecutive points differ in a single parameter. Each point
+# runs in outdir/exptid, with an expsift_tags file of its parameters.
+#
+# If a point fails, the host state is dropped so that the next point sets up
+# the hosts from scratch. The teardown command (Eg. kill_expts.py) is run once
+# the sweep ends, to leave the hosts clean.
+#
+# Eg. the sweep of memcached-eval.sh:
+#   sweep.py mcperf.py --outdir Jan01 --prefix memcached \
+#       --grid rl=none,htb,qfq --grid mcrate=2500 \
+#       --grid mctenants,trafgentenants=10:4 --runs 1 \
+#       --set time=300 --set mcsize=4096 --tag nic_vendor=intel \
+#       --teardown kill_expts.py -- --warm
+
+import argparse
+import itertools
+import os
+import shlex
+import subprocess
+import sys
+
+# Relative cost of changing a parameter between consecutive points.
+# Parameters that are not listed cost 1.
+COSTS = {
+    # Kernel modules and qdiscs
+    'rl' : 8,
+    # Link reconfiguration and all classes
+    'mtu' : 8,
+    'htb-mtu' : 8,
+    # memcached restarts and prepopulation, and the number of classes
+    'mctenants' : 4,
+    'mcsize' : 4,
+    'trafgentenants' : 4,
+    # Class rates only, with tc class change
+    'mc_total_rate_server' : 1,
+    'mc_total_rate_client' : 1,
+    'trafgen_total_rate' : 1,
+    # Workload only
+    'mcrate' : 0,
+    'mcexp' : 0,
+    'mcnconn' : 0,
+    'time' : 0,
+    'run' : 0,
+}
+
+# Parses "a,b=1:2,3:4" into the parameter names (a, b) and their values
+# [(1, 2), (3, 4)]. Parameters varied together are one dimension of the
+# grid.
+def parse_dim(spec):
+    (names, values) = spec.split('=', 1)
+    names = tuple(names.split(','))
+    values = [ tuple(v.split(':')) for v in values.split(',') ]
+    for v in values:
+        if len(v) != len(names):
+            raise ValueError("%s: %s does not set %s" %
+                             (spec, ':'.join(v), ','.join(names)))
+    return (names, values)
+
+def dim_cost(dim):
+    return max(COSTS.get(name, 1) for name in dim[0])
+
+# Returns the values of the dimensions, ordered so that consecutive points
+# differ in one dimension: the values of each dimension are walked forwards
+# and backwards in turn (a reflected Gray code)
+def snake(dims):
+    if not dims:
+        return [()]
+    rest = snake(dims[1:])
+    ret = []
+    for (i, value) in enumerate(dims[0][1]):
+        if i % 2 == 1:
+            ret.extend((value,) + r for r in reversed(rest))
+        else:
+            ret.extend((value,) + r for r in rest)
+    return ret
+
+# Returns the total cost of changing parameters between consecutive points
+def reconfig_cost(points):
+    cost = 0
+    for (prev, curr) in zip(points, points[1:]):
+        cost += sum(COSTS.get(name, 1) for name in curr
+                    if curr[name] != prev.get(name))
+    return cost
+
+
+class Sweep:
+    # dims are (names, values) as returned by parse_dim, in the order the
+    # parameters appear in experiment ids. fixed are the parameters set for
+    # all points and tags the extra expsift tags, as (name, value) lists.
+    def __init__(self, script, outdir, dims, fixed=[], tags=[], prefix=None,
+                 extra_args=[], teardown=None):
+        self.script = script
+        self.outdir = outdir
+        self.dims = dims
+        self.fixed = fixed
+        self.tags = tags
+        self.prefix = prefix or os.path.splitext(os.path.basename(script))[0]
+        self.extra_args = extra_args
+        self.teardown = teardown
+        self.host_state = os.path.join(outdir, "host-state.json")
+
+    # Returns the points as dicts of parameters, in the order they are run
+    def points(self):
+        order = sorted(self.dims, key=dim_cost, reverse=True)
+        points = []
+        for values in snake(order):
+            point = {}
+            for (dim, value) in zip(order, values):
+                point.update(zip(dim[0], value))
+            points.append(point)
+        return points
+
+    # Returns the points in the order of the nested loops of the grid as
+    # given, as a shell script would run them
+    def nested_points(self):
+        points = []
+        for values in itertools.product(*[ dim[1] for dim in self.dims ]):
+            point = {}
+            for (dim, value) in zip(self.dims, values):
+                point.update(zip(dim[0], value))
+            points.append(point)
+        return points
+
+    def exptid(self, point):
+        names = [ name for dim in self.dims for name in dim[0] ]
+        return '-'.join([self.prefix] + [ "%s-%s" % (name, point[name])
+                                          for name in names ])
+
+    def write_tags(self, dir, point):
+        f = open(os.path.join(dir, "expsift_tags"), 'w')
+        try:
+            for (name, value) in self.tags + self.fixed + sorted(point.items()):
+                f.write("%s=%s\n" % (name, value))
+        finally:
+            f.close()
+
+    def args(self, exptid, point):
+        args = [sys.executable, self.script, "--exptid", exptid,
+                "--outdir", os.path.join(self.outdir, exptid),
+                "--host-state", self.host_state]
+        for (name, value) in self.fixed + sorted(point.items()):
+            if name != 'run':
+                args += ["--%s" % name, value]
+        return args + self.extra_args
+
+    def forget_host_state(self):
+        if os.path.exists(self.host_state):
+            os.remove(self.host_state)
+
+    # Runs the teardown command, after which the hosts are no longer
+    # configured as the host state says
+    def run_teardown(self):
+        if not self.teardown:
+            return 0
+        args = [sys.executable] + shlex.split(self.teardown)
+        print ' '.join(args)
+        ret = subprocess.call(args)
+        self.forget_host_state()
+        return ret
+
+    # Runs the points, and returns the experiment ids of the points that
+    # failed
+    def run(self, dryrun=False):
+        points = self.points()
+        print "%d points, reconfiguration cost %d (%d in nested order)" % (
+            len(points), reconfig_cost(points),
+            reconfig_cost(self.nested_points()))
+        if dryrun:
+            for point in points:
+                print ' '.join(self.args(self.exptid(point), point))
+            return []
+        if not os.path.exists(self.outdir):
+            os.makedirs(self.outdir)
+        # The hosts may have been changed since the last sweep, so the first
+        # point sets them up from scratch
+        self.forget_host_state()
+        failed = []
+        try:
+            for point in points:
+                exptid = self.exptid(point)
+                args = self.args(exptid, point)
+                print ' '.join(args)
+                dir = os.path.join(self.outdir, exptid)
+                if not os.path.exists(dir):
+                    os.makedirs(dir)
+                self.write_tags(dir, point)
+                ret = subprocess.call(args)
+                if ret != 0:
+                    # The hosts may be left in any state by the point
+                    print "%s failed with exit code %d" % (exptid, ret)
+                    failed.append(exptid)
+                    self.forget_host_state()
+        finally:
+            self.run_teardown()
+        return failed
+
+
+parser = argparse.ArgumentParser(description="Run an experiment script over "
+                                 "a grid of parameters. Arguments after -- "
+                                 "are passed to the script for every point.")
+parser.add_argument('script',
+                    help="Experiment script (Eg. mcperf.py)")
+parser.add_argument('--outdir',
+                    dest="outdir",
+                    required=True)
+parser.add_argument('--grid',
+                    dest="grid",
+                    action="append",
+                    default=[],
+                    help="Parameter values as name=v1,v2; parameters varied "
+                         "together as name1,name2=v1:w1,v2:w2")
+parser.add_argument('--set',
+                    dest="fixed",
+                    action="append",
+                    default=[],
+                    help="Parameter of all points as name=value")
+parser.add_argument('--tag',
+                    dest="tags",
+                    action="append",
+                    default=[],
+                    help="Extra expsift tag as name=value")
+parser.add_argument('--runs',
+                    dest="runs",
+                    type=int,
+                    default=1,
+                    help="Number of runs of each point")
+parser.add_argument('--prefix',
+                    dest="prefix",
+                    default=None,
+                    help="Prefix of experiment ids (default: script name)")
+parser.add_argument('--dryrun',
+                    dest="dryrun",
+                    action="store_true",
+                    default=False,
+                    help="Print the points in order without running them")
+parser.add_argument('--teardown',
+                    dest="teardown",
+                    default=None,
+                    help="Script (with its arguments) run once the sweep "
+                         "ends to tear down the hosts (Eg. kill_expts.py)")
+
+def main(argv):
+    argv = argv[1:]
+    extra_args = []
+    if '--' in argv:
+        extra_args = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    args = parser.parse_args(argv)
+    dims = [ parse_dim(spec) for spec in args.grid ]
+    runs = [ (str(run),) for run in xrange(1, args.runs + 1) ]
+    dims.append((('run',), runs))
+    fixed = [ tuple(spec.split('=', 1)) for spec in args.fixed ]
+    tags = [ tuple(spec.split('=', 1)) for spec in args.tags ]
+    sweep = Sweep(args.script, args.outdir, dims, fixed, tags, args.prefix,
+                  extra_args, args.teardown)
+    failed = sweep.run(args.dryrun)
+    if failed:
+        print "%d points failed: %s" % (len(failed), ' '.join(failed))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -6,6 +6,7 @@ import termcolor as T
 from expt import Expt
 from time import sleep
 from host import *
+from plan import Plan, LatencyModel, load_model
 from site_config import *
 import os
 
@@ -59,10 +60,23 @@ parser.add_argument('--time', '-t',
 
 parser.add_argument('--dryrun',
                     dest="dryrun",
-                    help="Don't execute experiment commands.",
+                    help="Don't execute experiment commands, and print the "
+                         "plan of the setup commands of each host.",
                     action="store_true",
                     default=False)
 
+parser.add_argument('--plan',
+                    dest="plan",
+                    help="With --dryrun, save the plan to this file "
+                         "(run it with plan.py)",
+                    default=None)
+
+parser.add_argument('--latency-model',
+                    dest="latency_model",
+                    help="With --dryrun, latency model written by "
+                         "plan.py measure to estimate the setup time",
+                    default=None)
+
 parser.add_argument('--hosts',
                     dest="hosts",
                     help="The two hosts (server/client) to run tests",
@@ -89,6 +103,13 @@ parser.add_argument('--startport',
                     type=int,
                     default=5000)
 
+parser.add_argument('--parallel',
+                    dest="parallel",
+                    type=int,
+                    help="Number of hosts to run each command on "
+                         "concurrently",
+                    default=1)
+
 args = parser.parse_args()
 if args.rl == "none":
     print "Using userspace rate limiting"
@@ -137,7 +158,7 @@ class UDP(Expt):
         self.server = Host(server)
         self.client = Host(client)
         self.sniffer = Host(sniffer)
-        self.hlist = HostList()
+        self.hlist = HostList(parallel=self.opts("parallel"))
         self.hlist.append(self.server)
         self.hlist.append(self.client)
 
@@ -155,10 +176,10 @@ class UDP(Expt):
         self.hlist.remove_qdiscs()
         if config['NIC_VENDOR'] == "Intel":
             self.client.clear_intel_hw_rate_limits(numqueues=config['NIC_HW_QUEUES'])
-            sleep(4)
+            self.sleep(4)
         elif config['NIC_VENDOR'] == "Mellanox":
             self.client.clear_mellanox_hw_rate_limits()
-            sleep(4)
+            self.sleep(4)
         #self.hlist.insmod_qfq()
         self.hlist.configure_tcp_limit_output_bytes()
 
@@ -167,47 +188,46 @@ class UDP(Expt):
 
         if self.opts("rl") == "htb":
             self.client.add_htb_qdisc(str(args.rate) + "Mbit", args.htb_mtu)
-            rate_str = '%.3fMbit' % (self.opts("rate") * 1.0 / self.opts("num_class"))
             if self.opts("num_class") is not None:
-                num_hash_bits = int(math.log(self.opts("num_class"), 2))
-                self.client.add_htb_hash(num_hash_bits=num_hash_bits)
-                self.client.add_n_htb_class(rate=rate_str, ceil=rate_str, num_class=self.opts("num_class"))
+                rate = self.opts("rate") * 1.0 / self.opts("num_class")
+                self.client.add_htb_classes(rate, nclass=self.opts("num_class"),
+                                            startport=startport, mtu=args.htb_mtu,
+                                            batch_file=e('logs/tc-batch.txt'))
                 # Just verify that we have created all classes correctly.
                 self.client.htb_class_filter_output(e('logs'))
         elif self.opts("rl") == "tbf":
             self.client.add_tbf_qdisc(str(args.rate) + "Mbit")
         elif self.opts("rl") == "qfq":
-            self.client.add_qfq_qdisc(str(args.rate), args.htb_mtu, nclass=self.opts("num_class"), startport=startport)
+            self.client.add_qfq_qdisc(str(args.rate), args.htb_mtu, nclass=self.opts("num_class"), startport=startport,
+                                      batch_file=e('logs/tc-batch.txt'))
         elif self.opts("rl") == "eyeq":
             self.client.insmod(rate=args.rate)
         elif self.opts("rl") == "hwrl":
             num_hw_rl = min(config['NIC_HW_QUEUES'], self.opts("num_senders"))
             hw_rate = self.opts("rate") / num_hw_rl
             if config['NIC_VENDOR'] == "Intel":
-                for q in xrange(0, num_hw_rl):
-                    # First queue will account for remainder in rate limit
-                    delta = 1 if (q < self.opts("rate") % num_hw_rl) else 0
-                    self.client.add_intel_hw_rate_limit(rate=hw_rate + delta, queue=q)
-                    sleep(0.5)
-                sleep(2)
+                self.client.add_intel_hw_rate_limits(rate=self.opts("rate"),
+                                                     num_queues=num_hw_rl)
+                self.sleep(2)
             elif config['NIC_VENDOR'] == "Mellanox":
                 rates = [hw_rate for x in range(0,num_hw_rl)]
                 if num_hw_rl < 8:
                     rates.extend([0 for x in range(num_hw_rl, 8)])
                 self.client.add_mellanox_hw_rate_limit(rates)
-                sleep(2)
+                self.sleep(2)
 
         self.client.start_cpu_monitor(e('logs'))
         self.client.start_bw_monitor(e('logs'))
         if self.opts("rl") == "qfq":
             self.client.start_qfq_monitor(e('logs'))
         self.client.start_mpstat(e('logs'))
+        self.client.start_perf_monitor(e('logs'), self.opts("t"))
         self.client.set_mtu(self.opts("mtu"))
         if sniffer:
             self.sniffer.start_sniffer_delayed(e('logs', tmpdir=config['SNIFFER_TMPDIR']),
                     board=0, delay=config['SNIFFER_DELAY'],
                     duration=config['SNIFFER_DURATION'])
-        sleep(1)
+        self.sleep(1)
 
         num_senders = self.opts("num_senders")
         num_class = self.opts("num_class")
@@ -263,5 +283,15 @@ class UDP(Expt):
             self.client.clear_mellanox_hw_rate_limits()
         return
 
+if args.dryrun:
+    plan = Plan().compile(UDP(vars(args)))
+    model = LatencyModel()
+    if args.latency_model:
+        model = load_model(args.latency_model)
+    print plan.summary(model, args.parallel)
+    if args.plan:
+        plan.save(args.plan)
+    sys.exit(0)
+
 UDP(vars(args)).run()
 os.system("killall -9 ssh")
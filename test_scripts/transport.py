@@ -0,0 +1,165 @@
+# Transports to run shell commands on hosts over a persistent shell.
+#
+# A transport keeps one bash process running (locally, or on the remote host
+# over ssh) and writes commands to its stdin without waiting for a prompt
+# between them. Each command is run with eval in a subshell, so that a command
+# that exits does not end the shell, with its stdin from /dev/null, and is
+# followed by a marker line with the id of the command and its exit code.
+# A reader thread splits the output of the shell at the markers, so the output
+# and exit code of every command are matched to it even when many commands are
+# pipelined. A command that does not complete within its timeout would block
+# the commands sent after it, so the shell is then killed; Host.get connects
+# again once a transport has closed.
+#
+# LocalTransport runs the shell as a local subprocess, so that the layer (and
+# Host) can be tested without real hosts. SSHTransport runs it over ssh, with
+# a ControlMaster connection that is shared by other ssh and scp commands to
+# the host.
+
+import os
+import pipes
+import threading
+import time
+from subprocess import Popen, PIPE, STDOUT
+
+SSH_OPTS = ['-o', 'StrictHostKeyChecking=no',
+            '-o', 'ControlMaster=auto',
+            '-o', 'ControlPath=~/.ssh/cm-%r@%h:%p',
+            '-o', 'ControlPersist=600']
+
+
+class TransportError(Exception):
+    pass
+
+
+class Transport:
+
+    # Seconds to wait for a command to complete by default
+    TIMEOUT = 120
+
+    def __init__(self, argv):
+        self.argv = argv
+        self.proc = Popen(argv, stdin=PIPE, stdout=PIPE, stderr=STDOUT,
+                          close_fds=True)
+        # Marker printed after the output of every command
+        self.token = '__TRANSPORT_%s__' % os.urandom(8).encode('hex')
+        self.next_id = 0
+        self.write_lock = threading.Lock()
+        self.cond = threading.Condition()
+        # (exit code, output) of each command that completed, keyed by id
+        self.results = {}
+        # Ids of commands whose results are not waited for
+        self.discard = set()
+        self.closed = False
+        self.reader = threading.Thread(target=self.read_output)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def read_output(self):
+        lines = []
+        for line in iter(self.proc.stdout.readline, ''):
+            if not line.startswith(self.token):
+                lines.append(line)
+                continue
+            (_, id, status) = line.split()
+            # The newline printed before the marker is not part of the output
+            output = ''.join(lines)[:-1]
+            lines = []
+            with self.cond:
+                if int(id) in self.discard:
+                    self.discard.remove(int(id))
+                else:
+                    self.results[int(id)] = (int(status), output)
+                self.cond.notify_all()
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    # Sends a command to the shell and returns its id, without waiting for it
+    # to complete. Writes are serialized by write_lock rather than the lock of
+    # the results, so that the reader can take results while a write blocks
+    # on a full pipe.
+    def send(self, cmd, wait=True):
+        with self.write_lock:
+            with self.cond:
+                if self.closed:
+                    raise TransportError("%s exited" % ' '.join(self.argv))
+                id = self.next_id
+                self.next_id += 1
+                if not wait:
+                    self.discard.add(id)
+            line = "( eval %s ) < /dev/null 2>&1; printf '\\n%s %d %%d\\n' $?\n"
+            try:
+                self.proc.stdin.write(line % (pipes.quote(cmd), self.token, id))
+                self.proc.stdin.flush()
+            except IOError, e:
+                raise TransportError("%s: %s" % (' '.join(self.argv), e))
+        return id
+
+    # Waits for the command with the id to complete and returns its (exit
+    # code, output). If it does not complete within timeout seconds, the
+    # shell is killed and TransportError is raised.
+    def wait(self, id, timeout=None):
+        deadline = time.time() + (timeout or self.TIMEOUT)
+        with self.cond:
+            while id not in self.results:
+                if self.closed:
+                    raise TransportError("%s exited" % ' '.join(self.argv))
+                if time.time() >= deadline:
+                    break
+                self.cond.wait(min(1, max(0, deadline - time.time())))
+            else:
+                return self.results.pop(id)
+        self.kill()
+        raise TransportError("%s: command timed out after %ss" %
+                             (' '.join(self.argv), timeout or self.TIMEOUT))
+
+    def cmd(self, cmd, timeout=None):
+        return self.wait(self.send(cmd), timeout)
+
+    def is_closed(self):
+        with self.cond:
+            return self.closed
+
+    # Marks the transport as closed and kills its shell. The reader thread
+    # ends once the processes started by the shell have closed its output.
+    def kill(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.proc.poll() is None:
+            self.proc.kill()
+
+    # Starts a command in the background. Its output is discarded unless it is
+    # redirected by the command.
+    def cmd_async(self, cmd):
+        self.send("(%s;) > /dev/null 2>&1 &" % cmd, wait=False)
+
+    # Pipelines the commands and returns the (exit code, output) of each
+    def run_batch(self, cmds, timeout=None):
+        ids = [ self.send(cmd) for cmd in cmds ]
+        return [ self.wait(id, timeout) for id in ids ]
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            self.proc.wait()
+        self.reader.join()
+
+
+class LocalTransport(Transport):
+
+    def __init__(self, addr=None):
+        Transport.__init__(self, ['bash'])
+
+
+class SSHTransport(Transport):
+
+    def __init__(self, addr):
+        Transport.__init__(self, ['ssh'] + SSH_OPTS + [addr, 'bash'])
+
+
+TRANSPORTS = {'ssh' : SSHTransport, 'local' : LocalTransport}
+
+def connect(addr, kind='ssh'):
+    return TRANSPORTS[kind](addr)
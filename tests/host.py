@@ -494,7 +494,7 @@ class Host(object):
         return self.cmd_async(cmd)
 
     def start_qfq_monitor(self, dir):
-        cmd = "python %s -i %s > %s/class-stats.txt"
+        cmd = "python %s -i %s -b > %s/class-stats.bin"
         cmd = cmd % (config['CLASS_RATE'], self.get_10g_dev(), dir)
         self.cmd_async(cmd)
 
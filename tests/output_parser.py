@@ -1,45 +1,25 @@
-import re
+import os
+import sys
 from helper import *
 from collections import defaultdict
 
-re_spaces = re.compile(r'\s+')
+# The parser classes are shared with the parsers in plot/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'plot'))
+from StreamingParser import StreamingParser
+from StreamingParser import re_spaces
+import EthstatsParser as plot_ethstats
+
 IFACE = "eth2"
-ZERO = "0.00"
 
-class EthstatsParser:
+class EthstatsParser(plot_ethstats.EthstatsParser):
     def __init__(self, filename, iface=IFACE):
-        self.f = filename
-        self.iface = iface
-        self.lines = open(filename).readlines()
-        self.parse()
-
-    def parse_line(self, line):
-        iface, rest = line.split(":")
-        iface = iface.strip()
-        data = re_spaces.split(rest.strip())
-        return {"iface": iface, "in":data[0], "out":data[3]}
+        plot_ethstats.EthstatsParser.__init__(self, filename, iface)
 
-    def parse(self):
-        ret = dict()
-        util = []
-        for line in self.lines:
-            d = self.parse_line(line)
-            if d["iface"] == self.iface and d["out"] != ZERO:
-                util.append(float(d["out"]))
-        L = len(util)
-        util = util[15:]
-        self.util = util
-        return util
 
-    def summary(self):
-        return dict(mean=mean(self.util), stdev=stdev(self.util))
-
-
-class MPStatParser:
+class MPStatParser(StreamingParser):
     def __init__(self, filename):
-        self.f = filename
-        self.lines = open(filename).readlines()
-        self.parse()
+        StreamingParser.__init__(self, filename, 3)
 
     def parse_line(self, line):
         if "all" not in line:
@@ -52,27 +32,15 @@ class MPStatParser:
         user, sys, sirq = map(float, [user, sys, sirq])
         return user, sys, sirq
 
-    def parse(self):
-        ret = dict(user=[], sys=[], sirq=[])
-        keys = "user sys sirq".split(' ')
-        for line in self.lines:
-            data = self.parse_line(line)
-            if data is None:
-                continue
-            for i,k in enumerate(keys):
-                ret[k].append(data[i])
-        self.usage = ret
-        return ret
-
     def summary(self):
-        muser = mean(self.usage["user"])
-        msys = mean(self.usage["sys"])
-        msirq = mean(self.usage["sirq"])
+        muser = self.mean(0)
+        msys = self.mean(1)
+        msirq = self.mean(2)
         return "user: %.2f, sys: %.2f, sirq: %.2f" % (muser, msys, msirq)
 
     def kernel(self):
-        msys = mean(self.usage["sys"])
-        msirq = mean(self.usage["sirq"])
+        msys = self.mean(1)
+        msirq = self.mean(2)
         return msys + msirq
 
 
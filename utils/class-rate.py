@@ -1,7 +1,12 @@
 
 import argparse
+import array
+from itertools import izip
+import socket
+import struct
 import time
 import subprocess
+import re
 from collections import defaultdict
 import sys
 
@@ -12,32 +17,205 @@ parser.add_argument('-n', '--num-sec',
                     type=float,
                     default=1.0,
                     help="Number of seconds between successive reads.")
+parser.add_argument('-b', '--binary',
+                    action="store_true",
+                    help="Write binary timestamped records instead of text.")
+parser.add_argument('--tc',
+                    action="store_true",
+                    help="Read the class stats by running tc instead of "
+                    "over netlink.")
 
-args = parser.parse_args()
+# Class stats are dumped over rtnetlink with a single RTM_GETTCLASS request
+# per interval, instead of forking tc and parsing its text output. The stats
+# of each class are kept in preallocated arrays indexed by a slot per classid.
+#
+# Binary output starts with MAGIC. Each interval is a record header
+# (timestamp, number of classes n) followed by the columns of the interval:
+# n classids (uint32), and n rates in Mbps, n packets dropped in the interval
+# and n backlogs in bytes (doubles). The columns are written straight from the
+# arrays, so they are little endian on x86 hosts.
+MAGIC = 'CLSRATE1'
+RECORD_HEADER = struct.Struct('<dI')
+
+NETLINK_ROUTE = 0
+RTM_NEWTCLASS = 40
+RTM_GETTCLASS = 42
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 0x2
+NLMSG_DONE = 0x3
+TCA_STATS = 3
+
+NLMSGHDR = struct.Struct('=IHHII')
+TCMSG = struct.Struct('=BxxxiIII')
+RTATTR = struct.Struct('=HH')
+# struct tc_stats: bytes, packets, drops, overlimits, bps, pps, qlen, backlog
+TC_STATS = struct.Struct('=QIIIIIII')
+# Format of a class message that reads, in one unpack, the length, type and
+# sequence number of the nlmsghdr, the handle of the tcmsg, the type of the
+# TCA_STATS attribute, and the bytes, drops and backlog of its tc_stats. The
+# parameter is the number of bytes of attributes before TCA_STATS.
+LAYOUT = '=IH2xI4x' + '8xI8x' + '%dx' + '2xH' + 'Q4xI16xI'
+
+def align(n):
+    return (n + 3) & ~3
+
+def fmt_classid(handle):
+    return "%x:%x" % (handle >> 16, handle & 0xffff)
+
+
+class ClassStats:
+    def __init__(self, iface, bufsize=1 << 20):
+        self.ifindex = int(open('/sys/class/net/%s/ifindex' % iface).read())
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                  NETLINK_ROUTE)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, bufsize)
+        self.sock.bind((0, 0))
+        self.buf = bytearray(bufsize)
+        self.seq = 0
+        # Slot of each classid in the stats arrays
+        self.slots = {}
+        self.classids = array.array('I')
+        self.sent = array.array('d')
+        self.drops = array.array('d')
+        self.backlog = array.array('d')
+        # Layout of the last class message, and its length
+        self.layout = None
+        self.layout_len = None
+
+    def slot(self, handle):
+        slot = self.slots.get(handle)
+        if slot is None:
+            slot = len(self.classids)
+            self.slots[handle] = slot
+            self.classids.append(handle)
+            self.sent.append(0)
+            self.drops.append(0)
+            self.backlog.append(0)
+        return slot
+
+    # Reads the stats of all classes into the arrays
+    def update(self):
+        self.seq += 1
+        req = NLMSGHDR.pack(NLMSGHDR.size + TCMSG.size, RTM_GETTCLASS,
+                            NLM_F_REQUEST | NLM_F_DUMP, self.seq, 0)
+        req += TCMSG.pack(socket.AF_UNSPEC, self.ifindex, 0, 0, 0)
+        self.sock.send(req)
+        buf = self.buf
+        slots = self.slots
+        while True:
+            n = self.sock.recv_into(buf)
+            off = 0
+            while off + NLMSGHDR.size <= n:
+                # Fast path: the message has the same layout as the previous
+                # class message, so it is read with a single unpack
+                layout = self.layout
+                if layout is not None and off + layout.size <= n:
+                    (mlen, mtype, seq, handle, atype,
+                     sent, drops, backlog) = layout.unpack_from(buf, off)
+                    if (mlen == self.layout_len and mtype == RTM_NEWTCLASS and
+                        seq == self.seq and atype == TCA_STATS):
+                        slot = slots.get(handle)
+                        if slot is None:
+                            slot = self.slot(handle)
+                        self.sent[slot] = sent
+                        self.drops[slot] = drops
+                        self.backlog[slot] = backlog
+                        off += align(mlen)
+                        continue
+                (mlen, mtype, flags, seq, pid) = NLMSGHDR.unpack_from(buf, off)
+                if mtype == NLMSG_DONE:
+                    return
+                if mtype == NLMSG_ERROR:
+                    raise OSError("netlink error dumping classes")
+                if seq == self.seq and mtype == RTM_NEWTCLASS:
+                    self.parse_class(off, off + mlen)
+                off += align(mlen)
+
+    # Reads the stats of a class message from its TCA_STATS attribute (struct
+    # tc_stats), and makes the layout of the message the one tried first for
+    # the next message. All classes of a qdisc have the same attributes.
+    def parse_class(self, off, end):
+        stats_off = self.find_stats(off + NLMSGHDR.size, end)
+        if stats_off is None:
+            return
+        layout = struct.Struct(LAYOUT % (stats_off - NLMSGHDR.size -
+                                         TCMSG.size))
+        self.layout = layout
+        self.layout_len = end - off
+        (mlen, mtype, seq, handle, atype,
+         sent, drops, backlog) = layout.unpack_from(self.buf, off)
+        slot = self.slot(handle)
+        self.sent[slot] = sent
+        self.drops[slot] = drops
+        self.backlog[slot] = backlog
+
+    # Returns the offset of the TCA_STATS attribute from the start of the
+    # message, or None if there is no such attribute
+    def find_stats(self, attr, end):
+        off = attr - NLMSGHDR.size
+        attr += TCMSG.size
+        while attr + RTATTR.size <= end:
+            (alen, atype) = RTATTR.unpack_from(self.buf, attr)
+            if alen < RTATTR.size:
+                break
+            if (atype == TCA_STATS and
+                alen >= RTATTR.size + TC_STATS.size):
+                return attr - off
+            attr += align(alen)
+        return None
+
+
+# Some versions of iproute2 print the rate before the backlog
+pat_backlog = re.compile(r'backlog (\S+)')
 
 def tc():
     cmd = "tc -s class show dev %s" % args.iface
     out = subprocess.check_output(cmd.split(' '))
     return out
 
+# Returns a dict mapping each class to a tuple (bytes sent, packets dropped,
+# backlog in bytes)
 def parse(out):
     lines = iter(out.split('\n'))
-    ret = defaultdict(int)
+    ret = defaultdict(lambda: (0, 0, 0))
     for line in lines:
         if line.startswith('class qfq'):
             klass = line.split(' ')[2]
             data = lines.next().strip()
             sent = data.split(' ')[1]
-            ret[klass] = int(sent)
+            dropped = data.split('dropped ')[1].split(',')[0]
+            m = pat_backlog.search(lines.next())
+            backlog = parse_size(m.group(1)) if m else 0
+            ret[klass] = (int(sent), int(dropped), backlog)
     return ret
 
+def parse_size(size):
+    units = {'Kb': 1024, 'Mb': 1024 * 1024}
+    for unit, mult in units.iteritems():
+        if size.endswith(unit):
+            return int(size[:-len(unit)]) * mult
+    return int(size.rstrip('b'))
+
 def rates(old, new, dt):
     rate = defaultdict()
     for k, v in new.iteritems():
-        rate[k] = (v - old[k]) * 1.0 / dt
+        rate[k] = (v[0] - old[k][0]) * 1.0 / dt
     return rate
 
-def main():
+def drops(old, new):
+    ret = defaultdict()
+    for k, v in new.iteritems():
+        ret[k] = v[1] - old[k][1]
+    return ret
+
+# Sleeps until the next multiple of the interval since start, so that the
+# samples do not drift by the time taken to read and print the stats
+def sleep_until_next(start, interval):
+    now = time.time()
+    time.sleep(interval - (now - start) % interval)
+
+def main_tc():
     prev = parse(tc())
     tprev = time.time()
     time.sleep(args.num_sec)
@@ -45,17 +223,62 @@ def main():
         curr = parse(tc())
         tcurr = time.time()
         R = rates(prev, curr, (tcurr - tprev))
+        D = drops(prev, curr)
         prev = curr
+        # Rate (Mbps), packets dropped in the interval and backlog (bytes)
         for k in sorted(R.keys()):
-            print "%s: %.3f" % (k, R[k] * 8.0 / 1e6)
+            print "%s: %.3f %d %d" % (k, R[k] * 8.0 / 1e6, D[k], curr[k][2])
         sys.stdout.flush()
         tprev = time.time()
         time.sleep(args.num_sec)
     return
 
+def main():
+    if args.tc:
+        return main_tc()
+    out = sys.stdout
+    stats = ClassStats(args.iface)
+    stats.update()
+    tprev = time.time()
+    start = tprev
+    prev_sent = array.array('d', stats.sent)
+    prev_drops = array.array('d', stats.drops)
+    if args.binary:
+        out.write(MAGIC)
+    sleep_until_next(start, args.num_sec)
+    while True:
+        stats.update()
+        tcurr = time.time()
+        scale = 8.0 / 1e6 / (tcurr - tprev)
+        n = len(stats.classids)
+        # Classes that appeared in this interval start from zero
+        prev_sent.extend(stats.sent[len(prev_sent):])
+        prev_drops.extend(stats.drops[len(prev_drops):])
+        rates = array.array('d', [ (sent - prev) * scale for (sent, prev)
+                                   in izip(stats.sent, prev_sent) ])
+        drops = array.array('d', [ max(dropped - prev, 0) for (dropped, prev)
+                                   in izip(stats.drops, prev_drops) ])
+        if args.binary:
+            out.write(RECORD_HEADER.pack(tcurr, n))
+            stats.classids.tofile(out)
+            rates.tofile(out)
+            drops.tofile(out)
+            stats.backlog.tofile(out)
+        else:
+            # Rate (Mbps), packets dropped in the interval and backlog (bytes)
+            for i in sorted(xrange(n), key=lambda i: stats.classids[i]):
+                out.write("%s: %.3f %d %d\n" % (
+                    fmt_classid(stats.classids[i]), rates[i], drops[i],
+                    stats.backlog[i]))
+        out.flush()
+        prev_sent = array.array('d', stats.sent)
+        prev_drops = array.array('d', stats.drops)
+        tprev = tcurr
+        sleep_until_next(start, args.num_sec)
+
 if __name__ == "__main__":
+    args = parser.parse_args()
     try:
         main()
     except KeyboardInterrupt:
         sys.exit(0)
-